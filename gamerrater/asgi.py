@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gamerrater.settings')
+# Answer reads with the native async views; set to 0 to use only the ViewSets
+os.environ.setdefault('GAMERRATER_ASYNC_READS', '1')
 
 application = get_asgi_application()
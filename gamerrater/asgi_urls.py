@@ -0,0 +1,10 @@
+"""gamerrater URL Configuration for ASGI
+
+The same routes as gamerrater.urls, with the native async read views from
+gamerraterapi.async_views in front of the ViewSets they answer reads for.
+Selected by GAMERRATER_ASYNC_READS, which gamerrater/asgi.py turns on.
+"""
+from gamerrater.urls import urlpatterns as sync_urlpatterns
+from gamerraterapi.async_views import urlpatterns as async_urlpatterns
+
+urlpatterns = async_urlpatterns + sync_urlpatterns
@@ -48,11 +48,23 @@ INSTALLED_APPS = [
 # THIS IS NEW
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'gamerraterapi.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson-backed JSON, falling back to DRF's encoder when orjson isn't
+    # installed; set GAMERRATER_JSON_RENDERER=stdlib to always use DRF's
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer'
+        if os.environ.get('GAMERRATER_JSON_RENDERER') == 'stdlib'
+        else 'gamerraterapi.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Token buckets per player and endpoint (see gamerraterapi/throttling.py)
+    'DEFAULT_THROTTLE_CLASSES': [
+        'gamerraterapi.throttling.TokenBucketThrottle',
+    ],
 }
 
 # THIS IS NEW
@@ -63,7 +75,13 @@ CORS_ORIGIN_WHITELIST = (
 
 # UPDATE THIS
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware
+    'gamerraterapi.metrics.metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
+    # Before replica routing: applying a player's logged ratings writes to the primary
+    'gamerraterapi.writebehind.pending_writes_middleware',
+    'gamerraterapi.routers.replica_middleware',
+    'gamerraterapi.throttling.rate_limit_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,7 +91,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'gamerrater.urls'
+# Serve reads from the native async views when running under ASGI
+# (see gamerraterapi/async_views.py); gamerrater/asgi.py turns this on
+GAMERRATER_ASYNC_READS = os.environ.get('GAMERRATER_ASYNC_READS', '') == '1'
+
+ROOT_URLCONF = 'gamerrater.asgi_urls' if GAMERRATER_ASYNC_READS else 'gamerrater.urls'
 
 TEMPLATES = [
     {
@@ -97,11 +119,138 @@ WSGI_APPLICATION = 'gamerrater.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default, tuned for concurrent readers and writers by the
+# pragmas in gamerraterapi/database.py. GAMERRATER_DB_ENGINE=postgresql
+# switches to PostgreSQL, configured by the GAMERRATER_DB_* variables.
+
+DB_ENGINE = os.environ.get('GAMERRATER_DB_ENGINE', 'sqlite')
+
+# Seconds a connection is kept open for reuse between requests. Off by
+# default under ASGI, where requests don't keep to one thread; use the
+# PostgreSQL pool there instead
+CONN_MAX_AGE = int(os.environ.get(
+    'GAMERRATER_DB_CONN_MAX_AGE', '0' if GAMERRATER_ASYNC_READS else '60'))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('GAMERRATER_DB_NAME', 'gamerrater'),
+            'USER': os.environ.get('GAMERRATER_DB_USER', ''),
+            'PASSWORD': os.environ.get('GAMERRATER_DB_PASSWORD', ''),
+            'HOST': os.environ.get('GAMERRATER_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('GAMERRATER_DB_PORT', '5432'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    # A psycopg connection pool (needs psycopg[pool]) when a size is given;
+    # the pool replaces persistent connections
+    if os.environ.get('GAMERRATER_DB_POOL_MAX_SIZE'):
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('GAMERRATER_DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ['GAMERRATER_DB_POOL_MAX_SIZE']),
+            'timeout': int(os.environ.get('GAMERRATER_DB_POOL_TIMEOUT', '10')),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('GAMERRATER_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Take the write lock when a transaction starts, so writers
+                # queue on busy_timeout instead of failing with "database
+                # is locked" when a read turns into a write
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+# Read replicas, as a comma separated list of hosts (PostgreSQL) or files
+# (SQLite, kept in sync by an external replication tool), each added as a
+# replicaN alias. Reads made while answering GET requests go to a replica
+# (see gamerraterapi/routers.py)
+DB_REPLICAS = [
+    location for location in os.environ.get('GAMERRATER_DB_REPLICAS', '').split(',')
+    if location
+]
+for index, location in enumerate(DB_REPLICAS, start=1):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'NAME' if DB_ENGINE == 'sqlite' else 'HOST': location,
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        # Tests read the replica through the primary's test database
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_ROUTERS = ['gamerraterapi.routers.ReplicaRouter']
+
+GAMERRATER_DB_ROUTING = {
+    'REPLICAS': [f'replica{index}' for index in range(1, len(DB_REPLICAS) + 1)],
+    # Seconds a player's reads stay on the primary after they write
+    'STICKY_SECONDS': int(os.environ.get('GAMERRATER_DB_STICKY_SECONDS', '5')),
+    'CACHE': 'default',
+}
+
+# Pragmas for new SQLite connections, overriding the defaults in
+# gamerraterapi/database.py
+GAMERRATER_SQLITE_PRAGMAS = {}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Local memory by default; set GAMERRATER_CACHE_DIR to share the cache
+# between worker processes through the file-based backend
+
+if os.environ.get('GAMERRATER_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['GAMERRATER_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'gamerrater',
+        }
+    }
+
+# Cache alias that API responses are stored in (see gamerraterapi/cache.py)
+GAMERRATER_RESPONSE_CACHE = 'default'
+
+# Build list responses from .values() rows instead of ModelSerializers
+# (see gamerraterapi/serialization.py)
+GAMERRATER_VALUES_SERIALIZATION = True
+
+# Token -> (user, player) cache used by the authentication class
+# (see gamerraterapi/authentication.py)
+GAMERRATER_AUTH_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 60,
+    'SHARED_CACHE': 'default' if os.environ.get('GAMERRATER_CACHE_DIR') else None,
+}
+
+# Read and write budgets of each endpoint (see gamerraterapi/throttling.py);
+# ratings and reviews get tighter write budgets by default
+GAMERRATER_THROTTLE = {
+    'RATES': {
+        'read': os.environ.get('GAMERRATER_READ_RATE', '600/min'),
+        'write': os.environ.get('GAMERRATER_WRITE_RATE', '120/min'),
+    },
+    'SHARED_CACHE': 'default' if os.environ.get('GAMERRATER_CACHE_DIR') else None,
+}
+
+# Per-route request metrics served at /metrics (see gamerraterapi/metrics.py)
+GAMERRATER_METRICS = {
+    'SLOW_REQUEST_SECONDS': (float(os.environ['GAMERRATER_SLOW_REQUEST_SECONDS'])
+                             if os.environ.get('GAMERRATER_SLOW_REQUEST_SECONDS') else None),
+    'TOKEN': os.environ.get('GAMERRATER_METRICS_TOKEN') or None,
 }
 
 
@@ -141,6 +290,21 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded pictures and their thumbnails (see gamerraterapi/pictures.py)
+MEDIA_ROOT = os.environ.get('GAMERRATER_MEDIA_ROOT', BASE_DIR / 'media')
+MEDIA_URL = 'media/'
+
+GAMERRATER_PICTURES = {
+    'WORKERS': int(os.environ.get('GAMERRATER_THUMBNAIL_WORKERS', '2')),
+}
+
+# Answer POST /ratings with 202 once the rating is in a local append-only
+# log, applied to the database in batches (see gamerraterapi/writebehind.py)
+GAMERRATER_RATING_LOG = {
+    'ENABLED': os.environ.get('GAMERRATER_RATING_WRITE_BEHIND', '') == '1',
+    'DIRECTORY': os.environ.get('GAMERRATER_RATING_LOG_DIR', BASE_DIR / 'rating-log'),
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -17,9 +17,9 @@ Including another URLconf
 from django.contrib import admin
 from django.conf.urls import include
 from django.urls import path
-from gamerraterapi.views import register_user, login_user
+from gamerraterapi.views import register_user, login_user, picture_thumbnail, metrics_view
 from rest_framework import routers
-from gamerraterapi.views import GameView, CategoryView, GameReviewView, RatingsView
+from gamerraterapi.views import GameView, CategoryView, GameReviewView, RatingsView, PlayerView, PictureView
 from django.conf import settings
 
 router = routers.DefaultRouter(trailing_slash=False)
@@ -27,6 +27,8 @@ router.register(r'games', GameView, 'game')
 router.register(r'categories', CategoryView, 'category')
 router.register(r'reviews', GameReviewView, 'review')
 router.register(r'ratings', RatingsView, 'rating')
+router.register(r'players', PlayerView, 'player')
+router.register(r'pictures', PictureView, 'picture')
 
 
 
@@ -34,6 +36,9 @@ urlpatterns = [
     path('', include(router.urls)),
     path('register', register_user),
     path('login', login_user),
+    path('metrics', metrics_view, name='metrics'),
+    path('thumbnails/<slug:digest>/<slug:size>.<slug:image_format>', picture_thumbnail),
+    path('thumbnails/<slug:digest>/<slug:size>', picture_thumbnail, name='picture-thumbnail'),
     path('api-auth', include('rest_framework.urls', namespace='rest_framework')),
     path('admin/', admin.site.urls),
 ]
\ No newline at end of file
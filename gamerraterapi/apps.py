@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class GamerraterapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gamerraterapi'
+
+    def ready(self):
+        # Connect the receivers that keep derived data in sync, and tune
+        # and instrument new database connections
+        # pylint: disable=import-outside-toplevel,unused-import
+        from gamerraterapi import database, metrics, signals
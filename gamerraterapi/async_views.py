@@ -0,0 +1,263 @@
+"""Native async read endpoints for ASGI deployments
+
+Under ASGI every sync DRF ViewSet call holds a thread-pool slot for the
+whole request. The views here answer GET and HEAD on the list and detail
+routes of games, ratings, reviews and categories on the event loop instead:
+token auth and the response cache are served from memory, and the async ORM
+is awaited only for what's actually missing. A warm cache hit never leaves
+the event loop. Response bodies are the same as the ViewSets'.
+
+Everything else on those routes (writes, ?fields=/?expand= shaping, the
+browsable API) is handed to the ViewSet. Reads take from the same rate
+limit buckets as the ViewSets' (see gamerraterapi.throttling). gamerrater/asgi_urls.py routes
+these views in front of the ViewSets; gamerrater/asgi.py selects it.
+"""
+import math
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseBase
+from django.urls import path
+from django.utils.http import parse_http_date_safe
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+from gamerraterapi import cache, serialization, throttling
+from gamerraterapi.authentication import aauthenticate
+from gamerraterapi.conditional import aget_validators, not_modified, set_validators
+from gamerraterapi.filters import FilterError
+from gamerraterapi.models import Category, Game, Rating, Review
+from gamerraterapi.pagination import PaginationError, alist_response
+from gamerraterapi.serialization import ModelRows
+from gamerraterapi.shaping import Shape
+from gamerraterapi.views import CategoryView, GameReviewView, GameView, RatingsView
+from gamerraterapi.views.category import CategorySerializer, category_dependencies
+from gamerraterapi.views.game import (
+    GameSerializer, GameValuesSerializer, game_dependencies, game_list_queryset)
+from gamerraterapi.views.gamereview import ReviewSerializer, review_dependencies
+from gamerraterapi.views.ratings import (
+    RatingSerializer, RatingValuesSerializer, rating_dependencies)
+
+LIST_ACTIONS = {'get': 'list', 'post': 'create'}
+DETAIL_ACTIONS = {'get': 'retrieve', 'put': 'update', 'delete': 'destroy'}
+
+# Methods each route allows, as the ViewSets report them
+LIST_ALLOW = 'GET, POST, HEAD, OPTIONS'
+DETAIL_ALLOW = 'GET, PUT, DELETE, HEAD, OPTIONS'
+
+
+class NotFound(Exception):
+    """Raised by a read for a row that doesn't exist"""
+
+
+def render(data, status=200, allow=None, headers=None):
+    """An HttpResponse with the body the ViewSets' JSON renderer would produce"""
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+    response = HttpResponse(
+        renderer.render(data), content_type=renderer.media_type, status=status,
+        headers=headers)
+    response['Vary'] = 'Accept'
+    if allow is not None:
+        response['Allow'] = allow
+
+    return response
+
+
+def serves_natively(request):
+    """Whether a request is a plain JSON read the async path can answer"""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if 'text/html' in request.headers.get('Accept', ''):
+        return False
+
+    request.query_params = request.GET
+    return serialization.enabled() and Shape.from_request(request) is None
+
+
+def hybrid(viewset, actions, read, allow):
+    """A view answering reads with the async `read` and anything else with the ViewSet"""
+    sync_view = sync_to_async(viewset.as_view(actions))
+
+    async def view(request, **kwargs):
+        if not serves_natively(request):
+            return await sync_view(request, **kwargs)
+
+        try:
+            if await aauthenticate(request) is None:
+                raise exceptions.NotAuthenticated()
+        except exceptions.APIException as ex:
+            return render({'detail': ex.detail}, ex.status_code,
+                          headers={'WWW-Authenticate': 'Token'})
+
+        limit = throttling.check(request, request.user, viewset.throttle_scope)
+        if limit is not None and not limit.allowed:
+            wait = math.ceil(limit.retry_after)
+            return render({'detail': exceptions.Throttled(wait).detail}, 429, allow,
+                          headers={'Retry-After': str(wait)})
+
+        try:
+            return await read(request, allow=allow, **kwargs)
+        except (FilterError, PaginationError) as ex:
+            return render({'message': str(ex)}, 400, allow)
+        except NotFound as ex:
+            return render({'message': str(ex)}, 404, allow)
+
+    view.csrf_exempt = True
+    return view
+
+
+async def respond(request, resources, dependencies, build, allow, versions=()):
+    """Serve a read from the response cache, answer conditional GETs, or build it
+
+    The async counterpart of stacking @cache_response(*resources) on
+    @conditional(dependencies), or for a list, on @versioned(*versions).
+    Arguments:
+        resources -- Resources the response is built from, or () to skip caching
+        dependencies -- The querysets a single resource is built from, for its
+                        ETag, or None for a list
+        build -- Coroutine function returning the response data or a response
+        versions -- For a list, the resources whose versions give its ETag
+    """
+    streaming = request.query_params.get('stream') in ('1', 'true')
+    use_cache = bool(resources) and not streaming
+    if use_cache:
+        store = cache.get_cache()
+        key = cache.response_key(request, resources)
+        cached = store.get(key)
+        cache.stats.record(hit=cached is not None)
+        if cached is not None:
+            headers = {**cached['headers'], 'X-Cache': 'HIT'}
+            if 'ETag' in headers:
+                response = not_modified(
+                    request, headers['ETag'],
+                    parse_http_date_safe(headers.get('Last-Modified')))
+                if response is not None:
+                    return response
+            return render(cached['data'], allow=allow, headers=headers)
+
+    if dependencies is None:
+        etag, last_modified = cache.list_etag(request, versions), None
+    else:
+        etag, last_modified = await aget_validators(dependencies)
+    if etag is not None:
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+    data = await build()
+    response = data if isinstance(data, HttpResponseBase) else render(data, allow=allow)
+    if response.status_code == 200:
+        if etag is not None:
+            set_validators(response, etag, last_modified)
+        if use_cache and cache.storable():
+            headers = {name: response[name] for name in ('ETag', 'Last-Modified')
+                       if response.has_header(name)}
+            store.set(key, {'data': data, 'headers': headers}, cache.TIMEOUT)
+            response['X-Cache'] = 'MISS'
+
+    return response
+
+
+async def get_or_404(queryset, pk):
+    try:
+        return await queryset.aget(pk=pk)
+    except queryset.model.DoesNotExist as ex:
+        raise NotFound(ex.args[0]) from ex
+
+
+async def list_games(request, allow):
+    async def build():
+        games, sort_keys, default_ordering = game_list_queryset(
+            Game.objects.for_api(), request.query_params, GameView.sort_keys)
+        return await alist_response(
+            request, games, GameValuesSerializer(), sort_keys, default_ordering)
+
+    return await respond(request, ('games', 'categories'), None, build, allow,
+                         versions=('games', 'categories'))
+
+
+async def retrieve_game(request, pk, allow):
+    async def build():
+        game = await get_or_404(Game.objects.for_api(), pk)
+        return GameSerializer(game, context={'request': request}).data
+
+    return await respond(request, ('games', 'categories'), game_dependencies(request, pk),
+                         build, allow)
+
+
+async def list_ratings(request, allow):
+    async def build():
+        ratings = Rating.objects.all()
+        game = request.query_params.get('gameId', None)
+        if game is not None:
+            ratings = ratings.filter(game_id__id=game)
+        return await alist_response(
+            request, ratings, RatingValuesSerializer(), RatingsView.sort_keys)
+
+    return await respond(request, (), None, build, allow, versions=('ratings', 'games'))
+
+
+async def retrieve_rating(request, pk, allow):
+    async def build():
+        rating = await get_or_404(Rating.objects.select_related('game', 'player__user'), pk)
+        return RatingSerializer(rating, context={'request': request}).data
+
+    return await respond(request, (), rating_dependencies(request, pk), build, allow)
+
+
+def review_queryset():
+    return Review.objects.select_related(
+        'game', 'player__user').prefetch_related('game__categories')
+
+
+async def list_reviews(request, allow):
+    async def build():
+        reviews = review_queryset()
+        game = request.query_params.get('gameId', None)
+        if game is not None:
+            reviews = reviews.filter(game_id__id=game)
+        return await alist_response(
+            request, reviews, ModelRows(ReviewSerializer, {'request': request}),
+            GameReviewView.sort_keys)
+
+    return await respond(request, ('reviews', 'games'), None, build, allow,
+                         versions=('reviews', 'games'))
+
+
+async def retrieve_review(request, pk, allow):
+    async def build():
+        review = await get_or_404(review_queryset(), pk)
+        return ReviewSerializer(review, context={'request': request}).data
+
+    return await respond(request, ('reviews', 'games'), review_dependencies(request, pk),
+                         build, allow)
+
+
+async def list_categories(request, allow):
+    async def build():
+        categories = [category async for category in Category.objects.all()]
+        return CategorySerializer(categories, many=True, context={'request': request}).data
+
+    return await respond(request, ('categories',), None, build, allow,
+                         versions=('categories',))
+
+
+async def retrieve_category(request, pk, allow):
+    async def build():
+        category = await get_or_404(Category.objects.all(), pk)
+        return CategorySerializer(category, context={'request': request}).data
+
+    return await respond(request, ('categories',), category_dependencies(request, pk),
+                         build, allow)
+
+
+urlpatterns = [
+    path('games', hybrid(GameView, LIST_ACTIONS, list_games, LIST_ALLOW)),
+    path('games/<int:pk>', hybrid(GameView, DETAIL_ACTIONS, retrieve_game, DETAIL_ALLOW)),
+    path('ratings', hybrid(RatingsView, LIST_ACTIONS, list_ratings, LIST_ALLOW)),
+    path('ratings/<int:pk>',
+         hybrid(RatingsView, DETAIL_ACTIONS, retrieve_rating, DETAIL_ALLOW)),
+    path('reviews', hybrid(GameReviewView, LIST_ACTIONS, list_reviews, LIST_ALLOW)),
+    path('reviews/<int:pk>',
+         hybrid(GameReviewView, DETAIL_ACTIONS, retrieve_review, DETAIL_ALLOW)),
+    path('categories', hybrid(CategoryView, LIST_ACTIONS, list_categories, LIST_ALLOW)),
+    path('categories/<int:pk>',
+         hybrid(CategoryView, DETAIL_ACTIONS, retrieve_category, DETAIL_ALLOW)),
+]
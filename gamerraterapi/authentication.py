@@ -0,0 +1,201 @@
+"""Token authentication that resolves token -> (user, player) from a cache
+
+DRF's TokenAuthentication queries the token and user on every request, and
+the views then queried the player on top of that. CachedTokenAuthentication
+loads all three in one joined query, then keeps the token (with its user
+and player attached) in a bounded in-process LRU with a TTL and, optionally,
+in a shared Django cache so other worker processes can skip the query too.
+
+Deleting a token, or saving a user or player, evicts the affected entries
+(see gamerraterapi.signals). Other processes' LRUs drop them by TTL.
+
+The player is attached to the request as `request.player` (None for users
+without a player, like the admin superuser).
+
+`aauthenticate` is the same check for the native async views, going through
+the same caches and only awaiting the async ORM on a miss.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+DEFAULTS = {
+    'MAX_ENTRIES': 10000,
+    # Seconds an entry is trusted before the token is looked up again
+    'TTL': 60,
+    # Alias of a Django cache shared between processes, or None for local only
+    'SHARED_CACHE': None,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'GAMERRATER_AUTH_CACHE', {}).get(name, DEFAULTS[name])
+
+
+class LRUCache:
+    """Thread safe least-recently-used mapping whose entries expire after a TTL"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+tokens = LRUCache(get_setting('MAX_ENTRIES'), get_setting('TTL'))
+
+
+def shared_cache():
+    alias = get_setting('SHARED_CACHE')
+    return caches[alias] if alias else None
+
+
+def shared_key(key):
+    return f'gamerrater:token:{key}'
+
+
+def forget_tokens(keys):
+    """Evict tokens from the local LRU and the shared cache"""
+    shared = shared_cache()
+    for key in keys:
+        tokens.delete(key)
+        if shared is not None:
+            shared.delete(shared_key(key))
+
+
+def get_token(key):
+    """The token with its user and player loaded, from cache when possible"""
+    token = tokens.get(key)
+    if token is not None:
+        return token
+
+    shared = shared_cache()
+    if shared is not None:
+        token = shared.get(shared_key(key))
+
+    if token is None:
+        try:
+            token = Token.objects.select_related('user__player').get(key=key)
+        except Token.DoesNotExist:
+            return None
+        if shared is not None:
+            shared.set(shared_key(key), token, get_setting('TTL'))
+
+    tokens.set(key, token)
+    return token
+
+
+async def aget_token(key):
+    """get_token for async views"""
+    token = tokens.get(key)
+    if token is not None:
+        return token
+
+    shared = shared_cache()
+    if shared is not None:
+        token = await shared.aget(shared_key(key))
+
+    if token is None:
+        try:
+            token = await Token.objects.select_related('user__player').aget(key=key)
+        except Token.DoesNotExist:
+            return None
+        if shared is not None:
+            await shared.aset(shared_key(key), token, get_setting('TTL'))
+
+    tokens.set(key, token)
+    return token
+
+
+def get_player(user):
+    """The user's player, as loaded with the token, or None"""
+    try:
+        return user.player
+    except user.__class__.player.RelatedObjectDoesNotExist:
+        return None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication backed by the token cache, attaching `request.player`"""
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            request.player = get_player(result[0])
+
+        return result
+
+    def authenticate_credentials(self, key):
+        token = get_token(key)
+        if token is None:
+            raise AuthenticationFailed('Invalid token.')
+
+        if not token.user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+
+        return (token.user, token)
+
+
+async def aauthenticate(request):
+    """Authenticate a plain Django request the way CachedTokenAuthentication does
+
+    Sets `request.user` and `request.player` on success.
+    Returns:
+        tuple -- (user, token), or None if no token was sent
+    Raises:
+        AuthenticationFailed -- For a malformed, unknown or inactive token
+    """
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != CachedTokenAuthentication.keyword.lower().encode():
+        return None
+    if len(auth) != 2:
+        raise AuthenticationFailed('Invalid token header.')
+    try:
+        key = auth[1].decode()
+    except UnicodeError as ex:
+        raise AuthenticationFailed('Invalid token header.') from ex
+
+    token = await aget_token(key)
+    if token is None:
+        raise AuthenticationFailed('Invalid token.')
+    if not token.user.is_active:
+        raise AuthenticationFailed('User inactive or deleted.')
+
+    request.user = token.user
+    request.player = get_player(token.user)
+    return (token.user, token)
@@ -0,0 +1,444 @@
+"""Helpers shared by the benchmark management commands
+
+Benchmarks run against a throwaway test database (created the same way
+`manage.py test` creates one), so they never touch real data.
+
+ENDPOINTS is the API suite bench_api drives: one request per route and
+method the DefaultRouter in gamerrater/urls.py registers, plus /metrics,
+each with the most queries it may run. The test suite runs it too, so a
+change that makes an endpoint chattier fails before it ships, and so does a
+new route without a budget (see unbenchmarked).
+"""
+import io
+import random
+import statistics
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.urls import resolve
+from django.utils import timezone
+from PIL import Image
+from gamerraterapi import cache, feeds, rankings, recommendations, search
+from gamerraterapi.models import (
+    Category, Game, GameCategory, Picture, Player, Rating, Review)
+
+WORDS = (
+    'dragon', 'castle', 'empire', 'harvest', 'galaxy', 'pirate', 'railroad',
+    'wizard', 'kingdom', 'island', 'trade', 'dungeon', 'forest', 'ocean',
+    'mystery', 'zombie', 'garden', 'robot', 'station', 'legend', 'frontier',
+    'carnival', 'volcano', 'shadow', 'crystal', 'temple', 'market', 'storm',
+)
+
+DESIGNERS = ('Hasbro', 'Rosenberg', 'Teuber', 'Knizia', 'Leacock', 'Feld', 'Chvatil')
+
+
+@contextmanager
+def scratch_database(verbosity=0, name=None):
+    """Run the block against a freshly migrated test database
+
+    Arguments:
+        name -- Test database name, e.g. a file for SQLite (which is
+                otherwise in memory), or None for the configured default
+    """
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    if name is not None:
+        test_settings['NAME'] = name
+    connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        test_settings['NAME'] = old_test_name
+
+
+def unthrottled():
+    """Settings turning rate limiting off, for benchmarks sending many
+    requests as one player
+    """
+    return override_settings(GAMERRATER_THROTTLE={'ENABLED': False})
+
+
+def seed_games(count, category_count=20, seed=0, batch_size=5000):
+    """Bulk insert `count` synthetic games, each in one or two categories
+
+    Returns:
+        list -- The created categories
+    """
+    rng = random.Random(seed)
+    categories = Category.objects.bulk_create([
+        Category(label=f'{rng.choice(WORDS).title()} {i}') for i in range(category_count)
+    ])
+
+    for start in range(0, count, batch_size):
+        games = Game.objects.bulk_create([
+            Game(title=' '.join(rng.sample(WORDS, 2)).title(),
+                 description=' '.join(rng.sample(WORDS, 4)),
+                 designer=rng.choice(DESIGNERS),
+                 year_released=rng.randint(1950, 2024),
+                 num_players=rng.randint(1, 8),
+                 gameplay_length=rng.choice((15, 30, 45, 60, 90, 120, 180)),
+                 age=rng.randint(3, 18))
+            for _ in range(start, min(start + batch_size, count))
+        ])
+        GameCategory.objects.bulk_create([
+            GameCategory(game=game, category=category)
+            for game in games
+            for category in rng.sample(categories, rng.randint(1, 2))
+        ])
+
+    # bulk_create sends no signals, so index everything in one pass
+    if search.fts_enabled():
+        with connection.cursor() as cursor:
+            search.rebuild_index(cursor)
+
+    return categories
+
+
+def seed_ratings(count, player_count=1000, seed=0, batch_size=5000):
+    """Bulk insert `player_count` players and `count` ratings of the seeded games
+
+    Every player rates a game at most once; rating aggregates are rebuilt.
+    Returns:
+        list -- The created players
+    """
+    rng = random.Random(seed)
+    users = User.objects.bulk_create([
+        User(username=f'bench{i}', first_name=rng.choice(WORDS).title(),
+             last_name=rng.choice(DESIGNERS), password='!')
+        for i in range(player_count)
+    ])
+    players = Player.objects.bulk_create([Player(user=user, bio='') for user in users])
+
+    game_ids = list(Game.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, count, batch_size):
+        Rating.objects.bulk_create([
+            Rating(game_id=game_ids[i % len(game_ids)],
+                   player=players[i // len(game_ids) % player_count],
+                   rating=rng.randint(1, 10))
+            for i in range(start, min(start + batch_size, count))
+        ])
+    Game.rebuild_rating_aggregates()
+
+    return players
+
+
+def seed_reviews(count, players, seed=0, batch_size=5000):
+    """Bulk insert `count` reviews of the seeded games by these players"""
+    rng = random.Random(seed)
+    game_ids = list(Game.objects.order_by('id').values_list('id', flat=True))
+    now = timezone.now()
+    for start in range(0, count, batch_size):
+        Review.objects.bulk_create([
+            Review(game_id=rng.choice(game_ids), player=rng.choice(players),
+                   review=' '.join(rng.sample(WORDS, 3)),
+                   date=now - timedelta(minutes=rng.randint(0, 525600)))
+            for _ in range(start, min(start + batch_size, count))
+        ])
+
+
+def seed_dataset(games, players, ratings, reviews, pictures=100):
+    """Seed everything the API serves, with derived data built
+
+    seed_ratings has its first players rate every game, so the requests are
+    sent as one more player, who has rated and reviewed a few games and so
+    has something in their feed. Pictures are rows only: their files are
+    never read by the JSON endpoints.
+    Returns:
+        Player -- The player to send requests as
+    """
+    seed_games(games)
+    created = seed_ratings(ratings, player_count=players)
+    seed_reviews(reviews, created)
+
+    user = User.objects.create_user(username='benchmark', password='!')
+    player = Player.objects.create(user=user, bio='')
+    rated = list(Game.objects.order_by('id')[:20])
+    for i, game in enumerate(rated):
+        game.set_rating(player, 1 + i % 10)
+    seed_reviews(len(rated), [player], seed=1)
+
+    game_ids = list(Game.objects.order_by('id').values_list('id', flat=True)[:pictures])
+    Picture.objects.bulk_create([
+        Picture(player=created[i % len(created)], game_id=game_id,
+                image=f'pictures/originals/{i:064x}.jpg', sha256=f'{i:064x}',
+                width=1024, height=768, status=Picture.READY)
+        for i, game_id in enumerate(game_ids)
+    ])
+    rankings.recompute_rankings()
+    recommendations.build_similar_games()
+    feeds.rebuild_affinities()
+    return player
+
+
+def doomed_game(ids):
+    """A game for a DELETE to remove, in a category and rated and reviewed
+    by the suite's player, so the delete cascades like a real one
+
+    Returns:
+        int -- The game's id
+    """
+    game = Game.objects.create(
+        title='Doomed', description='A game', designer='Bench', year_released=2024,
+        num_players=4, gameplay_length=60, age=10)
+    GameCategory.objects.create(game=game, category_id=ids['category'])
+    game.set_rating(Player.objects.get(pk=ids['player']), 5)
+    Review.objects.create(game=game, player_id=ids['player'], review='Doomed',
+                          date=timezone.now())
+    return game.id
+
+
+def popular_game(ids):
+    """A game rated and reviewed by up to 300 seeded players, for a DELETE
+    whose cascade has to cost the same as deleting a game with one rating
+
+    Returns:
+        int -- The game's id
+    """
+    game_id = doomed_game(ids)
+    player_ids = Player.objects.exclude(pk=ids['player']).values_list('id', flat=True)[:300]
+    Rating.objects.bulk_create(
+        [Rating(game_id=game_id, player_id=player_id, rating=7) for player_id in player_ids])
+    Review.objects.bulk_create(
+        [Review(game_id=game_id, player_id=player_id, review='Doomed', date=timezone.now())
+         for player_id in player_ids])
+    return game_id
+
+
+def upload_image():
+    """A small PNG of noise, different on every call so uploads aren't deduplicated"""
+    data = io.BytesIO()
+    Image.effect_noise((64, 48), 40).convert('RGB').save(data, 'PNG')
+    return SimpleUploadedFile('benchmark.png', data.getvalue(), content_type='image/png')
+
+
+# One request of the API suite. `path` and `data` are filled in from the
+# ids of seeded rows (see suite_ids); `budget` is the most queries it may
+# run. `row`, for requests that consume a row, creates one before each
+# request (untimed, and not counted against the budget) for {row} to name.
+# `format` is how the APIClient encodes `data`
+Endpoint = namedtuple('Endpoint', 'name method path data budget row format',
+                      defaults=(None, 'json'))
+
+ENDPOINTS = [
+    Endpoint('games:list', 'get', '/games?limit=20', None, 3),
+    Endpoint('games:filter', 'get',
+             '/games?category={category}&numPlayersMin=2&orderby=-rating&limit=20',
+             None, 2),
+    Endpoint('games:search', 'get', '/games?q=dragon&limit=20', None, 2),
+    Endpoint('games:detail', 'get', '/games/{game}', None, 4),
+    Endpoint('games:top', 'get', '/games/top', None, 2),
+    Endpoint('games:trending', 'get', '/games/trending', None, 2),
+    Endpoint('games:stats', 'get', '/games/{game}/stats', None, 2),
+    Endpoint('games:similar', 'get', '/games/{game}/similar', None, 3),
+    Endpoint('categories:list', 'get', '/categories', None, 1),
+    Endpoint('categories:detail', 'get', '/categories/{category}', None, 2),
+    Endpoint('reviews:list', 'get', '/reviews?gameId={game}&limit=20', None, 2),
+    Endpoint('reviews:detail', 'get', '/reviews/{review}', None, 4),
+    Endpoint('ratings:list', 'get', '/ratings?gameId={game}&limit=20', None, 1),
+    Endpoint('ratings:detail', 'get', '/ratings/{rating}', None, 3),
+    Endpoint('players:feed', 'get', '/players/me/feed', None, 5),
+    Endpoint('pictures:list', 'get', '/pictures?gameId={game}', None, 1),
+    Endpoint('pictures:detail', 'get', '/pictures/{picture}', None, 1),
+    Endpoint('metrics', 'get', '/metrics', None, 0),
+    # Writes last, so the reads above see the seeded data
+    Endpoint('games:create', 'post', '/games', lambda ids: {
+        'title': 'Benchmark', 'description': 'A game', 'designer': 'Bench',
+        'yearReleased': 2024, 'numPlayers': 4, 'gameplayLength': 60, 'age': 10,
+        'categories': [ids['category']]}, 10),
+    Endpoint('games:update', 'put', '/games/{game}', lambda ids: {
+        'title': 'Benchmark', 'description': 'A game', 'designer': 'Bench',
+        'yearReleased': 2024, 'numPlayers': 4, 'gameplayLength': 60, 'age': 10,
+        'categories': [ids['category']]}, 18),
+    Endpoint('categories:create', 'post', '/categories', lambda ids: {'label': 'Benchmark'}, 1),
+    Endpoint('categories:update', 'put', '/categories/{category}',
+             lambda ids: {'label': 'Benchmark'}, 5),
+    Endpoint('reviews:create', 'post', '/reviews', lambda ids: {
+        'review': 'Benchmark', 'date': '2024-01-01T00:00:00Z', 'gameId': ids['game']}, 9),
+    Endpoint('reviews:update', 'put', '/reviews/{review}', lambda ids: {
+        'review': 'Benchmark', 'date': '2024-01-01T00:00:00Z'}, 8),
+    Endpoint('reviews:bulk', 'post', '/reviews/bulk', lambda ids: [
+        {'review': 'Benchmark', 'date': '2024-01-01T00:00:00Z', 'gameId': game_id}
+        for game_id in ids['games']], 10),
+    Endpoint('ratings:create', 'post', '/ratings', lambda ids: {
+        'gameId': ids['game'], 'rating': 7}, 21),
+    Endpoint('ratings:update', 'put', '/ratings/{rating}', lambda ids: {'rating': 6}, 17),
+    Endpoint('ratings:bulk', 'post', '/ratings/bulk', lambda ids: [
+        {'gameId': game_id, 'rating': 5} for game_id in ids['games']], 20),
+    Endpoint('pictures:create', 'post', '/pictures', lambda ids: {
+        'gameId': ids['game'], 'image': upload_image()}, 5, format='multipart'),
+    Endpoint('games:destroy', 'delete', '/games/{row}', None, 21, row=doomed_game),
+    Endpoint('games:destroy-popular', 'delete', '/games/{row}', None, 21, row=popular_game),
+    Endpoint('categories:destroy', 'delete', '/categories/{row}', None, 5,
+             row=lambda ids: Category.objects.create(label='Doomed').id),
+    Endpoint('reviews:destroy', 'delete', '/reviews/{row}', None, 2,
+             row=lambda ids: Review.objects.create(
+                 game_id=ids['game'], player_id=ids['player'], review='Doomed',
+                 date=timezone.now()).id),
+    Endpoint('ratings:destroy', 'delete', '/ratings/{row}', None, 16,
+             row=lambda ids: Rating.objects.get(
+                 game_id=doomed_game(ids), player_id=ids['player']).id),
+]
+
+
+def unbenchmarked():
+    """Router routes and methods ENDPOINTS sends no request to
+
+    Returns:
+        list -- 'METHOD route' of each, e.g. 'DELETE ^games/(?P<pk>[^/.]+)$'
+    """
+    from gamerrater.urls import router
+
+    covered = set()
+    for endpoint in ENDPOINTS:
+        view = resolve(endpoint.path.split('?')[0]).func
+        if hasattr(view, 'actions'):
+            covered.add((view.cls, view.actions[endpoint.method]))
+
+    return [
+        f'{method.upper()} {url.pattern}'
+        for url in router.urls if 'format' not in url.pattern.regex.groupindex
+        for method, action in getattr(url.callback, 'actions', {}).items()
+        if (url.callback.cls, action) not in covered
+    ]
+
+
+def suite_ids(player):
+    """Ids of the seeded rows the suite's requests refer to, chosen so that
+    each request has data to return: a rated game, and rows of `player`
+    """
+    rating = Rating.objects.filter(player=player).order_by('id').first()
+    return {
+        'player': player.id,
+        'game': rating.game_id,
+        'games': list(Game.objects.order_by('id').values_list('id', flat=True)[:100]),
+        'category': Category.objects.order_by('id').values_list('id', flat=True).first(),
+        'review': Review.objects.filter(player=player).order_by('id').values_list(
+            'id', flat=True).first(),
+        'rating': rating.id,
+        'picture': Picture.objects.filter(game_id=rating.game_id).values_list(
+            'id', flat=True).first() or Picture.objects.values_list('id', flat=True).first(),
+    }
+
+
+def run_endpoint(client, endpoint, ids, repeat, warm=False):
+    """Send one endpoint's request `repeat` times
+
+    Arguments:
+        client -- An authenticated APIClient
+        warm -- Leave the response cache alone between requests; by default
+                it's cleared before each, so every request does its full work
+    Returns:
+        dict -- Latency summary, requests_per_s, queries (the most any
+                request ran) and the endpoint's budget
+    Raises:
+        AssertionError -- For a request that doesn't succeed
+    """
+    queries = [0]
+
+    def count(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    samples, most_queries = [], 0
+    for _ in range(repeat):
+        if not warm:
+            cache.get_cache().clear()
+        request_ids = {**ids, 'row': endpoint.row(ids)} if endpoint.row else ids
+        path = endpoint.path.format(**request_ids)
+        data = endpoint.data(request_ids) if endpoint.data else None
+        queries[0] = 0
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            response = getattr(client, endpoint.method)(path, data, format=endpoint.format)
+            samples.append(time.perf_counter() - start)
+        assert response.status_code < 400, (endpoint.name, response.status_code, response.content)
+        most_queries = max(most_queries, queries[0])
+
+    result = summarize(samples)
+    result['requests_per_s'] = round(len(samples) / sum(samples), 1)
+    result['queries'] = most_queries
+    result['budget'] = endpoint.budget
+    return result
+
+
+def run_suite(client, player, repeat, warm=False):
+    """run_endpoint for every endpoint in ENDPOINTS, by endpoint name
+
+    Uploads go to a throwaway MEDIA_ROOT, thumbnailed within the request.
+    """
+    ids = suite_ids(player)
+    with tempfile.TemporaryDirectory() as media, override_settings(
+            MEDIA_ROOT=media, GAMERRATER_PICTURES={'WORKERS': 0},
+            GAMERRATER_METRICS={'TOKEN': None}):
+        return {
+            endpoint.name: run_endpoint(client, endpoint, ids, repeat, warm)
+            for endpoint in ENDPOINTS
+        }
+
+
+def over_budget(results):
+    """Endpoints that ran more queries than their budget allows"""
+    return {
+        name: f'{result["queries"]} queries, budget {result["budget"]}'
+        for name, result in results.items() if result['queries'] > result['budget']
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Each endpoint's p50 and queries against a stored baseline run
+
+    Arguments:
+        tolerance -- Fraction p50 may grow by before it counts as a regression
+    Returns:
+        tuple -- ({name: p50 ratio to the baseline}, {name: regression})
+    """
+    ratios, regressions = {}, {}
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else 1.0
+        ratios[name] = round(ratio, 2)
+        if ratio > 1 + tolerance:
+            regressions[name] = f'p50 {before["p50_ms"]}ms -> {result["p50_ms"]}ms'
+        elif result['queries'] > before['queries']:
+            regressions[name] = f'queries {before["queries"]} -> {result["queries"]}'
+
+    return ratios, regressions
+
+
+def time_calls(func, repeat):
+    """Call `func` `repeat` times, returning each call's duration in seconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+
+    return samples
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary, in milliseconds, of a list of durations in seconds"""
+    return {
+        'calls': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+    }
@@ -0,0 +1,199 @@
+"""Batched ingestion of ratings and reviews for the bulk endpoints
+
+Items are validated a batch at a time: field validation per item, then one
+`IN` query to resolve every game id in the batch. Valid items are written
+with chunked `bulk_create` inside a single transaction. Rating aggregates
+are adjusted by the difference each batch makes, and leaderboard rankings
+and feed affinities are refreshed once per batch rather than once per
+rating.
+Invalid items are skipped and reported by their position in the request.
+"""
+from django.db import transaction
+from rest_framework import serializers, status
+from rest_framework.response import Response
+from gamerraterapi.models import Game, Player, Rating, Review
+from gamerraterapi.feeds import adjust_affinities
+from gamerraterapi.rankings import rating_event, refresh_rankings_on_commit, review_event
+
+# Items validated and written together
+BATCH_SIZE = 1000
+
+# Rows per INSERT statement
+INSERT_CHUNK_SIZE = 500
+
+# Largest request body, in items, the endpoints accept
+MAX_ITEMS = 50000
+
+
+class BulkRatingSerializer(serializers.Serializer):
+    gameId = serializers.IntegerField()
+    rating = serializers.IntegerField(min_value=1, max_value=10)
+    playerId = serializers.IntegerField(required=False)
+
+
+class BulkReviewSerializer(serializers.Serializer):
+    gameId = serializers.IntegerField()
+    review = serializers.CharField(max_length=50)
+    date = serializers.DateTimeField()
+    playerId = serializers.IntegerField(required=False)
+
+
+def batches(items):
+    for start in range(0, len(items), BATCH_SIZE):
+        yield start, items[start:start + BATCH_SIZE]
+
+
+def validate_batch(start, batch, serializer_class, player, may_act_for_others):
+    """Validate a batch of raw items
+
+    Returns:
+        tuple -- (list of validated items, list of error dicts)
+    """
+    valid = []
+    errors = []
+    for index, item in enumerate(batch, start=start):
+        serializer = serializer_class(data=item)
+        if not serializer.is_valid():
+            errors.append({'index': index, 'errors': serializer.errors})
+            continue
+
+        data = serializer.validated_data
+        if 'playerId' in data and not may_act_for_others:
+            errors.append({'index': index, 'errors': {
+                'playerId': ['Only staff may submit on behalf of other players.']}})
+            continue
+
+        if 'playerId' not in data:
+            if player is None:
+                errors.append({'index': index, 'errors': {
+                    'playerId': ['This account has no player to submit as.']}})
+                continue
+            data['playerId'] = player.id
+        valid.append((index, data))
+
+    # Resolve every referenced game and player with one query each
+    game_ids = set(Game.objects.filter(
+        pk__in={data['gameId'] for _, data in valid}).values_list('id', flat=True))
+    player_ids = set(Player.objects.filter(
+        pk__in={data['playerId'] for _, data in valid}).values_list('id', flat=True))
+
+    resolved = []
+    for index, data in valid:
+        if data['gameId'] not in game_ids:
+            errors.append({'index': index, 'errors': {'gameId': ['Game does not exist.']}})
+        elif data['playerId'] not in player_ids:
+            errors.append({'index': index, 'errors': {'playerId': ['Player does not exist.']}})
+        else:
+            resolved.append(data)
+
+    errors.sort(key=lambda error: error['index'])
+    return resolved, errors
+
+
+def import_ratings(items, player, may_act_for_others=False):
+    """Create or replace ratings in bulk
+
+    A player's rating of a game replaces any earlier one, including earlier
+    items in the same request.
+    Returns:
+        dict -- Counts of created and updated ratings, and per-item errors
+    """
+    summary = {'created': 0, 'updated': 0, 'errors': []}
+    with transaction.atomic():
+        for start, batch in batches(items):
+            resolved, errors = validate_batch(
+                start, batch, BulkRatingSerializer, player, may_act_for_others)
+            summary['errors'].extend(errors)
+
+            # The last rating for a (game, player) pair wins
+            latest = {(data['gameId'], data['playerId']): data['rating'] for data in resolved}
+            if not latest:
+                continue
+
+            updated = upsert_ratings(latest)
+            summary['updated'] += updated
+            summary['created'] += len(latest) - updated
+
+    return summary
+
+
+def upsert_ratings(latest):
+    """Write ratings, replacing earlier ones, and refresh what's derived from them
+
+    Call inside a transaction; rankings refresh once it commits.
+    Arguments:
+        latest -- (game id, player id) -> rating, for existing games and players
+    Returns:
+        int -- How many of the ratings replaced an earlier one
+    """
+    game_ids = {game_id for game_id, _ in latest}
+    # The values being replaced, so the aggregates can be adjusted by the difference
+    existing = {
+        (game_id, player_id): rating
+        for game_id, player_id, rating in Rating.objects.select_for_update().filter(
+            game_id__in=game_ids,
+            player_id__in={player_id for _, player_id in latest}
+        ).values_list('game_id', 'player_id', 'rating')}
+
+    ratings = Rating.objects.bulk_create(
+        [Rating(game_id=game_id, player_id=player_id, rating=rating)
+         for (game_id, player_id), rating in latest.items()],
+        batch_size=INSERT_CHUNK_SIZE,
+        update_conflicts=True,
+        unique_fields=['game', 'player'],
+        update_fields=['rating', 'updated_at'])
+    Game.apply_rating_changes(
+        (game_id, existing.get((game_id, player_id)), rating)
+        for (game_id, player_id), rating in latest.items())
+    refresh_rankings_on_commit(game_ids, [rating_event(rating) for rating in ratings])
+    adjust_affinities(
+        (player_id, game_id, existing.get((game_id, player_id)), rating)
+        for (game_id, player_id), rating in latest.items())
+
+    return len(existing.keys() & latest.keys())
+
+
+def import_reviews(items, player, may_act_for_others=False):
+    """Create reviews in bulk
+
+    Returns:
+        dict -- Count of created reviews, and per-item errors
+    """
+    summary = {'created': 0, 'errors': []}
+    with transaction.atomic():
+        for start, batch in batches(items):
+            resolved, errors = validate_batch(
+                start, batch, BulkReviewSerializer, player, may_act_for_others)
+            summary['errors'].extend(errors)
+
+            reviews = Review.objects.bulk_create(
+                [Review(game_id=data['gameId'], player_id=data['playerId'],
+                        review=data['review'], date=data['date'])
+                 for data in resolved],
+                batch_size=INSERT_CHUNK_SIZE)
+            refresh_rankings_on_commit({data['gameId'] for data in resolved},
+                                       [review_event(review) for review in reviews])
+            summary['created'] += len(resolved)
+
+    return summary
+
+
+def bulk_response(request, importer):
+    """Run a bulk import for a request whose body is a JSON array or NDJSON
+
+    Returns:
+        Response -- 201 with the import summary if anything was written,
+                    otherwise 400
+    """
+    items = request.data
+    if not isinstance(items, list):
+        return Response({'message': 'Expected a JSON array or NDJSON body'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > MAX_ITEMS:
+        return Response({'message': f'At most {MAX_ITEMS} items per request'},
+                        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    summary = importer(items, request.player, may_act_for_others=request.user.is_staff)
+    written = summary['created'] + summary.get('updated', 0)
+    return Response(
+        summary, status=status.HTTP_201_CREATED if written else status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,224 @@
+"""Versioned response cache for the read-heavy endpoints
+
+Every cached response is keyed by the request path, its query params and the
+current version of each resource the response is built from (games,
+categories, reviews, ...). A write bumps the versions of the resources it
+touches, so every response built from the old data simply stops being looked
+up; nothing has to be deleted and stale entries age out of the cache on
+their own.
+
+The same versions give list responses their ETags (see `versioned`), so a
+conditional GET of a list is answered without touching the database.
+
+Works with any Django cache backend that supports `incr`, including the
+local-memory and file-based backends configured in settings.
+"""
+import hashlib
+import threading
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import parse_http_date_safe, quote_etag
+from rest_framework.response import Response
+from gamerraterapi import routers
+from gamerraterapi.conditional import not_modified, set_validators
+
+KEY_PREFIX = 'gamerrater'
+
+# Seconds a cached response lives; versioning keeps it fresh in the meantime
+TIMEOUT = 300
+
+# When any resource was last bumped
+BUMPED_AT_KEY = f'{KEY_PREFIX}:bumped_at'
+
+
+class CacheStats:
+    """Thread safe hit and miss counters for this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    """The cache backend responses are stored in"""
+    return caches[getattr(settings, 'GAMERRATER_RESPONSE_CACHE', 'default')]
+
+
+def version_key(resource):
+    return f'{KEY_PREFIX}:version:{resource}'
+
+
+def get_versions(resources):
+    """Current version of each resource, starting unseen ones at a fresh value
+
+    A version that fell out of the cache restarts at the current time rather
+    than at 0, so it can never land back on a version an old entry was
+    stored under.
+    """
+    cache = get_cache()
+    keys = [version_key(resource) for resource in resources]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+
+    return [versions[key] for key in keys]
+
+
+def bump(*resources):
+    """Invalidate every cached response built from these resources"""
+    cache = get_cache()
+    for resource in resources:
+        try:
+            cache.incr(version_key(resource))
+        except ValueError:
+            cache.set(version_key(resource), time.time_ns(), None)
+    cache.set(BUMPED_AT_KEY, time.time(), None)
+
+
+def storable():
+    """Whether a response just built may be cached
+
+    Not when it was read from a replica that may not have caught up with
+    the latest write yet (see gamerraterapi.routers).
+    """
+    if routers.current_replica() is None:
+        return True
+
+    bumped_at = get_cache().get(BUMPED_AT_KEY)
+    return bumped_at is None or time.time() - bumped_at >= routers.get_setting('STICKY_SECONDS')
+
+
+def request_digest(request, resources):
+    """Digest of a GET request's path and query, and the current versions
+    of the resources its response is built from
+    """
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values)
+    versions = get_versions(resources)
+    digest = hashlib.md5(
+        repr((request.path, params, versions)).encode(), usedforsecurity=False)
+    return digest.hexdigest()
+
+
+def response_key(request, resources):
+    """Cache key for a GET request to an endpoint built from these resources"""
+    return f'{KEY_PREFIX}:response:{request_digest(request, resources)}'
+
+
+def list_etag(request, resources):
+    """The ETag of a list built from these resources, or None to send none
+
+    Any write to a resource bumps its version and so changes the ETag; a
+    version that fell out of the cache restarts at a new value, which only
+    costs clients a full response. None when the list is read from a replica
+    that may not have the latest write yet (see `storable`), since the
+    current versions would vouch for its stale rows.
+    """
+    if not storable():
+        return None
+    return quote_etag(request_digest(request, resources))
+
+
+def cache_response(*resources):
+    """Decorate a ViewSet read method to serve its response from the cache
+
+    Arguments:
+        resources -- Names of the resources the response is built from
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.query_params.get('stream') in ('1', 'true'):
+                return method(view, request, *args, **kwargs)
+
+            cache = get_cache()
+            key = response_key(request, resources)
+            cached = cache.get(key)
+            if cached is not None:
+                stats.record(hit=True)
+                headers = {**cached['headers'], 'X-Cache': 'HIT'}
+                if 'ETag' in headers:
+                    # Conditional GETs are answered from the stored validators
+                    response = not_modified(
+                        request, headers['ETag'],
+                        parse_http_date_safe(headers.get('Last-Modified')))
+                    if response is not None:
+                        return response
+
+                return Response(cached['data'], headers=headers)
+
+            stats.record(hit=False)
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200 and hasattr(response, 'data') and storable():
+                headers = {name: response[name] for name in ('ETag', 'Last-Modified')
+                           if response.has_header(name)}
+                cache.set(key, {'data': response.data, 'headers': headers}, TIMEOUT)
+                response['X-Cache'] = 'MISS'
+
+            return response
+        return wrapper
+    return decorator
+
+
+def versioned(*resources):
+    """Decorate a ViewSet list method to answer conditional GETs with 304,
+    with an ETag from these resources' versions instead of from their rows
+
+    Arguments:
+        resources -- Names of the resources the response is built from
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            etag = list_etag(request, resources)
+            if etag is not None:
+                response = not_modified(request, etag, None)
+                if response is not None:
+                    return response
+
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200 and etag is not None:
+                set_validators(response, etag, None)
+
+            return response
+        return wrapper
+    return decorator
+
+
+def invalidates(*resources):
+    """Decorate a ViewSet write method to bump these resources when it succeeds
+
+    Arguments:
+        resources -- Names of the resources the write changes
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            response = method(view, request, *args, **kwargs)
+            if response.status_code < 400:
+                bump(*resources)
+
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,95 @@
+"""ETag / Last-Modified support for conditional GET requests
+
+A single resource's validators are derived from the rows it is built from,
+without building it: for each queryset the response depends on, one
+aggregate query fetches the newest `updated_at` and the row count. Any
+insert, update or delete in those rows changes the pair, and so the ETag.
+
+Lists get their ETags from the response cache's resource versions instead
+(see gamerraterapi.cache.versioned): aggregating a whole table on every
+request would cost more than the page a 304 saves. Lists send no
+Last-Modified either, since their newest `updated_at` stays the same when
+one of their rows is deleted.
+"""
+import hashlib
+from functools import wraps
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def get_validators(querysets):
+    """Compute a strong ETag and Last-Modified timestamp for some querysets
+
+    Arguments:
+        querysets -- The rows a response is built from; each needs `updated_at`
+    Returns:
+        tuple -- (quoted ETag, Last-Modified as seconds since the epoch or None)
+    """
+    return make_validators([
+        (queryset, queryset.order_by().aggregate(latest=Max('updated_at'), count=Count('id')))
+        for queryset in querysets])
+
+
+async def aget_validators(querysets):
+    """get_validators for async views, aggregating with the async ORM"""
+    return make_validators([
+        (queryset, await queryset.order_by().aaggregate(
+            latest=Max('updated_at'), count=Count('id')))
+        for queryset in querysets])
+
+
+def make_validators(aggregates):
+    """The ETag and Last-Modified for (queryset, aggregate) pairs"""
+    fingerprint = []
+    last_modified = None
+    for queryset, aggregate in aggregates:
+        fingerprint.append((
+            queryset.model._meta.label,
+            aggregate['latest'].isoformat() if aggregate['latest'] else None,
+            aggregate['count']))
+        if aggregate['latest'] is not None:
+            timestamp = int(aggregate['latest'].timestamp())
+            last_modified = max(last_modified or timestamp, timestamp)
+
+    digest = hashlib.sha1(repr(fingerprint).encode(), usedforsecurity=False)
+    return quote_etag(digest.hexdigest()), last_modified
+
+
+def not_modified(request, etag, last_modified):
+    """The 304 (or 412) response for these validators, or None to respond in full"""
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    """Add the ETag and Last-Modified headers to a response"""
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+
+    return response
+
+
+def conditional(dependencies):
+    """Decorate a ViewSet retrieve method to answer conditional GETs with 304
+
+    Arguments:
+        dependencies -- Called with the request and `pk`, returns the
+                        querysets the response is built from
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            etag, last_modified = get_validators(
+                dependencies(request, *args, **kwargs))
+            response = not_modified(request, etag, last_modified)
+            if response is not None:
+                return response
+
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                set_validators(response, etag, last_modified)
+
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,46 @@
+"""SQLite connection tuning
+
+SQLite's defaults suit a single process: a rollback journal, so a writer
+blocks every reader while it commits, and a full fsync on every commit.
+Every new SQLite connection gets these pragmas instead:
+
+    journal_mode=WAL      -- readers keep reading while a writer commits
+    synchronous=NORMAL    -- fsync at checkpoints, not every commit (safe with WAL)
+    busy_timeout=5000     -- wait up to 5s for a lock instead of failing
+    mmap_size=256MB       -- read pages through a memory map
+    cache_size=-20000     -- 20MB page cache per connection
+    temp_store=MEMORY     -- sorts and temporary indexes in memory
+
+GAMERRATER_SQLITE_PRAGMAS overrides any of them; a value of None leaves
+SQLite's default. journal_mode is stored in the database file, so it
+outlives the connection that set it.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULTS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,
+    'temp_store': 'memory',
+}
+
+
+def sqlite_pragmas():
+    """The pragmas applied to new SQLite connections, in order"""
+    overrides = getattr(settings, 'GAMERRATER_SQLITE_PRAGMAS', {})
+    pragmas = {**DEFAULTS, **overrides}
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+
+    # Straight to the driver, so the pragmas don't show up as queries
+    for name, value in sqlite_pragmas().items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,257 @@
+"""Personalized game feeds
+
+A player's affinity for a category is how much they rate its games above
+(or below) their own average rating, shrunk towards 0 while they've rated
+only a few of them:
+
+    affinity(category) = (sum - count * player_mean) / (count + PRIOR_WEIGHT)
+
+Their feed ranks the games they haven't rated by the average affinity of
+each game's categories plus POPULARITY_WEIGHT times its Bayesian score
+from the top-rated leaderboard, so a new player's feed is the leaderboard.
+Only candidates are scored: the CANDIDATES best-ranked games they haven't
+rated, plus the CANDIDATES best-ranked of those in their TOP_CATEGORIES
+favourite categories, so a feed costs two index walks and a bounded sort
+rather than scoring every game in the catalog. Every unrated game is scored
+only when the candidates can't fill the feed.
+
+The per-category sums and counts behind the affinities are stored in
+PlayerAffinity, computed from all of a player's ratings for their first
+feed and then adjusted by each rating they write or delete, in the same
+transaction (see gamerraterapi.signals): a write costs the same however
+many games the player has rated. Ranked feeds are kept in a
+bounded in-process LRU cache, keyed by player and checked against when the
+player's affinity was last computed, so a rating anywhere shows up in the
+player's next feed; changes in popularity show up within TTL seconds.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Avg, Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from gamerraterapi.authentication import LRUCache
+from gamerraterapi.models import Game, GameCategory, GameRanking, PlayerAffinity, Rating
+
+DEFAULTS = {
+    # Imaginary average ratings every category affinity starts from
+    'PRIOR_WEIGHT': 3,
+    # Weight of a game's Bayesian score against the player's affinity
+    'POPULARITY_WEIGHT': 0.5,
+    # Games ranked, and cached, per feed
+    'FEED_SIZE': 100,
+    # Games taken from the leaderboard, and from the player's favourite
+    # categories, to be scored; never fewer than FEED_SIZE
+    'CANDIDATES': 500,
+    # Categories with the highest positive affinity that candidates come from
+    'TOP_CATEGORIES': 5,
+    'MAX_ENTRIES': 10000,
+    # Seconds a ranked feed is reused while the player's ratings don't change
+    'TTL': 60,
+}
+
+# Players written per upsert
+CHUNK_SIZE = 2000
+
+
+def get_setting(name):
+    return getattr(settings, 'GAMERRATER_FEEDS', {}).get(name, DEFAULTS[name])
+
+
+# Player id -> (affinity computed_at, [(game id, score)])
+feeds = LRUCache(get_setting('MAX_ENTRIES'), get_setting('TTL'))
+
+
+def player_totals(ratings):
+    """Per-player affinity rows for a queryset of ratings
+
+    Returns:
+        dict -- Player id -> {'categories', 'rating_sum', 'rating_count'}
+    """
+    totals = defaultdict(lambda: {'categories': {}, 'rating_sum': 0, 'rating_count': 0})
+    for row in ratings.values('player_id').annotate(
+            total=Sum('rating'), count=Count('id')).order_by():
+        totals[row['player_id']]['rating_sum'] = row['total']
+        totals[row['player_id']]['rating_count'] = row['count']
+
+    rows = ratings.filter(game__gamecategory__isnull=False).values(
+        'player_id', 'game__gamecategory__category_id').annotate(
+            total=Sum('rating'), count=Count('id')).order_by()
+    for row in rows:
+        category_id = str(row['game__gamecategory__category_id'])
+        totals[row['player_id']]['categories'][category_id] = [row['total'], row['count']]
+
+    return totals
+
+
+def save_affinities(player_ids, totals, now):
+    return PlayerAffinity.objects.bulk_create(
+        [PlayerAffinity(player_id=player_id, computed_at=now,
+                        **totals.get(player_id, {'categories': {}}))
+         for player_id in player_ids],
+        batch_size=CHUNK_SIZE,
+        update_conflicts=True,
+        unique_fields=['player'],
+        update_fields=['categories', 'rating_sum', 'rating_count', 'computed_at'])
+
+
+def refresh_affinities(player_ids):
+    """Recompute these players' affinities from their ratings
+
+    Returns:
+        dict -- Player id -> their saved PlayerAffinity
+    """
+    player_ids = sorted(set(player_ids))
+    if not player_ids:
+        return {}
+
+    # Read the ratings from the database the affinities are written to, not
+    # from a replica a GET may be routed to, which can lag behind it
+    using = router.db_for_write(PlayerAffinity)
+    totals = player_totals(Rating.objects.using(using).filter(player_id__in=player_ids))
+    with transaction.atomic(using=using):
+        affinities = save_affinities(player_ids, totals, timezone.now())
+
+    return {affinity.player_id: affinity for affinity in affinities}
+
+
+def adjust_affinities(changes):
+    """Apply rating changes to the stored affinities of the players who made them
+
+    Players with no affinity yet are left to their first feed to compute.
+    Arguments:
+        changes -- (player id, game id, removed value or None, added value or None)
+                   of each rating written or deleted
+    """
+    changes = [change for change in changes if change[2] != change[3]]
+    if not changes:
+        return
+
+    game_categories = defaultdict(list)
+    for game_id, category_id in GameCategory.objects.filter(
+            game_id__in={game_id for _, game_id, _, _ in changes}).values_list(
+                'game_id', 'category_id'):
+        game_categories[game_id].append(str(category_id))
+
+    now = timezone.now()
+    with transaction.atomic():
+        affinities = {
+            affinity.player_id: affinity for affinity in PlayerAffinity.objects.select_for_update()
+            .filter(player_id__in={player_id for player_id, _, _, _ in changes})}
+        for player_id, game_id, removed, added in changes:
+            affinity = affinities.get(player_id)
+            if affinity is None:
+                continue
+
+            for value, sign in ((removed, -1), (added, 1)):
+                if value is None:
+                    continue
+                affinity.rating_sum += sign * value
+                affinity.rating_count += sign
+                for category_id in game_categories[game_id]:
+                    total, count = affinity.categories.get(category_id, (0, 0))
+                    if count + sign:
+                        affinity.categories[category_id] = [total + sign * value, count + sign]
+                    else:
+                        # As player_totals leaves out categories with no ratings
+                        affinity.categories.pop(category_id, None)
+            affinity.computed_at = now
+
+        PlayerAffinity.objects.bulk_update(
+            affinities.values(), ['categories', 'rating_sum', 'rating_count', 'computed_at'],
+            batch_size=CHUNK_SIZE)
+
+
+def refresh_affinities_on_commit(player_ids):
+    """Refresh these players once the current transaction commits"""
+    player_ids = set(player_ids)
+    transaction.on_commit(lambda: refresh_affinities(player_ids))
+
+
+def rebuild_affinities():
+    """Recompute the affinities of every player who has rated a game
+
+    Returns:
+        int -- The number of players updated
+    """
+    totals = player_totals(Rating.objects.all())
+    player_ids = sorted(totals)
+    now = timezone.now()
+    with transaction.atomic():
+        for start in range(0, len(player_ids), CHUNK_SIZE):
+            save_affinities(player_ids[start:start + CHUNK_SIZE], totals, now)
+
+    return len(player_ids)
+
+
+def category_weights(affinity):
+    """Category id -> affinity, for the categories the player has rated"""
+    if not affinity.rating_count:
+        return {}
+
+    mean = affinity.rating_sum / affinity.rating_count
+    prior = get_setting('PRIOR_WEIGHT')
+    return {
+        int(category_id): (total - count * mean) / (count + prior)
+        for category_id, (total, count) in affinity.categories.items()
+    }
+
+
+def rank_feed(player, affinity):
+    """The player's top FEED_SIZE unrated games, as [(game id, score)]"""
+    weights = {
+        category_id: weight
+        for category_id, weight in category_weights(affinity).items() if weight
+    }
+    if weights:
+        game_affinity = Coalesce(Avg(Case(
+            *[When(gamecategory__category_id=category_id, then=Value(weight))
+              for category_id, weight in weights.items()],
+            default=Value(0.0), output_field=FloatField())), Value(0.0))
+    else:
+        game_affinity = Value(0.0)
+
+    size = get_setting('FEED_SIZE')
+    limit = max(get_setting('CANDIDATES'), size)
+    rated = Rating.objects.filter(player=player).values('game_id')
+    candidates = Q(pk__in=GameRanking.objects.exclude(game_id__in=rated).order_by(
+        '-bayesian_score', 'game_id').values('game_id')[:limit])
+    favourites = sorted((category_id for category_id, weight in weights.items() if weight > 0),
+                        key=weights.get, reverse=True)[:get_setting('TOP_CATEGORIES')]
+    if favourites:
+        # Unranked games, added since rankings were last computed, go last
+        candidates |= Q(pk__in=GameCategory.objects.filter(category_id__in=favourites).exclude(
+            game_id__in=rated).order_by(
+                F('game__ranking__bayesian_score').desc(nulls_last=True), 'game_id'
+            ).values('game_id')[:limit])
+
+    popularity = Coalesce(F('ranking__bayesian_score'), Value(0.0))
+
+    def score(games):
+        return list(games.annotate(
+            score=game_affinity + get_setting('POPULARITY_WEIGHT') * popularity
+        ).order_by('-score', 'id').values_list('id', 'score')[:size])
+
+    ranked = score(Game.objects.filter(candidates))
+    if len(ranked) < size:
+        # Too few ranked games to fill the feed: a small catalog, or one
+        # whose rankings haven't been computed yet
+        ranked = score(Game.objects.exclude(pk__in=rated))
+    return ranked
+
+
+def get_feed(player):
+    """The player's ranked feed, from the cache when their ratings haven't changed"""
+    affinity = PlayerAffinity.objects.filter(player=player).first()
+    if affinity is None:
+        # First feed since the player's affinity began being tracked; use the
+        # row just written, which a replica may not have yet
+        affinity = refresh_affinities([player.pk])[player.pk]
+
+    cached = feeds.get(player.pk)
+    if cached is not None and cached[0] == affinity.computed_at:
+        return cached[1]
+
+    ranked = rank_feed(player, affinity)
+    feeds.set(player.pk, (affinity.computed_at, ranked))
+    return ranked
@@ -0,0 +1,67 @@
+"""Query param filters for the games list, applied in SQL
+
+    /games?category=3&category=5            -- in any of these categories
+    /games?category=3,5                     -- same as above
+    /games?numPlayersMin=2&numPlayersMax=4
+    /games?yearReleasedMin=1990&yearReleasedMax=1999
+    /games?gameplayLengthMin=30&gameplayLengthMax=60
+    /games?age=10                           -- suitable for a 10 year old
+    /games?minRating=7.5                    -- average rating of at least 7.5
+
+Filters combine with AND, and with `q`, `orderby` and the pagination params.
+Every filtered column is indexed on the games table; the category filter
+runs as a subquery against the (category, game) index on the link table.
+"""
+from gamerraterapi.models import GameCategory
+
+# Query param -> (lookup, value type)
+GAME_FILTERS = {
+    'numPlayersMin': ('num_players__gte', int),
+    'numPlayersMax': ('num_players__lte', int),
+    'yearReleasedMin': ('year_released__gte', int),
+    'yearReleasedMax': ('year_released__lte', int),
+    'gameplayLengthMin': ('gameplay_length__gte', int),
+    'gameplayLengthMax': ('gameplay_length__lte', int),
+    'age': ('age__lte', int),
+    'minRating': ('rating_average__gte', float),
+}
+
+
+class FilterError(ValueError):
+    """Raised for a filter query param that can't be parsed"""
+
+
+def parse(name, value, kind):
+    try:
+        return kind(value)
+    except ValueError as ex:
+        kind_name = 'an integer' if kind is int else 'a number'
+        raise FilterError(f'{name} must be {kind_name}') from ex
+
+
+def filter_games(queryset, params):
+    """Apply the filter query params to a games queryset
+
+    Arguments:
+        queryset -- Games to filter
+        params -- The request's query params
+    Returns:
+        QuerySet -- The filtered games
+    """
+    lookups = {}
+    for name, (lookup, kind) in GAME_FILTERS.items():
+        value = params.get(name)
+        if value not in (None, ''):
+            lookups[lookup] = parse(name, value, kind)
+
+    categories = [
+        parse('category', value, int)
+        for values in params.getlist('category')
+        for value in values.split(',') if value]
+    if categories:
+        # A subquery rather than a join, so games in several of the
+        # categories aren't repeated and no DISTINCT is needed
+        lookups['pk__in'] = GameCategory.objects.filter(
+            category_id__in=categories).values('game_id')
+
+    return queryset.filter(**lookups)
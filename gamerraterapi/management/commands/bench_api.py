@@ -0,0 +1,78 @@
+"""Management command benchmarking every REST API endpoint against query budgets and a baseline"""
+import json
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from gamerraterapi import benchmarks
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR, 'benchmarks', 'baseline.json')
+
+
+class Command(BaseCommand):
+    help = ('Seed a synthetic dataset and drive every API endpoint in-process, '
+            'reporting throughput, p50/p99 latency and queries per request as JSON. '
+            'Fails when a route has no benchmark, when an endpoint exceeds its query '
+            'budget, or with --strict when it regressed against the baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=5000,
+                            help='Games to seed (default: 5000)')
+        parser.add_argument('--players', type=int, default=500,
+                            help='Players to seed (default: 500)')
+        parser.add_argument('--ratings', type=int, default=50000,
+                            help='Ratings to seed (default: 50000)')
+        parser.add_argument('--reviews', type=int, default=20000,
+                            help='Reviews to seed (default: 20000)')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Requests per endpoint (default: 50)')
+        parser.add_argument('--warm', action='store_true',
+                            help="Don't clear the response cache between requests")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE),
+                            help=f'Baseline results to compare with (default: {DEFAULT_BASELINE})')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Write these results to --baseline instead of comparing')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Fraction p50 may grow over the baseline (default: 0.5)')
+        parser.add_argument('--strict', action='store_true',
+                            help='Fail on regressions against the baseline too')
+
+    def handle(self, *args, **options):
+        if options['ratings'] > options['games'] * options['players']:
+            raise CommandError('--ratings must be at most --games times --players')
+        missing = benchmarks.unbenchmarked()
+        if missing:
+            raise CommandError(f'Routes without a benchmark and query budget: {missing}')
+
+        with override_settings(ALLOWED_HOSTS=['testserver']), benchmarks.unthrottled(), \
+                benchmarks.scratch_database():
+            self.stdout.write(
+                f'Seeding {options["games"]} games, {options["players"]} players, '
+                f'{options["ratings"]} ratings and {options["reviews"]} reviews...')
+            player = benchmarks.seed_dataset(
+                options['games'], options['players'], options['ratings'], options['reviews'])
+            client = APIClient()
+            client.credentials(
+                HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=player.user).key}')
+
+            self.stdout.write(f'Sending {options["requests"]} requests per endpoint...')
+            results = benchmarks.run_suite(client, player, options['requests'], options['warm'])
+
+        report = {'endpoints': results, 'over_budget': benchmarks.over_budget(results)}
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2) + '\n')
+            self.stdout.write(f'Saved the baseline to {baseline_path}')
+        elif baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text())
+            report['p50_vs_baseline'], report['regressions'] = benchmarks.compare(
+                results, baseline, options['tolerance'])
+
+        self.stdout.write(json.dumps(report, indent=2))
+        if report['over_budget']:
+            raise CommandError(f'Query budgets exceeded: {report["over_budget"]}')
+        if options['strict'] and report.get('regressions'):
+            raise CommandError(f'Regressions against the baseline: {report["regressions"]}')
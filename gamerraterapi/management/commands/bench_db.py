@@ -0,0 +1,142 @@
+"""Management command comparing concurrent read/write throughput of SQLite configurations"""
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.test import override_settings
+from gamerraterapi import benchmarks, database, writebehind
+from gamerraterapi.models import Game
+from gamerraterapi.views.game import GameValuesSerializer
+
+# Label -> (pragmas, transaction mode, write-behind). `defaults` is SQLite
+# and Django out of the box: rollback journal, full fsync, deferred
+# transactions. `write_behind` is `tuned` with ratings appended to the
+# write-behind log and drained by a worker thread
+MODES = {
+    'defaults': (dict.fromkeys(database.DEFAULTS), None, False),
+    'tuned': ({}, 'IMMEDIATE', False),
+    'write_behind': ({}, 'IMMEDIATE', True),
+}
+
+
+class Command(BaseCommand):
+    help = ('Benchmark concurrent reads of the games list against concurrent '
+            'ratings on a file-backed SQLite database, with default SQLite settings '
+            'and with the tuned ones, with and without the write-behind rating log')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=2000,
+                            help='Games to seed (default: 2000)')
+        parser.add_argument('--ratings', type=int, default=20000,
+                            help='Ratings to seed (default: 20000)')
+        parser.add_argument('--readers', type=int, default=8,
+                            help='Threads reading the games list (default: 8)')
+        parser.add_argument('--writers', type=int, default=4,
+                            help='Threads rating games (default: 4)')
+        parser.add_argument('--seconds', type=float, default=5,
+                            help='Duration of each measurement (default: 5)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('bench_db measures SQLite configurations')
+
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for label, (pragmas, transaction_mode, write_behind) in MODES.items():
+                self.stdout.write(f'Measuring {label}...')
+                options_dict = connection.settings_dict['OPTIONS']
+                old_mode = options_dict.get('transaction_mode')
+                options_dict['transaction_mode'] = transaction_mode
+                try:
+                    rating_log = {'ENABLED': write_behind, 'WORKER': False,
+                                  'DIRECTORY': str(Path(directory, f'{label}-log'))}
+                    with override_settings(GAMERRATER_SQLITE_PRAGMAS=pragmas,
+                                           GAMERRATER_RATING_LOG=rating_log), \
+                            benchmarks.scratch_database(name=str(Path(directory, f'{label}.db'))):
+                        benchmarks.seed_games(options['games'])
+                        players = benchmarks.seed_ratings(
+                            options['ratings'], player_count=max(1, options['ratings'] // 20))
+                        results[label] = self.measure(players, options, write_behind)
+                finally:
+                    options_dict['transaction_mode'] = old_mode
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def measure(self, players, options, write_behind=False):
+        """Run readers and writers together for the configured duration"""
+        games = list(Game.objects.only('id'))
+        serializer = GameValuesSerializer()
+        stop = threading.Event()
+        samples = {'read': [], 'write': []}
+        errors = {'read': 0, 'write': 0}
+        lock = threading.Lock()
+
+        def read(rng):
+            queryset = Game.objects.for_api().order_by('-rating_average', 'id')[:20]
+            serializer.serialize(serializer.values(queryset))
+
+        def write(rng):
+            if write_behind:
+                writebehind.append(rng.choice(games).id, rng.choice(players).id, rng.randint(1, 10))
+            else:
+                rng.choice(games).set_rating(rng.choice(players), rng.randint(1, 10))
+
+        def drain():
+            try:
+                writebehind.run_worker(stop)
+            finally:
+                connection.close()
+
+        def worker(kind, func, seed):
+            rng = random.Random(seed)
+            timings, failures = [], 0
+            try:
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        func(rng)
+                    except OperationalError:
+                        # "database is locked": the lock wait timed out, or a
+                        # deferred transaction couldn't upgrade to a write
+                        failures += 1
+                        continue
+                    timings.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+            with lock:
+                samples[kind].extend(timings)
+                errors[kind] += failures
+
+        threads = [
+            threading.Thread(target=worker, args=('read', read, i))
+            for i in range(options['readers'])
+        ] + [
+            threading.Thread(target=worker, args=('write', write, 1000 + i))
+            for i in range(options['writers'])
+        ]
+        if write_behind:
+            threads.append(threading.Thread(target=drain))
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        result = {}
+        for kind in ('read', 'write'):
+            summary = benchmarks.summarize(samples[kind]) if samples[kind] else {'calls': 0}
+            summary['per_s'] = round(len(samples[kind]) / options['seconds'])
+            summary['errors'] = errors[kind]
+            result[kind] = summary
+
+        if write_behind:
+            # Ratings logged but not yet applied when the writers stopped
+            start = time.perf_counter()
+            result['write']['backlog'] = writebehind.drain_all()
+            result['write']['backlog_drain_s'] = round(time.perf_counter() - start, 3)
+        return result
@@ -0,0 +1,124 @@
+"""Management command measuring picture upload latency and thumbnail throughput"""
+import io
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.core.management.base import BaseCommand
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from gamerraterapi import benchmarks, pictures
+from gamerraterapi.models import Game, Picture, Player
+
+
+def make_image(seed, size):
+    """A distinct photo-like JPEG; noise compresses about as badly as a photo"""
+    image = Image.effect_noise(size, 40).convert('RGB')
+    image.putpixel((0, 0), (seed % 256, seed // 256 % 256, seed // 65536 % 256))
+    data = io.BytesIO()
+    image.save(data, 'JPEG', quality=90)
+    return data.getvalue()
+
+
+class Command(BaseCommand):
+    help = ('Benchmark picture uploads with thumbnails made in the request and '
+            'in the background pool, re-uploads of the same image, and thumbnail '
+            'throughput with one worker and with --workers')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploads', type=int, default=30,
+                            help='Pictures uploaded per measurement (default: 30)')
+        parser.add_argument('--width', type=int, default=2400,
+                            help='Width of the uploaded images (default: 2400)')
+        parser.add_argument('--height', type=int, default=1600,
+                            help='Height of the uploaded images (default: 1600)')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Thumbnailing threads to compare with one (default: 4)')
+
+    def handle(self, *args, **options):
+        size = (options['width'], options['height'])
+        self.stdout.write(f'Generating {options["uploads"] * 3} images...')
+        images = [make_image(seed, size) for seed in range(options['uploads'] * 3)]
+        batches = [images[i::3] for i in range(3)]
+
+        results = {}
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(ALLOWED_HOSTS=['testserver']), benchmarks.unthrottled(), \
+                benchmarks.scratch_database(name=str(Path(directory, 'pictures.db'))):
+            benchmarks.seed_games(1)
+            client = self.client()
+
+            for label, workers, batch in (('upload_inline', 0, batches[0]),
+                                          ('upload_background', options['workers'], batches[1])):
+                self.stdout.write(f'Measuring {label}...')
+                with self.media(directory, label, workers):
+                    results[label] = self.measure_uploads(client, batch)
+            self.stdout.write('Measuring upload_duplicate...')
+            with self.media(directory, 'upload_duplicate', options['workers']):
+                self.measure_uploads(client, batches[0][:1])
+                results['upload_duplicate'] = self.measure_uploads(
+                    client, batches[0][:1] * len(batches[0]))
+                results['upload_duplicate']['originals_stored'] = len(
+                    list(Path(directory, 'upload_duplicate').rglob('originals/*/*')))
+
+            for workers in sorted({1, options['workers']}):
+                label = f'thumbnails_{workers}_workers'
+                self.stdout.write(f'Measuring {label}...')
+                with self.media(directory, label, workers):
+                    results[label] = self.measure_thumbnails(batches[2], workers)
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def client(self):
+        user = User.objects.create_user(username='photographer', password='!')
+        Player.objects.create(user=user, bio='')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        return client
+
+    def media(self, directory, label, workers):
+        return override_settings(MEDIA_ROOT=str(Path(directory, label)),
+                                 GAMERRATER_PICTURES={'WORKERS': workers})
+
+    def measure_uploads(self, client, images):
+        """Time each upload's request; background thumbnails are waited for after"""
+        game = Game.objects.first()
+        samples = []
+        for i, data in enumerate(images):
+            upload = SimpleUploadedFile(f'{i}.jpg', data, content_type='image/jpeg')
+            start = time.perf_counter()
+            response = client.post(
+                '/pictures', {'gameId': game.id, 'image': upload}, format='multipart')
+            samples.append(time.perf_counter() - start)
+            assert response.status_code == 201, response.content
+
+        start = time.perf_counter()
+        pictures.shutdown()
+        result = benchmarks.summarize(samples)
+        result['drain_s'] = round(time.perf_counter() - start, 3)
+        result['ready'] = Picture.objects.filter(status=Picture.READY).count()
+        Picture.objects.all().delete()
+        return result
+
+    def measure_thumbnails(self, images, workers):
+        """Thumbnail already stored originals on a pool of `workers` threads"""
+        stored = []
+        for i, data in enumerate(images):
+            name, digest, _, _ = pictures.store_original(
+                SimpleUploadedFile(f'{i}.jpg', data, content_type='image/jpeg'))
+            stored.append((digest, name))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda item: pictures.make_thumbnails(*item), stored))
+        elapsed = time.perf_counter() - start
+        return {
+            'images': len(stored),
+            'seconds': round(elapsed, 3),
+            'images_per_s': round(len(stored) / elapsed, 2),
+        }
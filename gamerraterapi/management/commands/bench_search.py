@@ -0,0 +1,43 @@
+"""Management command comparing FTS5 game search with the naive __contains filter"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from gamerraterapi import benchmarks, search
+from gamerraterapi.models import Game
+
+
+class Command(BaseCommand):
+    help = 'Benchmark indexed full-text game search against __icontains filtering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=100000,
+                            help='Number of synthetic games to seed (default: 100000)')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Times to run each query (default: 20)')
+
+    def handle(self, *args, **options):
+        with benchmarks.scratch_database():
+            if not search.fts_enabled():
+                raise CommandError('The search index needs an SQLite database')
+
+            self.stdout.write(f"Seeding {options['games']} games...")
+            benchmarks.seed_games(options['games'])
+
+            results = {}
+            for term in ('dragon', 'castle harvest', 'rob', 'knizia'):
+                def naive(term=term):
+                    return list(Game.objects.filter(
+                        search.contains_filter(term)).distinct().values_list('id', flat=True))
+
+                def indexed(term=term):
+                    return list(search.search_games(Game.objects.all(), term).order_by(
+                        'search_rank', 'id').values_list('id', flat=True))
+
+                results[term] = {
+                    'naive_contains': benchmarks.summarize(
+                        benchmarks.time_calls(naive, options['repeat'])),
+                    'fts5': benchmarks.summarize(
+                        benchmarks.time_calls(indexed, options['repeat'])),
+                    'matches': {'naive_contains': len(naive()), 'fts5': len(indexed())},
+                }
+
+        self.stdout.write(json.dumps(results, indent=2))
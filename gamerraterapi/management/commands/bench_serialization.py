@@ -0,0 +1,71 @@
+"""Management command comparing ModelSerializer and values-based list serialization"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from gamerraterapi import benchmarks
+from gamerraterapi.models import Game, Rating
+from gamerraterapi.renderers import ORJSONRenderer
+from gamerraterapi.views.game import GameSerializer, GameValuesSerializer
+from gamerraterapi.views.ratings import RatingSerializer, RatingValuesSerializer
+
+
+class Command(BaseCommand):
+    help = ('Benchmark serialize+render throughput of the games and ratings lists: '
+            'ModelSerializer against values rows, with the stdlib and orjson renderers')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='List sizes to measure (default: 1000 10000 100000)')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Times to serialize each list (default: 3)')
+
+    def handle(self, *args, **options):
+        largest = max(options['rows'])
+        with benchmarks.scratch_database():
+            self.stdout.write(f'Seeding {largest} games and ratings...')
+            benchmarks.seed_games(largest)
+            benchmarks.seed_ratings(largest)
+
+            lists = {
+                'games': (Game.objects.for_api(), GameSerializer, GameValuesSerializer()),
+                'ratings': (Rating.objects.select_related('game', 'player__user'),
+                            RatingSerializer, RatingValuesSerializer()),
+            }
+            results = {}
+            for name, (queryset, serializer_class, values_serializer) in lists.items():
+                for rows in options['rows']:
+                    self.stdout.write(f'Measuring {rows} {name}...')
+                    results[f'{name}:{rows}'] = self.measure(
+                        queryset.order_by('id')[:rows], serializer_class,
+                        values_serializer, options['repeat'])
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def measure(self, queryset, serializer_class, values_serializer, repeat):
+        """Time serializing and rendering rows already fetched from the database"""
+        instances = list(queryset)
+        rows = list(values_serializer.values(queryset))
+        stdlib, fast = JSONRenderer(), ORJSONRenderer()
+
+        def model_serializer():
+            return stdlib.render(serializer_class(instances, many=True).data)
+
+        def values_stdlib():
+            return stdlib.render(values_serializer.serialize(rows))
+
+        def values_orjson():
+            return fast.render(values_serializer.serialize(rows))
+
+        expected = model_serializer()
+        if values_stdlib() != expected or values_orjson() != expected:
+            raise CommandError('The values path rendered different JSON')
+
+        result = {'bytes': len(expected)}
+        for label, func in (('model_serializer', model_serializer),
+                            ('values_stdlib', values_stdlib),
+                            ('values_orjson', values_orjson)):
+            summary = benchmarks.summarize(benchmarks.time_calls(func, repeat))
+            summary['rows_per_s'] = round(len(rows) / (summary['mean_ms'] / 1000))
+            result[label] = summary
+
+        return result
@@ -0,0 +1,21 @@
+"""Management command for building the similar games recommendations"""
+import time
+from django.core.management.base import BaseCommand
+from gamerraterapi import cache, recommendations
+
+
+class Command(BaseCommand):
+    help = ('Compute every rated game\'s most similar games from the ratings; run '
+            'periodically, with --incremental between full builds')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only recompute games rated since the last build')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        built = recommendations.build_similar_games(incremental=options['incremental'])
+        cache.bump('similar')
+        self.stdout.write(self.style.SUCCESS(
+            f'Built similar games for {built} games with the {recommendations.engine()} '
+            f'engine in {time.perf_counter() - started:.1f}s'))
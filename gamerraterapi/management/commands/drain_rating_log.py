@@ -0,0 +1,22 @@
+"""Management command for applying the write-behind rating log to the database"""
+from django.core.management.base import BaseCommand
+from gamerraterapi import writebehind
+
+
+class Command(BaseCommand):
+    help = ('Apply ratings from the write-behind log (see gamerraterapi/writebehind.py) '
+            'in batches, as a dedicated worker, or once with --once; run --once after '
+            'turning write-behind off so no logged rating is left behind')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Apply every complete record and exit')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            applied = writebehind.drain_all()
+            self.stdout.write(self.style.SUCCESS(f'Applied {applied} logged ratings'))
+            return
+
+        self.stdout.write(f'Draining {writebehind.directory()}...')
+        writebehind.run_worker()
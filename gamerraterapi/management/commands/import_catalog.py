@@ -0,0 +1,206 @@
+"""Management command for bulk loading a catalog from CSV or NDJSON files
+
+    python manage.py import_catalog --users users.csv --players players.csv \\
+        --categories categories.ndjson --games games.ndjson \\
+        --game-categories game_categories.csv --ratings ratings.csv \\
+        --reviews reviews.ndjson
+
+Files are streamed and inserted with batched bulk_create, in dependency order.
+The format is picked by extension: .csv (with a header row) or .ndjson/.jsonl.
+Columns are the model field names, with foreign keys given as `<name>_id`:
+
+    users            id, username, first_name, last_name, email, password
+    players          id, user_id, bio
+    categories       id, label
+    games            id, title, description, designer, year_released,
+                     num_players, gameplay_length, age
+    game_categories  game_id, category_id
+    ratings          game_id, player_id, rating
+    reviews          game_id, player_id, review, date
+
+User passwords must already be Django password hashes; users without one get
+an unusable password. The whole load is one transaction: if any file fails,
+nothing from this run is kept. On SQLite, non-unique indexes on the loaded
+tables are dropped during the load and rebuilt at the end of the same
+transaction (SQLite DDL is transactional, so a failed or interrupted load
+gets them back on rollback), and write-speed pragmas are applied for the
+duration. Derived data (rating aggregates, rankings, the search index) is
+rebuilt once everything is loaded.
+"""
+import csv
+import json
+import time
+from pathlib import Path
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from gamerraterapi import cache, feeds, rankings, search
+from gamerraterapi.models import Category, Game, GameCategory, Player, Rating, Review
+
+# (option name, model, accepted columns), in load order
+ENTITIES = (
+    ('users', User, ('id', 'username', 'first_name', 'last_name', 'email', 'password')),
+    ('players', Player, ('id', 'user_id', 'bio')),
+    ('categories', Category, ('id', 'label')),
+    ('games', Game, ('id', 'title', 'description', 'designer', 'year_released',
+                     'num_players', 'gameplay_length', 'age')),
+    ('game_categories', GameCategory, ('game_id', 'category_id')),
+    ('ratings', Rating, ('game_id', 'player_id', 'rating')),
+    ('reviews', Review, ('game_id', 'player_id', 'review', 'date')),
+)
+
+# Pragmas applied while loading into SQLite. Durability is traded for speed:
+# a crash mid-load can lose the load, so rerun it from scratch.
+LOAD_PRAGMAS = {
+    'synchronous': 'OFF',
+    'temp_store': 'MEMORY',
+    'cache_size': '-262144',
+}
+
+
+def read_rows(path):
+    """Yield each row of a CSV or NDJSON file as a dict"""
+    suffix = Path(path).suffix.lower()
+    with open(path, newline='', encoding='utf-8') as source:
+        if suffix == '.csv':
+            yield from csv.DictReader(source)
+        elif suffix in ('.ndjson', '.jsonl'):
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise CommandError(f'{path}: expected a .csv, .ndjson or .jsonl file')
+
+
+class Command(BaseCommand):
+    help = 'Bulk load users, players, games, categories, ratings and reviews from CSV/NDJSON'
+
+    def add_arguments(self, parser):
+        for name, _, _ in ENTITIES:
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name, metavar='FILE')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per bulk insert (default: 5000)')
+
+    def handle(self, *args, **options):
+        files = [(name, model, columns, options[name])
+                 for name, model, columns in ENTITIES if options[name]]
+        if not files:
+            raise CommandError('Nothing to load; pass at least one file')
+
+        sqlite = connection.vendor == 'sqlite'
+        tables = [model._meta.db_table for _, model, _, _ in files]
+        started = time.perf_counter()
+
+        # Pragmas like synchronous can't change inside a transaction
+        tune = sqlite and not connection.in_atomic_block
+        previous_pragmas = self.apply_pragmas(LOAD_PRAGMAS) if tune else {}
+        try:
+            with transaction.atomic():
+                deferred_indexes = self.drop_indexes(tables) if sqlite else []
+                for name, model, columns, path in files:
+                    self.load(name, model, columns, path, options['batch_size'])
+                self.rebuild_indexes(deferred_indexes)
+        finally:
+            self.apply_pragmas(previous_pragmas)
+
+        self.rebuild_derived_data([model for _, model, _, _ in files])
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded in {time.perf_counter() - started:.1f}s'))
+
+    def load(self, name, model, columns, path, batch_size):
+        """Stream one file into its table with batched bulk_create"""
+        start = last_report = time.perf_counter()
+        loaded = 0
+        batch = []
+
+        self.stdout.write(f'Loading {name} from {path}')
+        for row in read_rows(path):
+            fields = {column: row[column] for column in columns
+                      if row.get(column) not in (None, '')}
+            if model is User and 'password' not in fields:
+                fields['password'] = '!'
+            batch.append(model(**fields))
+            if len(batch) < batch_size:
+                continue
+
+            model.objects.bulk_create(batch)
+            loaded += len(batch)
+            batch = []
+            if time.perf_counter() - last_report >= 1:
+                last_report = time.perf_counter()
+                self.stdout.write(
+                    f'  {name}: {loaded:,} rows '
+                    f'({loaded / (last_report - start):,.0f} rows/s)')
+
+        model.objects.bulk_create(batch)
+        loaded += len(batch)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'  {name}: {loaded:,} rows in {elapsed:.1f}s '
+            f'({loaded / max(elapsed, 1e-9):,.0f} rows/s)')
+
+    def apply_pragmas(self, pragmas):
+        """Set SQLite pragmas, returning their previous values"""
+        previous = {}
+        with connection.cursor() as cursor:
+            for pragma, value in pragmas.items():
+                cursor.execute(f'PRAGMA {pragma}')
+                previous[pragma] = cursor.fetchone()[0]
+                cursor.execute(f'PRAGMA {pragma} = {value}')
+
+        return previous
+
+    def drop_indexes(self, tables):
+        """Drop the non-unique indexes on these tables, returning their SQL
+
+        Unique indexes stay so the load still rejects duplicates.
+        """
+        placeholders = ', '.join(['%s'] * len(tables))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+                f"AND tbl_name IN ({placeholders}) AND sql IS NOT NULL "
+                "AND sql NOT LIKE 'CREATE UNIQUE%%'", tables)
+            indexes = cursor.fetchall()
+            for name, _ in indexes:
+                cursor.execute(f'DROP INDEX "{name}"')
+
+        self.stdout.write(f'Deferred {len(indexes)} indexes until after the load')
+        return [sql for _, sql in indexes]
+
+    def rebuild_indexes(self, statements):
+        if not statements:
+            return
+
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+        self.stdout.write(
+            f'Rebuilt {len(statements)} indexes in {time.perf_counter() - start:.1f}s')
+
+    def rebuild_derived_data(self, models):
+        """Bring sequences, aggregates, the search index and caches up to date"""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
+            if search.fts_enabled() and {Game, Category, GameCategory}.intersection(models):
+                search.rebuild_index(cursor)
+                self.stdout.write('Rebuilt the search index')
+
+        if {Game, Rating}.intersection(models):
+            rebuilt = Game.rebuild_rating_aggregates()
+            self.stdout.write(f'Rebuilt rating aggregates for {rebuilt:,} games')
+
+        if {Game, Rating, Review}.intersection(models):
+            ranked = rankings.recompute_rankings()
+            self.stdout.write(f'Recomputed rankings for {ranked:,} games')
+
+        if {Rating, GameCategory}.intersection(models):
+            updated = feeds.rebuild_affinities()
+            self.stdout.write(f'Rebuilt feed affinities for {updated:,} players')
+
+        cache.bump('games', 'categories', 'ratings', 'reviews')
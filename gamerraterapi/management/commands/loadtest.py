@@ -0,0 +1,143 @@
+"""Management command load testing the ASGI application, ViewSets against async reads"""
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlencode
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from gamerraterapi import benchmarks, cache
+from gamerraterapi.models import Game, Player
+
+# Label -> URL configuration serving the reads
+URLCONFS = {
+    'viewsets': 'gamerrater.urls',
+    'async': 'gamerrater.asgi_urls',
+}
+
+HOST = 'localhost'
+
+
+class Command(BaseCommand):
+    help = ('Load test the read endpoints through the ASGI application at several '
+            'concurrency levels, with the sync ViewSets and with the native async views')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', type=int, default=10000,
+                            help='Games to seed (default: 10000)')
+        parser.add_argument('--ratings', type=int, default=50000,
+                            help='Ratings to seed (default: 50000)')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50, 100],
+                            help='Concurrent clients to measure (default: 1 10 50 100)')
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Requests per measurement (default: 2000)')
+
+    def handle(self, *args, **options):
+        with benchmarks.scratch_database():
+            self.stdout.write(f"Seeding {options['games']} games and {options['ratings']} ratings...")
+            benchmarks.seed_games(options['games'])
+            benchmarks.seed_ratings(options['ratings'])
+            user = User.objects.create_user(username='loadtest', password='!')
+            Player.objects.create(user=user, bio='')
+            token = Token.objects.create(user=user)
+            game_ids = list(Game.objects.values_list('id', flat=True))
+
+            application = get_asgi_application()
+            results = {}
+            for label, urlconf in URLCONFS.items():
+                for concurrency in options['concurrency']:
+                    self.stdout.write(f'Measuring {label} with {concurrency} clients...')
+                    cache.get_cache().clear()
+                    requests = workload(options['requests'], game_ids)
+                    with override_settings(ROOT_URLCONF=urlconf, DEBUG=False,
+                                           ALLOWED_HOSTS=[HOST]), benchmarks.unthrottled():
+                        results[f'{label}:{concurrency}'] = asyncio.run(
+                            run(application, requests, concurrency, token.key))
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+
+def workload(count, game_ids, seed=0):
+    """A mix of list and detail reads, the same for every measurement
+
+    Front pages are hot in the response cache; detail reads and filtered
+    lists spread over the whole catalog, so most of them miss.
+    """
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        game = rng.choice(game_ids)
+        requests.append(rng.choice((
+            ('/games', {'limit': 20}),
+            ('/games', {'limit': 20, 'orderby': '-rating'}),
+            (f'/games/{game}', {}),
+            ('/ratings', {'gameId': game}),
+            ('/reviews', {'gameId': game}),
+        )))
+
+    return requests
+
+
+async def run(application, requests, concurrency, token):
+    """Send every request with `concurrency` clients, returning a latency summary"""
+    pending = iter(requests)
+    samples = []
+
+    async def client():
+        for path, params in pending:
+            start = time.perf_counter()
+            status = await get(application, path, params, token)
+            samples.append(time.perf_counter() - start)
+            if status != 200:
+                raise CommandError(f'GET {path}?{urlencode(params)} returned {status}')
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    summary = benchmarks.summarize(samples)
+    summary['requests_per_s'] = round(len(samples) / elapsed)
+    return summary
+
+
+async def get(application, path, params, token):
+    """Send one GET straight to the ASGI application, returning the status code"""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': urlencode(params).encode(),
+        'root_path': '',
+        'headers': [
+            (b'host', HOST.encode()),
+            (b'authorization', f'Token {token}'.encode()),
+            (b'accept', b'application/json'),
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': (HOST, 80),
+    }
+    received = False
+    status = None
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client never disconnects; wait until the handler stops listening
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await application(scope, receive, send)
+    return status
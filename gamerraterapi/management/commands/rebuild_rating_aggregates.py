@@ -0,0 +1,18 @@
+"""Management command for rebuilding the stored rating aggregates on games"""
+from django.core.management.base import BaseCommand
+from gamerraterapi.models import Game
+
+
+class Command(BaseCommand):
+    help = 'Recompute rating count, sum and histogram for every game from the ratings table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'game_ids', nargs='*', type=int,
+            help='Only rebuild these games (default: all games)')
+
+    def handle(self, *args, **options):
+        game_ids = options['game_ids'] or None
+        rebuilt = Game.rebuild_rating_aggregates(game_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt rating aggregates for {rebuilt} games'))
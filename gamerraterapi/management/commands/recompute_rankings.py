@@ -0,0 +1,13 @@
+"""Management command for recomputing the top-rated and trending leaderboards"""
+from django.core.management.base import BaseCommand
+from gamerraterapi import cache, rankings
+
+
+class Command(BaseCommand):
+    help = ('Recompute every game\'s Bayesian and trending scores; run periodically '
+            'so the global mean and the trending window stay current')
+
+    def handle(self, *args, **options):
+        ranked = rankings.recompute_rankings()
+        cache.bump('games')
+        self.stdout.write(self.style.SUCCESS(f'Recomputed rankings for {ranked} games'))
@@ -0,0 +1,296 @@
+"""Per-route request metrics, exposed in Prometheus text format at /metrics
+
+`metrics_middleware` records, for each route (the URL name, e.g.
+`game-list`) and method:
+
+    gamerrater_requests_total                 -- requests handled
+    gamerrater_request_errors_total           -- of which answered with a 5xx
+    gamerrater_request_duration_seconds       -- latency histogram
+    gamerrater_request_db_queries             -- SQL queries per request, histogram
+    gamerrater_request_db_seconds_total       -- time spent in SQL
+    gamerrater_response_bytes_total           -- response body size
+
+and, for the whole process, `gamerrater_response_cache_lookups_total` with
+a `result` label of `hit` or `miss` (see gamerraterapi/cache.py).
+
+Queries are counted by a database execute wrapper every connection gets
+when it's created (see `instrument_connection`); it adds the query to
+whichever request is current in a ContextVar, so queries that async views
+run through sync_to_async land on the right request, and queries outside
+requests cost one ContextVar lookup. Each request then takes one lock to
+add its numbers to the totals.
+
+With SLOW_REQUEST_SECONDS set, requests taking at least that long are
+logged to the `gamerraterapi.metrics` logger with their SLOW_QUERIES
+slowest queries. Metrics are kept per process; scrape every worker.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.decorators import sync_and_async_middleware
+from gamerraterapi import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Upper bounds of the latency histogram's buckets, in seconds
+    'DURATION_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    # Upper bounds of the queries-per-request histogram's buckets
+    'QUERY_BUCKETS': (0, 1, 2, 5, 10, 20, 50, 100),
+    # Seconds at which a request is logged as slow; None to log none
+    'SLOW_REQUEST_SECONDS': None,
+    # Slowest queries logged with a slow request
+    'SLOW_QUERIES': 5,
+    # Bearer token /metrics requires; None to serve it to anyone
+    'TOKEN': None,
+}
+
+# Characters of each query's SQL in the slow request log
+SQL_LOG_LENGTH = 500
+
+# Route label of requests no URL pattern matched
+UNMATCHED = 'unmatched'
+
+
+def get_setting(name):
+    return getattr(settings, 'GAMERRATER_METRICS', {}).get(name, DEFAULTS[name])
+
+
+class RequestStats:
+    """The queries one request has run so far"""
+
+    __slots__ = ('queries', 'db_seconds', 'log')
+
+    def __init__(self, keep_queries):
+        self.queries = 0
+        self.db_seconds = 0.0
+        # (seconds, sql) of every query, when slow requests are logged
+        self.log = [] if keep_queries else None
+
+
+# Stats of the request being handled, or None outside requests
+current = ContextVar('gamerrater_request_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing queries made during a request"""
+    stats = current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if stats.log is not None:
+            stats.log.append((elapsed, sql))
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # connection_created fires again when a connection reconnects
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    """Cumulative-on-export bucket counts, sum and count of observations"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One count per bound, plus +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RouteMetrics:
+    """Totals for one route and method"""
+
+    __slots__ = ('requests', 'errors', 'duration', 'queries', 'db_seconds', 'response_bytes')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.duration = Histogram(get_setting('DURATION_BUCKETS'))
+        self.queries = Histogram(get_setting('QUERY_BUCKETS'))
+        self.db_seconds = 0.0
+        self.response_bytes = 0
+
+
+class Registry:
+    """RouteMetrics by (route, method), shared by every thread of the process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, method, status, seconds, stats, response_bytes):
+        with self.lock:
+            metrics = self.routes.get((route, method))
+            if metrics is None:
+                metrics = self.routes[(route, method)] = RouteMetrics()
+            metrics.requests += 1
+            if status >= 500:
+                metrics.errors += 1
+            metrics.duration.observe(seconds)
+            metrics.queries.observe(stats.queries)
+            metrics.db_seconds += stats.db_seconds
+            metrics.response_bytes += response_bytes
+
+    def clear(self):
+        with self.lock:
+            self.routes.clear()
+
+    def snapshot(self):
+        """A consistent copy of the totals, to format outside the lock"""
+        with self.lock:
+            return [
+                (route, method, metrics.requests, metrics.errors,
+                 histogram_values(metrics.duration), histogram_values(metrics.queries),
+                 metrics.db_seconds, metrics.response_bytes)
+                for (route, method), metrics in sorted(self.routes.items())
+            ]
+
+
+def histogram_values(histogram):
+    return histogram.bounds, list(histogram.counts), histogram.sum, histogram.count
+
+
+registry = Registry()
+
+
+def route_name(request):
+    """The label a request's metrics are kept under"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED
+    return match.view_name or match.route
+
+
+def response_size(response):
+    if response.streaming:
+        return int(response.get('Content-Length') or 0)
+    return len(response.content)
+
+
+def start_request():
+    stats = RequestStats(keep_queries=get_setting('SLOW_REQUEST_SECONDS') is not None)
+    return stats, current.set(stats), time.perf_counter()
+
+
+def finish_request(request, response, stats, token, start):
+    elapsed = time.perf_counter() - start
+    current.reset(token)
+    route = route_name(request)
+    registry.record(route, request.method, response.status_code, elapsed, stats,
+                    response_size(response))
+
+    threshold = get_setting('SLOW_REQUEST_SECONDS')
+    if threshold is not None and elapsed >= threshold:
+        log_slow_request(request, route, response.status_code, elapsed, stats)
+
+
+def log_slow_request(request, route, status, elapsed, stats):
+    slowest = sorted(stats.log, key=lambda query: query[0], reverse=True)
+    lines = [
+        f'  {seconds * 1000:.1f}ms {sql[:SQL_LOG_LENGTH]}'
+        for seconds, sql in slowest[:get_setting('SLOW_QUERIES')]
+    ]
+    logger.warning(
+        'Slow request: %s %s (%s) %s in %.3fs, %d queries in %.3fs%s',
+        request.method, request.path, route, status, elapsed, stats.queries,
+        stats.db_seconds, ''.join(f'\n{line}' for line in lines))
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Record each request's latency, queries and response size"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats, token, start = start_request()
+            response = await get_response(request)
+            finish_request(request, response, stats, token, start)
+            return response
+
+        return markcoroutinefunction(middleware)
+
+    def middleware(request):
+        stats, token, start = start_request()
+        response = get_response(request)
+        finish_request(request, response, stats, token, start)
+        return response
+
+    return middleware
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition():
+    """Every route's metrics in the Prometheus text exposition format"""
+    rows = registry.snapshot()
+    lookups = cache.stats.snapshot()
+    families = {
+        'requests_total': ('counter', 'Requests handled', []),
+        'request_errors_total': ('counter', 'Requests answered with a 5xx status', []),
+        'request_duration_seconds': ('histogram', 'Time to respond, in seconds', []),
+        'request_db_queries': ('histogram', 'SQL queries run per request', []),
+        'request_db_seconds_total': ('counter', 'Time spent running SQL, in seconds', []),
+        'response_bytes_total': ('counter', 'Bytes of response bodies', []),
+        'response_cache_lookups_total': ('counter', 'Response cache lookups', [
+            f'gamerrater_response_cache_lookups_total{{result="hit"}} {lookups["hits"]}',
+            f'gamerrater_response_cache_lookups_total{{result="miss"}} {lookups["misses"]}',
+        ]),
+    }
+
+    def histogram(samples, name, labels, values):
+        bounds, counts, total, count = values
+        cumulative = 0
+        for bound, bucket in zip(list(bounds) + ['+Inf'], counts):
+            cumulative += bucket
+            samples.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        samples.append(f'{name}_sum{{{labels}}} {format_number(total)}')
+        samples.append(f'{name}_count{{{labels}}} {count}')
+
+    for route, method, requests, errors, duration, queries, db_seconds, size in rows:
+        labels = f'route="{escape(route)}",method="{escape(method)}"'
+        families['requests_total'][2].append(f'gamerrater_requests_total{{{labels}}} {requests}')
+        families['request_errors_total'][2].append(
+            f'gamerrater_request_errors_total{{{labels}}} {errors}')
+        histogram(families['request_duration_seconds'][2],
+                  'gamerrater_request_duration_seconds', labels, duration)
+        histogram(families['request_db_queries'][2],
+                  'gamerrater_request_db_queries', labels, queries)
+        families['request_db_seconds_total'][2].append(
+            f'gamerrater_request_db_seconds_total{{{labels}}} {format_number(db_seconds)}')
+        families['response_bytes_total'][2].append(
+            f'gamerrater_response_bytes_total{{{labels}}} {size}')
+
+    lines = []
+    for name, (kind, help_text, samples) in families.items():
+        lines.append(f'# HELP gamerrater_{name} {help_text}')
+        lines.append(f'# TYPE gamerrater_{name} {kind}')
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:29
+
+import gamerraterapi.models.game
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Game = apps.get_model('gamerraterapi', 'Game')
+    Rating = apps.get_model('gamerraterapi', 'Rating')
+    rows = Rating.objects.values('game_id', 'rating').annotate(
+        total=Count('id')).order_by()
+    games = {}
+    for row in rows:
+        game = games.get(row['game_id'])
+        if game is None:
+            game = games[row['game_id']] = Game.objects.get(pk=row['game_id'])
+            game.rating_histogram = [0] * 10
+        game.rating_count += row['total']
+        game.rating_sum += row['rating'] * row['total']
+        if 1 <= row['rating'] <= 10:
+            game.rating_histogram[row['rating'] - 1] += row['total']
+    Game.objects.bulk_update(
+        games.values(), ['rating_count', 'rating_sum', 'rating_histogram'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamerraterapi', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='rating_histogram',
+            field=models.JSONField(default=gamerraterapi.models.game.empty_histogram),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
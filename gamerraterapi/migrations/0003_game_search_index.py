@@ -0,0 +1,28 @@
+from django.db import migrations
+from gamerraterapi import search
+
+
+def create_search_index(apps, schema_editor):
+    if not search.fts_enabled(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(search.CREATE_INDEX_SQL)
+        search.rebuild_index(cursor)
+
+
+def drop_search_index(apps, schema_editor):
+    if not search.fts_enabled(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(search.DROP_INDEX_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamerraterapi', '0002_game_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:35
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def remove_duplicate_ratings(apps, schema_editor):
+    """Keep each player's latest rating of a game and refresh the aggregates"""
+    Game = apps.get_model('gamerraterapi', 'Game')
+    Rating = apps.get_model('gamerraterapi', 'Rating')
+    duplicates = Rating.objects.values('game_id', 'player_id').annotate(
+        total=Count('id'), latest=Max('id')).filter(total__gt=1).order_by()
+
+    game_ids = set()
+    for duplicate in duplicates:
+        Rating.objects.filter(
+            game_id=duplicate['game_id'], player_id=duplicate['player_id'],
+            id__lt=duplicate['latest']).delete()
+        game_ids.add(duplicate['game_id'])
+
+    for game in Game.objects.filter(pk__in=game_ids):
+        ratings = Rating.objects.filter(game=game)
+        totals = ratings.aggregate(count=Count('id'), sum=Sum('rating'))
+        game.rating_count = totals['count']
+        game.rating_sum = totals['sum'] or 0
+        game.rating_histogram = [
+            ratings.filter(rating=value).count() for value in range(1, 11)]
+        game.save(update_fields=['rating_count', 'rating_sum', 'rating_histogram'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamerraterapi', '0003_game_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_ratings, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='gamecategory',
+            index=models.Index(fields=['category', 'game'], name='gamecategory_category_game_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['game', 'date'], name='review_game_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='rating',
+            constraint=models.UniqueConstraint(fields=('game', 'player'), name='rating_unique_game_player'),
+        ),
+    ]
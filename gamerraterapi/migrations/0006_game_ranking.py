@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamerraterapi', '0005_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameRanking',
+            fields=[
+                ('game', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='gamerraterapi.game')),
+                ('bayesian_score', models.FloatField()),
+                ('trending_score', models.FloatField(null=True)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-bayesian_score', 'game'], name='ranking_bayesian_idx'), models.Index(fields=['-trending_score', 'game'], name='ranking_trending_idx')],
+            },
+        ),
+    ]
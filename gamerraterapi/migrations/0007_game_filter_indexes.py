@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:54
+
+from django.db import migrations, models
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+
+def backfill_rating_average(apps, schema_editor):
+    Game = apps.get_model('gamerraterapi', 'Game')
+    Game.objects.filter(rating_count__gt=0).update(
+        rating_average=Cast('rating_sum', FloatField()) / F('rating_count'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamerraterapi', '0006_game_ranking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='rating_average',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.RunPython(backfill_rating_average, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='game',
+            name='age',
+            field=models.IntegerField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='gameplay_length',
+            field=models.IntegerField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='num_players',
+            field=models.IntegerField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='year_released',
+            field=models.IntegerField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamerraterapi', '0007_game_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['game', 'updated_at'], name='rating_game_updated_idx'),
+        ),
+    ]
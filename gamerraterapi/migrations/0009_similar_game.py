@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamerraterapi', '0008_rating_game_updated_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarGame',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_games', to='gamerraterapi.game')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbour_of', to='gamerraterapi.game')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['game', '-score'], name='similargame_game_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('game', 'similar'), name='similargame_unique_pair')],
+            },
+        ),
+    ]
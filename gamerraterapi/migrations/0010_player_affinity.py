@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamerraterapi', '0009_similar_game'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerAffinity',
+            fields=[
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='affinity', serialize=False, to='gamerraterapi.player')),
+                ('categories', models.JSONField(default=dict)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('rating_count', models.IntegerField(default=0)),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamerraterapi', '0010_player_affinity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='picture',
+            name='height',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='picture',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='picture',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='picture',
+            name='width',
+            field=models.IntegerField(null=True),
+        ),
+    ]
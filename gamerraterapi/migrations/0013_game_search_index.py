@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:15
+
+import django.db.models.deletion
+import gamerraterapi.models.game_search_index
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamerraterapi', '0012_rating_log_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameSearchIndex',
+            fields=[
+                ('game', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='gamerraterapi.game')),
+                ('document', gamerraterapi.models.game_search_index.SearchDocumentField(db_column='gamerraterapi_game_fts')),
+            ],
+            options={
+                'db_table': 'gamerraterapi_game_fts',
+                'managed': False,
+            },
+        ),
+    ]
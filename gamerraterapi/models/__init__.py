@@ -5,4 +5,9 @@ from .game import Game
 from .player import Player
 from .rating import Rating
 from .review import Review
-from .entry import Entry
\ No newline at end of file
+from .entry import Entry
+from .game_ranking import GameRanking
+from .similar_game import SimilarGame
+from .player_affinity import PlayerAffinity
+from .rating_log_checkpoint import RatingLogCheckpoint
+from .game_search_index import GameSearchIndex
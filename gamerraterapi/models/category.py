@@ -3,6 +3,7 @@ from django.db import models
 class Category(models.Model):
     
     label = models.CharField(max_length=50)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     def __str__(self):
         return self.label
@@ -1,34 +1,190 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, Prefetch
+from django.utils import timezone
+from gamerraterapi.models.category import Category
 from gamerraterapi.models.rating import Rating
 
 
+RATING_SCALE = range(1, 11)
+
+
+def empty_histogram():
+    """One bucket per rating value on the 1-10 scale"""
+    return [0] * len(RATING_SCALE)
+
+
+def average(rating_sum, rating_count):
+    return rating_sum / rating_count if rating_count else 0
+
+
+class GameQuerySet(models.QuerySet):
+
+    # Columns the API serializers read; anything else stays in the database
+    API_FIELDS = ('id', 'title', 'description', 'designer', 'year_released',
+                  'num_players', 'gameplay_length', 'age',
+                  'rating_count', 'rating_sum', 'rating_average')
+
+    def for_api(self):
+        """Games shaped for the API: only the serialized columns, with
+        categories fetched in one extra query
+        """
+        return self.only(*self.API_FIELDS).prefetch_related(
+            Prefetch('categories', queryset=Category.objects.only('id', 'label').order_by('id')))
+
+
 class Game(models.Model):
 
     title = models.CharField(max_length=50)
     description = models.CharField(max_length=50)
     designer = models.CharField(max_length=50)
-    year_released = models.IntegerField()
-    num_players = models.IntegerField()
-    gameplay_length = models.IntegerField()
-    age = models.IntegerField()
+    # Indexed for the /games filters and sort keys
+    year_released = models.IntegerField(db_index=True)
+    num_players = models.IntegerField(db_index=True)
+    gameplay_length = models.IntegerField(db_index=True)
+    age = models.IntegerField(db_index=True)
     categories = models.ManyToManyField(
         "Category", through="GameCategory", related_name="categories")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Rating aggregates, maintained by the rating views so that reading
+    # a game's average never has to touch the ratings table
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    rating_histogram = models.JSONField(default=empty_histogram)
+    # rating_sum / rating_count, stored so it can be filtered and sorted on an index
+    rating_average = models.FloatField(default=0, db_index=True)
+
+    objects = GameQuerySet.as_manager()
 
     @property
     def average_rating(self):
         """Average rating calculated attribute for each game"""
-        ratings = Rating.objects.filter(game=self)
-
-        # Sum all of the ratings for the game
-        total_rating = 0
-        for rating in ratings:
-            total_rating += rating.rating
-        if len(ratings) > 0:
-            avg_rating = total_rating/len(ratings)
-        else:
-            avg_rating = 0
-            
-        return avg_rating 
-
-        # Calculate the averge and return it.
-        # If you don't know how to calculate averge, Google it.
+        if self.rating_count > 0:
+            return self.rating_sum/self.rating_count
+
+        return 0
+
+    @classmethod
+    def adjust_rating_aggregates(cls, game_id, added=None, removed=None):
+        """Apply a single rating change to the stored aggregates
+
+        Arguments:
+            game_id -- The game whose rating changed
+            added -- The rating value that was added, if any
+            removed -- The rating value that was removed, if any
+        """
+        cls.apply_rating_changes([(game_id, removed, added)])
+
+    @classmethod
+    def apply_rating_changes(cls, changes):
+        """Apply many rating changes to the stored aggregates, in two queries
+
+        Arguments:
+            changes -- (game id, removed value or None, added value or None)
+                       of each rating written or deleted
+        """
+        deltas = {}
+        for game_id, removed, added in changes:
+            delta = deltas.setdefault(game_id, {'count': 0, 'sum': 0, 'histogram': empty_histogram()})
+            for value, sign in ((removed, -1), (added, 1)):
+                if value is None:
+                    continue
+                delta['count'] += sign
+                delta['sum'] += sign * value
+                if value in RATING_SCALE:
+                    delta['histogram'][value - 1] += sign
+
+        if not deltas:
+            return
+
+        with transaction.atomic():
+            games = list(cls.objects.select_for_update().only(
+                'rating_count', 'rating_sum', 'rating_histogram',
+                'rating_average').filter(pk__in=deltas))
+            for game in games:
+                delta = deltas[game.pk]
+                game.rating_count += delta['count']
+                game.rating_sum += delta['sum']
+                game.rating_histogram = [
+                    count + change
+                    for count, change in zip(game.rating_histogram, delta['histogram'])]
+                game.rating_average = average(game.rating_sum, game.rating_count)
+                game.updated_at = timezone.now()
+            cls.objects.bulk_update(games, [
+                'rating_count', 'rating_sum', 'rating_histogram', 'rating_average',
+                'updated_at'], batch_size=2000)
+
+    def set_rating(self, player, value):
+        """Record a player's rating of this game, replacing any earlier one
+
+        Re-rating updates the player's existing row in place, so a game
+        holds at most one rating per player.
+        Returns:
+            tuple -- (the Rating, whether it was created)
+        """
+        with transaction.atomic():
+            rating = Rating.objects.select_for_update().filter(
+                game=self, player=player).first()
+            if rating is None:
+                try:
+                    with transaction.atomic():
+                        rating = Rating.objects.create(game=self, player=player, rating=value)
+                    Game.adjust_rating_aggregates(self.pk, added=value)
+                    return rating, True
+                except IntegrityError:
+                    # Lost a race with a concurrent first rating; update that row instead
+                    rating = Rating.objects.select_for_update().get(game=self, player=player)
+
+            previous = rating.rating
+            rating.rating = value
+            rating.save(update_fields=['rating', 'updated_at'])
+            Game.adjust_rating_aggregates(self.pk, added=value, removed=previous)
+            return rating, False
+
+    @classmethod
+    def rebuild_rating_aggregates(cls, game_ids=None):
+        """Recompute the stored aggregates from the ratings table
+
+        Arguments:
+            game_ids -- Limit the rebuild to these games, or None for all
+        Returns:
+            int -- The number of games rebuilt
+        """
+        games = cls.objects.all()
+        ratings = Rating.objects.all()
+        if game_ids is not None:
+            games = games.filter(pk__in=game_ids)
+            ratings = ratings.filter(game_id__in=game_ids)
+
+        aggregates = {}
+        rows = ratings.values('game_id', 'rating').annotate(
+            total=Count('id')).order_by()
+        for row in rows:
+            aggregate = aggregates.setdefault(
+                row['game_id'], {'count': 0, 'sum': 0, 'histogram': empty_histogram()})
+            aggregate['count'] += row['total']
+            aggregate['sum'] += row['rating'] * row['total']
+            if row['rating'] in RATING_SCALE:
+                aggregate['histogram'][row['rating'] - 1] += row['total']
+
+        fields = ['rating_count', 'rating_sum', 'rating_histogram', 'rating_average',
+                  'updated_at']
+        now = timezone.now()
+        # Read every id up front: updating rows while an SQLite cursor is
+        # still walking the same table can revisit them
+        ids = list(games.values_list('id', flat=True))
+        with transaction.atomic():
+            for start in range(0, len(ids), 2000):
+                batch = []
+                for pk in ids[start:start + 2000]:
+                    aggregate = aggregates.get(pk)
+                    batch.append(cls(
+                        pk=pk,
+                        rating_count=aggregate['count'] if aggregate else 0,
+                        rating_sum=aggregate['sum'] if aggregate else 0,
+                        rating_histogram=aggregate['histogram'] if aggregate else empty_histogram(),
+                        rating_average=average(aggregate['sum'], aggregate['count']) if aggregate else 0,
+                        updated_at=now))
+                cls.objects.bulk_update(batch, fields)
+
+        return len(ids)
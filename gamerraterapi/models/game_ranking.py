@@ -0,0 +1,19 @@
+from django.db import models
+
+class GameRanking(models.Model):
+    """Precomputed leaderboard scores for a game (see gamerraterapi/rankings.py)"""
+
+    game = models.OneToOneField(
+        "Game", on_delete=models.CASCADE, primary_key=True, related_name="ranking")
+    # Average rating shrunk towards the global mean by a prior weight
+    bayesian_score = models.FloatField()
+    # Log of the time-decayed activity, comparable between games; null when
+    # the game has had no ratings or reviews in the trending window
+    trending_score = models.FloatField(null=True)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-bayesian_score', 'game'], name='ranking_bayesian_idx'),
+            models.Index(fields=['-trending_score', 'game'], name='ranking_trending_idx'),
+        ]
@@ -0,0 +1,35 @@
+from django.db import models
+
+
+class Match(models.Lookup):
+    """`column MATCH query`: an FTS5 full-text query"""
+
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class SearchDocumentField(models.TextField):
+    """FTS5's hidden column named after its table, standing for the whole row"""
+
+
+SearchDocumentField.register_lookup(Match)
+
+
+class GameSearchIndex(models.Model):
+    """A game's row in the FTS5 search index (see gamerraterapi/search.py),
+    mapped so searches join it into the games query; the virtual table is
+    created by migration 0003 and kept in sync by gamerraterapi.signals
+    """
+
+    game = models.OneToOneField(
+        "Game", on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        related_name='search_index')
+    document = SearchDocumentField(db_column='gamerraterapi_game_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'gamerraterapi_game_fts'
@@ -2,9 +2,21 @@ from django.db import models
 
 class Picture(models.Model):
 
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+
     player = models.ForeignKey("Player", on_delete=models.CASCADE)
     game = models.ForeignKey(
         "Game", on_delete=models.CASCADE, related_name='pictures')
+    # Uploads are stored by content hash (see gamerraterapi/pictures.py), so
+    # pictures of the same image share one file and one set of thumbnails
     image = models.ImageField(
         upload_to='gameimages/', height_field=None,
         width_field=None, max_length=None, null=True)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    width = models.IntegerField(null=True)
+    height = models.IntegerField(null=True)
+    # Whether the thumbnails have been generated
+    status = models.CharField(max_length=10, default=PENDING, choices=[
+        (PENDING, 'Pending'), (READY, 'Ready'), (FAILED, 'Failed')])
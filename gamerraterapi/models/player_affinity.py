@@ -0,0 +1,12 @@
+from django.db import models
+
+class PlayerAffinity(models.Model):
+    """A player's taste in categories, from their ratings (see gamerraterapi/feeds.py)"""
+
+    player = models.OneToOneField(
+        "Player", on_delete=models.CASCADE, primary_key=True, related_name="affinity")
+    # Category id -> [sum, count] of the player's ratings of games in it
+    categories = models.JSONField(default=dict)
+    rating_sum = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    computed_at = models.DateTimeField()
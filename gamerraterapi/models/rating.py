@@ -5,3 +5,24 @@ class Rating(models.Model):
     game = models.ForeignKey("Game", on_delete=models.CASCADE)
     player = models.ForeignKey("Player", on_delete=models.CASCADE)
     rating = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        rating = super().from_db(db, field_names, values)
+        # The value as loaded, so a save can tell what it replaced (see
+        # gamerraterapi.signals); None when the column was deferred
+        rating.stored_rating = rating.__dict__.get('rating')
+        return rating
+
+    class Meta:
+        constraints = [
+            # One rating per player per game; re-rating updates the row.
+            # Also serves as the (game, player) lookup index.
+            models.UniqueConstraint(
+                fields=['game', 'player'], name='rating_unique_game_player'),
+        ]
+        indexes = [
+            # A game's recent ratings, for /games/<pk>/stats and trending
+            models.Index(fields=['game', 'updated_at'], name='rating_game_updated_idx'),
+        ]
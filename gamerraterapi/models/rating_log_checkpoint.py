@@ -0,0 +1,12 @@
+from django.db import models
+
+class RatingLogCheckpoint(models.Model):
+    """How far the write-behind rating log has been applied (see
+    gamerraterapi/writebehind.py); one row, saved in the same transaction as
+    the ratings it covers
+    """
+
+    # Log position just past the last applied record
+    segment = models.BigIntegerField(default=1)
+    offset = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
@@ -5,4 +5,11 @@ class Review(models.Model):
     game = models.ForeignKey("Game", on_delete=models.CASCADE)
     player = models.ForeignKey("Player", on_delete=models.CASCADE)
     review = models.CharField(max_length=50)
-    date = models.DateTimeField()
\ No newline at end of file
+    date = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # /reviews?gameId= filters by game and pages by date
+            models.Index(fields=['game', 'date'], name='review_game_date_idx'),
+        ]
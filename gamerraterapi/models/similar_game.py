@@ -0,0 +1,21 @@
+from django.db import models
+
+class SimilarGame(models.Model):
+    """One of a game's nearest neighbours by rating similarity
+    (see gamerraterapi/recommendations.py)
+    """
+
+    game = models.ForeignKey("Game", on_delete=models.CASCADE, related_name="similar_games")
+    similar = models.ForeignKey("Game", on_delete=models.CASCADE, related_name="neighbour_of")
+    # Adjusted cosine similarity of the two games' ratings, shrunk towards
+    # 0 when few players rated both
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'similar'], name='similargame_unique_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['game', '-score'], name='similargame_game_score_idx'),
+        ]
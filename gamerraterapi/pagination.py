@@ -0,0 +1,244 @@
+"""Keyset (cursor) pagination and NDJSON streaming for list endpoints
+
+A list endpoint answers in one of three shapes, picked by query params:
+
+    /games                       -- the full list, as before
+    /games?limit=20              -- one page: {"results": [...], "next": "<cursor>"}
+    /games?limit=20&cursor=...   -- the page after the cursor
+    /games?stream=1              -- every row as newline-delimited JSON
+
+Pages are found with a `WHERE (key, id) > (last key, last id)` filter instead
+of an OFFSET, so fetching any page costs the same no matter how deep it is.
+"""
+import base64
+import binascii
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from gamerraterapi import serialization
+from gamerraterapi.shaping import Shape
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_CHUNK_SIZE = 500
+
+
+class PaginationError(ValueError):
+    """Raised for a bad `orderby`, `limit` or `cursor` query param"""
+
+
+def get_ordering(request, sort_keys, default='id'):
+    """Read the `orderby` query param
+
+    Arguments:
+        request -- The full HTTP request object
+        sort_keys -- Map of the orderby names clients may use to model fields
+        default -- The orderby used when the param is missing
+    Returns:
+        tuple -- (orderby name, model field, descending)
+    """
+    ordering = request.query_params.get('orderby', default)
+    descending = ordering.startswith('-')
+    name = ordering.lstrip('-')
+    if name not in sort_keys:
+        raise PaginationError(
+            f"Can't order by '{name}', expected one of: {', '.join(sort_keys)}")
+
+    return ordering, sort_keys[name], descending
+
+
+def order_queryset(queryset, field, descending):
+    """Order by the sort field, breaking ties on id so the order is total"""
+    sign = '-' if descending else ''
+    if field == 'id':
+        return queryset.order_by(f'{sign}id')
+
+    return queryset.order_by(f'{sign}{field}', f'{sign}id')
+
+
+def encode_cursor(ordering, value, pk):
+    """Opaque token pointing just past the row with this sort value and id"""
+    payload = json.dumps([ordering, value, pk], cls=JSONEncoder)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, ordering):
+    """Recover the (sort value, id) pair from a cursor token"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        cursor_ordering, value, pk = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError) as ex:
+        raise PaginationError('Invalid cursor') from ex
+
+    if cursor_ordering != ordering:
+        raise PaginationError('Cursor was issued for a different orderby')
+    # Cursors are opaque but not signed; reject ones that were tampered with
+    if isinstance(pk, bool) or not isinstance(pk, int):
+        raise PaginationError('Invalid cursor')
+    if isinstance(value, (bool, list, dict)):
+        raise PaginationError('Invalid cursor')
+
+    return value, pk
+
+
+def seek(queryset, field, descending, value, pk):
+    """Filter to the rows that come after (value, pk) in the ordering
+
+    Raises:
+        PaginationError -- When the value doesn't fit the sort field
+    """
+    after = 'lt' if descending else 'gt'
+    if field == 'id':
+        return queryset.filter(**{f'id__{after}': pk})
+
+    try:
+        return queryset.filter(
+            Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'id__{after}': pk}))
+    except (ValueError, TypeError, ValidationError) as ex:
+        raise PaginationError('Invalid cursor') from ex
+
+
+def get_limit(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Read the `limit` query param, capped at `maximum`"""
+    try:
+        limit = int(request.query_params.get('limit', default))
+    except ValueError as ex:
+        raise PaginationError('limit must be an integer') from ex
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+
+    return min(limit, maximum)
+
+
+def sort_value(instance, field):
+    """The value of a (possibly related or annotated) sort field on a row"""
+    for attribute in field.split('__'):
+        instance = getattr(instance, attribute)
+
+    return instance
+
+
+def stream_ndjson(items):
+    """Stream already serialized items as NDJSON, one line each"""
+    encoder = JSONEncoder(ensure_ascii=False)
+    lines = (encoder.encode(item) + '\n' for item in items)
+    return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+
+def list_response(request, queryset, serializer_class, sort_keys, default_ordering='id',
+                  values_serializer=None):
+    """Respond to a list request with the full list, a page or a stream
+
+    Arguments:
+        request -- The full HTTP request object
+        queryset -- The filtered, unordered rows to list
+        serializer_class -- Serializer used for each row
+        sort_keys -- Map of the orderby names clients may use to model fields
+        default_ordering -- The orderby used when the param is missing
+        values_serializer -- Optional ValuesSerializer producing the same
+                             output as serializer_class, used when the
+                             request doesn't ask for a custom shape
+    Returns:
+        Response -- JSON list, JSON page or streamed NDJSON
+    """
+    params = request.query_params
+    context = {'request': request}
+    if values_serializer is not None and (
+            not serialization.enabled() or Shape.from_request(request) is not None):
+        values_serializer = None
+    try:
+        ordering, field, descending = get_ordering(request, sort_keys, default_ordering)
+        queryset = order_queryset(queryset, field, descending)
+
+        if 'cursor' in params:
+            value, pk = decode_cursor(params['cursor'], ordering)
+            queryset = seek(queryset, field, descending, value, pk)
+
+        if params.get('stream') in ('1', 'true'):
+            if values_serializer is not None:
+                return stream_ndjson(values_serializer.iterate(queryset, STREAM_CHUNK_SIZE))
+            return stream_ndjson(
+                serializer_class(instance, context=context).data
+                for instance in queryset.iterator(chunk_size=STREAM_CHUNK_SIZE))
+
+        if 'limit' not in params and 'cursor' not in params:
+            if values_serializer is not None:
+                return Response(values_serializer.serialize(values_serializer.values(queryset)))
+            serializer = serializer_class(queryset, many=True, context=context)
+            return Response(serializer.data)
+
+        limit = get_limit(request)
+    except PaginationError as ex:
+        return Response({'message': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if values_serializer is not None:
+        # The sort field rides along with each row for the next cursor
+        rows = list(values_serializer.values(queryset, field)[:limit + 1])
+        page = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_cursor(ordering, page[-1][field], page[-1]['id'])
+        return Response({'results': values_serializer.serialize(page), 'next': next_cursor})
+
+    rows = list(queryset[:limit + 1])
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = encode_cursor(ordering, sort_value(last, field), last.pk)
+
+    serializer = serializer_class(page, many=True, context=context)
+    return Response({'results': serializer.data, 'next': next_cursor})
+
+
+async def alist_response(request, queryset, values_serializer, sort_keys, default_ordering='id'):
+    """list_response for async views, reading rows with the async ORM
+
+    Arguments:
+        request -- A request with `query_params`
+        queryset -- The filtered, unordered rows to list
+        values_serializer -- ValuesSerializer (or ModelRows) for the rows
+        sort_keys -- Map of the orderby names clients may use to model fields
+        default_ordering -- The orderby used when the param is missing
+    Returns:
+        list, dict or StreamingHttpResponse -- The full list, a page or a stream
+    Raises:
+        PaginationError -- For a bad `orderby`, `limit` or `cursor`
+    """
+    params = request.query_params
+    ordering, field, descending = get_ordering(request, sort_keys, default_ordering)
+    queryset = order_queryset(queryset, field, descending)
+
+    if 'cursor' in params:
+        value, pk = decode_cursor(params['cursor'], ordering)
+        queryset = seek(queryset, field, descending, value, pk)
+
+    if params.get('stream') in ('1', 'true'):
+        encoder = JSONEncoder(ensure_ascii=False)
+
+        async def lines():
+            async for item in values_serializer.aiterate(queryset, STREAM_CHUNK_SIZE):
+                yield encoder.encode(item) + '\n'
+
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+    if 'limit' not in params and 'cursor' not in params:
+        return await values_serializer.aserialize(
+            [row async for row in values_serializer.values(queryset)])
+
+    limit = get_limit(request)
+    rows = [row async for row in values_serializer.values(queryset, field)[:limit + 1]]
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor(ordering, last[field], last['id'])
+        else:
+            next_cursor = encode_cursor(ordering, sort_value(last, field), last.pk)
+
+    return {'results': await values_serializer.aserialize(page), 'next': next_cursor}
@@ -0,0 +1,198 @@
+"""Picture uploads: content-addressed originals and background thumbnails
+
+An upload is hashed and checked with Pillow in the request, then stored as
+
+    pictures/originals/<sha256[:2]>/<sha256>.<ext>
+
+unless a file with that hash is already there, so the same image uploaded
+any number of times is stored once. Thumbnails are generated after the
+upload's transaction commits, on a pool of WORKERS threads (Pillow releases
+the GIL while it decodes, resizes and encodes), one per SIZES entry in each
+of FORMATS:
+
+    pictures/thumbnails/<sha256[:2]>/<sha256>/<size>.<format>
+
+Thumbnails of an image that's already been processed aren't made again.
+Because a file's name is derived from its content, a thumbnail can be
+served with a year-long, immutable cache lifetime.
+"""
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+from gamerraterapi.models import Picture
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Name -> longest side in pixels
+    'SIZES': {'small': 160, 'medium': 480, 'large': 1024},
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': 80,
+    # Thumbnailing threads; 0 makes thumbnails in the committing thread
+    'WORKERS': 2,
+    'MAX_UPLOAD_BYTES': 10 * 1024 * 1024,
+    'MAX_PIXELS': 40_000_000,
+}
+
+# Pillow format -> stored extension, for the formats accepted as uploads
+UPLOAD_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+CONTENT_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+
+def get_setting(name):
+    return getattr(settings, 'GAMERRATER_PICTURES', {}).get(name, DEFAULTS[name])
+
+
+class PictureError(ValueError):
+    """Raised for an upload that isn't an acceptable image"""
+
+
+def original_name(digest, extension):
+    return f'pictures/originals/{digest[:2]}/{digest}.{extension}'
+
+
+def thumbnail_name(digest, size, image_format):
+    return f'pictures/thumbnails/{digest[:2]}/{digest}/{size}.{image_format}'
+
+
+def store_original(upload):
+    """Check an uploaded image and store it under its content hash
+
+    Arguments:
+        upload -- The uploaded file
+    Returns:
+        tuple -- (storage name, sha256 hex digest, width, height)
+    Raises:
+        PictureError -- For a file that's too large or not a supported image
+    """
+    if upload.size > get_setting('MAX_UPLOAD_BYTES'):
+        raise PictureError(f'image must be at most {get_setting("MAX_UPLOAD_BYTES")} bytes')
+
+    data = upload.read()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format, (width, height) = image.format, image.size
+            if width * height > get_setting('MAX_PIXELS'):
+                raise PictureError('image has too many pixels')
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as ex:
+        raise PictureError('image must be a JPEG, PNG, GIF or WebP file') from ex
+    if image_format not in UPLOAD_FORMATS:
+        raise PictureError('image must be a JPEG, PNG, GIF or WebP file')
+
+    digest = hashlib.sha256(data).hexdigest()
+    name = original_name(digest, UPLOAD_FORMATS[image_format])
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+
+    return name, digest, width, height
+
+
+def thumbnails_exist(digest):
+    return all(
+        default_storage.exists(thumbnail_name(digest, size, image_format))
+        for size in get_setting('SIZES') for image_format in get_setting('FORMATS'))
+
+
+def make_thumbnails(digest, name):
+    """Generate every missing thumbnail of a stored original"""
+    with default_storage.open(name) as original, Image.open(original) as image:
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        # Largest first, so each size is resized from the one before it
+        for size, pixels in sorted(get_setting('SIZES').items(), key=lambda item: -item[1]):
+            image.thumbnail((pixels, pixels), Image.Resampling.LANCZOS)
+            for image_format in get_setting('FORMATS'):
+                target = thumbnail_name(digest, size, image_format)
+                if default_storage.exists(target):
+                    continue
+                encoded = io.BytesIO()
+                frame = image.convert('RGB') if image_format == 'jpeg' else image
+                frame.save(encoded, image_format.upper(), quality=get_setting('QUALITY'))
+                default_storage.save(target, ContentFile(encoded.getvalue()))
+
+
+def process_picture(picture_id):
+    """Make a picture's thumbnails and mark it ready, or failed"""
+    try:
+        picture = Picture.objects.get(pk=picture_id)
+        if not thumbnails_exist(picture.sha256):
+            make_thumbnails(picture.sha256, picture.image.name)
+        status = Picture.READY
+    except Picture.DoesNotExist:
+        return
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Thumbnailing picture %s failed', picture_id)
+        status = Picture.FAILED
+
+    Picture.objects.filter(pk=picture_id).update(status=status)
+
+
+def run_in_pool(picture_id):
+    try:
+        process_picture(picture_id)
+    finally:
+        # Pool threads outlive requests; don't let their connections go stale
+        close_old_connections()
+
+
+_pool = None
+
+
+def pool():
+    """The thumbnailing thread pool, started on first use"""
+    global _pool  # pylint: disable=global-statement
+    if _pool is None:
+        _pool = ThreadPoolExecutor(
+            max_workers=get_setting('WORKERS'), thread_name_prefix='thumbnails')
+    return _pool
+
+
+def shutdown():
+    """Wait for queued thumbnails and stop the pool; it restarts, with the
+    current WORKERS setting, the next time a picture is uploaded
+    """
+    global _pool  # pylint: disable=global-statement
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
+
+
+def schedule_thumbnails(picture_id):
+    """Make a picture's thumbnails in the background once the current
+    transaction commits
+    """
+    def submit():
+        if get_setting('WORKERS'):
+            pool().submit(run_in_pool, picture_id)
+        else:
+            process_picture(picture_id)
+
+    transaction.on_commit(submit)
+
+
+def create_picture(player, game, upload):
+    """Store an uploaded picture of a game and schedule its thumbnails
+
+    Raises:
+        PictureError -- For a file that isn't an acceptable image
+    """
+    name, digest, width, height = store_original(upload)
+    ready = thumbnails_exist(digest)
+    with transaction.atomic():
+        picture = Picture.objects.create(
+            player=player, game=game, image=name, sha256=digest, width=width,
+            height=height, status=Picture.READY if ready else Picture.PENDING)
+        if not ready:
+            schedule_thumbnails(picture.pk)
+
+    return picture
@@ -0,0 +1,229 @@
+"""Precomputed top-rated and trending leaderboards
+
+Each game's leaderboard scores live in GameRanking, indexed so the top N of
+either board is an index walk of N rows instead of a sort over every game.
+
+Top rated uses a Bayesian average: the game's ratings plus PRIOR_WEIGHT
+imaginary ratings at the global mean, so a game with two 10s doesn't outrank
+one with five hundred 9s.
+
+    bayesian = (prior_weight * global_mean + rating_sum) / (prior_weight + rating_count)
+
+Trending sums the game's recent activity, each rating (weighted by its value)
+and review (weighted by REVIEW_WEIGHT) decaying with a half-life of
+HALF_LIFE_DAYS. Decay is measured from a fixed epoch rather than from now,
+
+    trending = log(sum(weight * 2 ** ((event_time - EPOCH) / half_life)))
+
+so scores computed at different times are directly comparable: a game with
+no new activity sinks below fresher ones without being recomputed. That also
+makes the score incremental: a new event is folded into the stored score,
+log(exp(score) + event), with no need to decay or rescan what's there.
+
+Rating and review writes refresh the affected games once their transaction
+commits (see gamerraterapi.signals), adding their events to the trending
+score in constant time. Deleting a player refreshes the games they rated
+once each, however many ratings go with them. Events leave the score only
+when `recompute_rankings`
+rescans the last WINDOW_DAYS of activity, so run it periodically: it drops
+deleted and expired events, counts a re-rated game's rating once rather than
+per re-rating, and picks up the drift in the global mean.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from gamerraterapi.models import Game, GameRanking, Rating, Review
+
+DEFAULTS = {
+    # Imaginary ratings at the global mean added to every game; None uses
+    # the mean number of ratings per rated game
+    'PRIOR_WEIGHT': None,
+    'HALF_LIFE_DAYS': 7,
+    'WINDOW_DAYS': 30,
+    # Trending weight of a review relative to a 10 rating
+    'REVIEW_WEIGHT': 0.5,
+}
+
+EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+
+# Where the prior used by incremental refreshes is kept between recomputes
+PRIOR_CACHE_KEY = 'gamerrater:rankings:prior'
+
+# Games written per upsert
+CHUNK_SIZE = 2000
+
+
+def get_setting(name):
+    return getattr(settings, 'GAMERRATER_RANKINGS', {}).get(name, DEFAULTS[name])
+
+
+def compute_prior():
+    """The global mean rating and the prior weight, from the stored aggregates
+
+    Returns:
+        tuple -- (mean, weight)
+    """
+    totals = Game.objects.filter(rating_count__gt=0).aggregate(
+        games=Count('id'), count=Sum('rating_count'), sum=Sum('rating_sum'))
+    if not totals['count']:
+        return 0.0, float(get_setting('PRIOR_WEIGHT') or 1)
+
+    mean = totals['sum'] / totals['count']
+    weight = get_setting('PRIOR_WEIGHT')
+    if weight is None:
+        weight = totals['count'] / totals['games']
+    return mean, float(weight)
+
+
+def get_prior():
+    """The prior from the last recompute, computing it if it isn't cached"""
+    prior = caches['default'].get(PRIOR_CACHE_KEY)
+    if prior is None:
+        prior = compute_prior()
+        caches['default'].set(PRIOR_CACHE_KEY, prior, None)
+    return prior
+
+
+def bayesian_score(rating_count, rating_sum, prior):
+    mean, weight = prior
+    return (weight * mean + rating_sum) / (weight + rating_count)
+
+
+def decayed_weight_log(when, weight):
+    """log(weight * 2 ** (age since the epoch in half-lives))"""
+    half_lives = (when - EPOCH).total_seconds() / (get_setting('HALF_LIFE_DAYS') * 86400)
+    return math.log(weight) + half_lives * math.log(2)
+
+
+def log_sum(values):
+    """log(sum(exp(v) for v in values)) without overflowing"""
+    largest = max(values)
+    return largest + math.log(sum(math.exp(value - largest) for value in values))
+
+
+def trending_scores(game_ids=None, now=None):
+    """Trending score of every game with activity in the window
+
+    Arguments:
+        game_ids -- Limit to these games, or None for all
+    Returns:
+        dict -- game id -> score
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=get_setting('WINDOW_DAYS'))
+    ratings = Rating.objects.filter(updated_at__gte=cutoff)
+    reviews = Review.objects.filter(date__gte=cutoff)
+    if game_ids is not None:
+        ratings = ratings.filter(game_id__in=game_ids)
+        reviews = reviews.filter(game_id__in=game_ids)
+
+    events = {}
+    for game_id, rating, updated_at in ratings.values_list(
+            'game_id', 'rating', 'updated_at').iterator(chunk_size=2000):
+        if rating > 0:
+            events.setdefault(game_id, []).append(decayed_weight_log(updated_at, rating / 10))
+
+    review_weight = get_setting('REVIEW_WEIGHT')
+    if review_weight > 0:
+        for game_id, date in reviews.values_list('game_id', 'date').iterator(chunk_size=2000):
+            events.setdefault(game_id, []).append(decayed_weight_log(date, review_weight))
+
+    return {game_id: log_sum(logs) for game_id, logs in events.items()}
+
+
+def add_events(trending, events, now):
+    """Fold new activity into stored trending scores
+
+    Arguments:
+        trending -- game id -> stored score (or None), updated in place
+        events -- (game id, time, weight) of each new rating or review
+    """
+    cutoff = now - timedelta(days=get_setting('WINDOW_DAYS'))
+    for game_id, when, weight in events:
+        if weight <= 0 or when < cutoff:
+            continue
+        logs = [decayed_weight_log(when, weight)]
+        if trending.get(game_id) is not None:
+            logs.append(trending[game_id])
+        trending[game_id] = log_sum(logs)
+
+
+def rating_event(rating):
+    """The trending event of a Rating being saved"""
+    return rating.game_id, rating.updated_at, rating.rating / 10
+
+
+def review_event(review):
+    """The trending event of a Review being created"""
+    # Views assign the date as sent, before the model parses it
+    date = Review._meta.get_field('date').to_python(review.date)
+    return review.game_id, date, get_setting('REVIEW_WEIGHT')
+
+
+def save_rankings(rows, prior, trending, now):
+    """Upsert GameRanking rows from (id, rating_count, rating_sum) tuples"""
+    rankings = [
+        GameRanking(game_id=game_id,
+                    bayesian_score=bayesian_score(rating_count, rating_sum, prior),
+                    trending_score=trending.get(game_id),
+                    computed_at=now)
+        for game_id, rating_count, rating_sum in rows]
+    GameRanking.objects.bulk_create(
+        rankings,
+        batch_size=CHUNK_SIZE,
+        update_conflicts=True,
+        unique_fields=['game'],
+        update_fields=['bayesian_score', 'trending_score', 'computed_at'])
+
+
+def refresh_rankings(game_ids, events=()):
+    """Recompute the Bayesian scores of these games against the cached prior
+    and add new activity to their trending scores
+
+    Arguments:
+        events -- (game id, time, weight) of the ratings and reviews written
+    """
+    game_ids = set(game_ids)
+    if not game_ids:
+        return
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Locked, so concurrent refreshes don't lose each other's events
+        trending = dict(GameRanking.objects.select_for_update().filter(
+            game_id__in=game_ids).values_list('game_id', 'trending_score'))
+        add_events(trending, events, now)
+        rows = Game.objects.filter(pk__in=game_ids).values_list(
+            'id', 'rating_count', 'rating_sum')
+        save_rankings(list(rows), get_prior(), trending, now)
+
+
+def refresh_rankings_on_commit(game_ids, events=()):
+    """Refresh these games once the current transaction commits, after the
+    rating aggregates written in it are final
+    """
+    game_ids = set(game_ids)
+    events = list(events)
+    transaction.on_commit(lambda: refresh_rankings(game_ids, events))
+
+
+def recompute_rankings():
+    """Recompute the prior and every game's rankings
+
+    Returns:
+        int -- The number of games ranked
+    """
+    prior = compute_prior()
+    caches['default'].set(PRIOR_CACHE_KEY, prior, None)
+
+    now = timezone.now()
+    trending = trending_scores(now=now)
+    rows = list(Game.objects.values_list('id', 'rating_count', 'rating_sum').order_by())
+    with transaction.atomic():
+        for start in range(0, len(rows), CHUNK_SIZE):
+            save_rankings(rows[start:start + CHUNK_SIZE], prior, trending, now)
+
+    return len(rows)
@@ -0,0 +1,226 @@
+"""Similar games: "players who liked this also liked"
+
+The ratings table is a sparse game x player matrix. Each rating is centered
+on its player's mean rating, so a generous player's 7 and a harsh player's
+7 mean different things, and two games are similar when the same players
+rated both above (or below) their own average:
+
+    similarity(a, b) = cos(a, b) * common / (common + SHRINKAGE)
+
+where `common` is how many players rated both; the shrinkage keeps a pair
+rated by one or two players from outranking a well-established one. Each
+game's TOP_K most similar games with a positive score are stored in
+SimilarGame and served by /games/<pk>/similar.
+
+With NumPy and SciPy installed the matrix is a scipy.sparse CSR matrix and
+similarities are computed BATCH_SIZE games at a time as sparse products,
+which handles a million ratings in seconds on one machine; without them a
+pure Python engine does the same sums, fine for small catalogs.
+
+`build_similar_games` runs from the build_similar_games command: a full
+build, or an incremental one that recomputes only the games rated since
+the last build. Scores of other games involving those games, and deleted
+ratings, are picked up by the next full build.
+"""
+import heapq
+import math
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from gamerraterapi.models import Rating, SimilarGame
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:  # pragma: no cover - numpy and scipy are optional
+    numpy = sparse = None
+
+DEFAULTS = {
+    # Neighbours stored per game
+    'TOP_K': 20,
+    # Players rating both games at which a pair keeps half its cosine
+    'SHRINKAGE': 5,
+    # Games whose similarities are computed in one sparse product
+    'BATCH_SIZE': 500,
+    # 'numpy', 'python', or None to use numpy when it's installed
+    'ENGINE': None,
+}
+
+# Rows written per bulk insert
+CHUNK_SIZE = 2000
+
+
+def get_setting(name):
+    return getattr(settings, 'GAMERRATER_RECOMMENDATIONS', {}).get(name, DEFAULTS[name])
+
+
+def engine():
+    """The engine similarities are computed with"""
+    configured = get_setting('ENGINE')
+    if configured is not None:
+        return configured
+
+    return 'numpy' if numpy is not None else 'python'
+
+
+def load_ratings():
+    """Every rating as parallel lists of game ids, player ids and values"""
+    games, players, values = [], [], []
+    rows = Rating.objects.values_list('game_id', 'player_id', 'rating').order_by()
+    for game_id, player_id, value in rows.iterator(chunk_size=10000):
+        games.append(game_id)
+        players.append(player_id)
+        values.append(value)
+
+    return games, players, values
+
+
+def python_neighbours(ratings, targets, top_k, shrinkage):
+    """Top `top_k` neighbours of each target game, in pure Python
+
+    Returns:
+        dict -- Game id -> [(similar game id, score)], best first
+    """
+    games, players, values = ratings
+    totals = defaultdict(lambda: [0, 0])
+    for player_id, value in zip(players, values):
+        totals[player_id][0] += value
+        totals[player_id][1] += 1
+
+    by_game, by_player = defaultdict(list), defaultdict(list)
+    for game_id, player_id, value in zip(games, players, values):
+        total, count = totals[player_id]
+        centered = value - total / count
+        by_game[game_id].append((player_id, centered))
+        by_player[player_id].append((game_id, centered))
+    norms = {
+        game_id: math.sqrt(sum(centered * centered for _, centered in row))
+        for game_id, row in by_game.items()
+    }
+
+    neighbours = {}
+    for game_id in targets:
+        if not norms.get(game_id):
+            neighbours[game_id] = []
+            continue
+
+        dots, common = defaultdict(float), defaultdict(int)
+        for player_id, centered in by_game[game_id]:
+            for other_id, other_centered in by_player[player_id]:
+                dots[other_id] += centered * other_centered
+                common[other_id] += 1
+
+        scores = []
+        for other_id, dot in dots.items():
+            if other_id == game_id or not norms[other_id]:
+                continue
+            score = dot / (norms[game_id] * norms[other_id])
+            score *= common[other_id] / (common[other_id] + shrinkage)
+            if score > 0:
+                scores.append((score, -other_id))
+        neighbours[game_id] = [
+            (-negated_id, score) for score, negated_id in heapq.nlargest(top_k, scores)]
+
+    return neighbours
+
+
+def numpy_neighbours(ratings, targets, top_k, shrinkage, batch_size):
+    """python_neighbours with a scipy.sparse matrix, a batch of games at a time"""
+    neighbours = {game_id: [] for game_id in targets}
+    games, players, values = (numpy.asarray(column) for column in ratings)
+    if not len(games) or not neighbours:
+        return neighbours
+
+    game_ids, game_index = numpy.unique(games, return_inverse=True)
+    player_ids, player_index = numpy.unique(players, return_inverse=True)
+    shape = (len(game_ids), len(player_ids))
+
+    means = numpy.bincount(player_index, weights=values) / numpy.bincount(player_index)
+    centered = values - means[player_index]
+    matrix = sparse.csr_matrix((centered, (game_index, player_index)), shape=shape)
+    norms = numpy.sqrt(numpy.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    inverse_norms = numpy.divide(1, norms, out=numpy.zeros_like(norms), where=norms > 0)
+    matrix = (sparse.diags(inverse_norms) @ matrix).tocsr()
+    rated = sparse.csr_matrix(
+        (numpy.ones(len(games)), (game_index, player_index)), shape=shape)
+    transposed, rated_transposed = matrix.T.tocsr(), rated.T.tocsr()
+
+    # Matrix rows of the targets that have ratings
+    wanted = numpy.asarray(targets, dtype=game_ids.dtype)
+    positions = numpy.minimum(numpy.searchsorted(game_ids, wanted), len(game_ids) - 1)
+    rows = positions[game_ids[positions] == wanted]
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        common = (rated[batch] @ rated_transposed).tocsr()
+        common.data = common.data / (common.data + shrinkage)
+        similarities = (matrix[batch] @ transposed).multiply(common).tocsr()
+        for offset, row in enumerate(batch):
+            begin, end = similarities.indptr[offset], similarities.indptr[offset + 1]
+            indices = similarities.indices[begin:end]
+            scores = similarities.data[begin:end]
+            keep = (indices != row) & (scores > 0)
+            indices, scores = indices[keep], scores[keep]
+            if len(scores) > top_k:
+                best = numpy.argpartition(-scores, top_k - 1)[:top_k]
+                indices, scores = indices[best], scores[best]
+            # Best first, ties by game id
+            order = numpy.lexsort((game_ids[indices], -scores))
+            neighbours[int(game_ids[row])] = [
+                (int(game_ids[indices[i]]), float(scores[i])) for i in order]
+
+    return neighbours
+
+
+def compute_neighbours(ratings, targets):
+    """Top-K neighbours of the target games with the configured engine"""
+    top_k, shrinkage = get_setting('TOP_K'), get_setting('SHRINKAGE')
+    if engine() == 'numpy':
+        return numpy_neighbours(ratings, targets, top_k, shrinkage, get_setting('BATCH_SIZE'))
+
+    return python_neighbours(ratings, targets, top_k, shrinkage)
+
+
+def save_neighbours(neighbours, now):
+    """Replace the stored neighbours of every game in `neighbours`"""
+    game_ids = list(neighbours)
+    rows = [
+        SimilarGame(game_id=game_id, similar_id=similar_id, score=score, computed_at=now)
+        for game_id, similar in neighbours.items()
+        for similar_id, score in similar
+    ]
+    with transaction.atomic():
+        for start in range(0, len(game_ids), CHUNK_SIZE):
+            SimilarGame.objects.filter(game_id__in=game_ids[start:start + CHUNK_SIZE]).delete()
+        SimilarGame.objects.bulk_create(rows, batch_size=CHUNK_SIZE)
+
+
+def changed_games(since):
+    """Games with ratings written since `since`"""
+    return set(Rating.objects.filter(updated_at__gte=since).values_list(
+        'game_id', flat=True).distinct().order_by())
+
+
+def build_similar_games(incremental=False):
+    """Compute and store the neighbours of every rated game
+
+    Arguments:
+        incremental -- Only recompute games rated since the last build (a
+                       full build when there hasn't been one)
+    Returns:
+        int -- The number of games whose neighbours were computed
+    """
+    now = timezone.now()
+    since = SimilarGame.objects.aggregate(last=Max('computed_at'))['last'] if incremental else None
+    ratings = load_ratings()
+    targets = set(ratings[0]) if since is None else changed_games(since)
+    neighbours = compute_neighbours(ratings, sorted(targets))
+
+    with transaction.atomic():
+        if since is None:
+            SimilarGame.objects.all().delete()
+        save_neighbours(neighbours, now)
+
+    return len(targets)
@@ -0,0 +1,35 @@
+"""Response renderers"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer that encodes with orjson when it's installed
+
+    Output matches JSONRenderer's compact output byte for byte for the data
+    this API returns: dates and times still go through DRF's encoder, and
+    U+2028/U+2029 are escaped the same way. Indented output, data orjson
+    can't encode (non-string keys, integers over 64 bits) and a missing
+    orjson fall back to JSONRenderer. Floats that Python writes with an
+    exponent (1e+16) come out in orjson's spelling (1e16), and NaN renders
+    as null instead of raising.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,141 @@
+"""Read replica routing with read-your-writes consistency
+
+Reads the API makes while answering a GET or HEAD go to one of the replica
+databases in GAMERRATER_DB_ROUTING['REPLICAS']; everything else (writes,
+reads inside write requests, management commands, signal receivers) uses
+the primary, `default`. Tokens, users and sessions are always read from
+the primary, so a player can use a token the moment it's issued.
+
+Replicas lag the primary, so a player who just wrote something is sticky:
+for STICKY_SECONDS after a successful write request, their reads go to the
+primary too. Players are told apart by their auth token, so stickiness
+needs no database lookup and is shared between processes through the
+cache. Within the same window after any write, responses built from a
+replica aren't stored in the response cache (see gamerraterapi.cache), so
+a lagging replica can't cache stale data under the new versions.
+
+With no replicas configured, everything reads from the primary.
+"""
+import hashlib
+import random
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.authentication import get_authorization_header
+
+DEFAULTS = {
+    # Database aliases reads may be sent to
+    'REPLICAS': [],
+    # Seconds a player's reads stay on the primary after they write
+    'STICKY_SECONDS': 5,
+    # Alias of the cache sticky players are tracked in
+    'CACHE': 'default',
+}
+
+# Only models of this app are read from replicas
+REPLICATED_APPS = {'gamerraterapi'}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# The replica the current request reads from, or None for the primary
+replica = ContextVar('gamerrater_replica', default=None)
+
+
+def get_setting(name):
+    return getattr(settings, 'GAMERRATER_DB_ROUTING', {}).get(name, DEFAULTS[name])
+
+
+def current_replica():
+    """The replica alias the current request reads from, or None"""
+    return replica.get()
+
+
+def token_key(request):
+    """The auth token sent with a request, or None"""
+    auth = get_authorization_header(request).split()
+    if len(auth) != 2 or auth[0].lower() != b'token':
+        return None
+
+    return auth[1].decode(errors='replace')
+
+
+def sticky_key(key):
+    digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+    return f'gamerrater:sticky:{digest}'
+
+
+def mark_sticky(key):
+    """Send this token's reads to the primary for the next STICKY_SECONDS"""
+    caches[get_setting('CACHE')].set(sticky_key(key), True, get_setting('STICKY_SECONDS'))
+
+
+def is_sticky(key):
+    return caches[get_setting('CACHE')].get(sticky_key(key)) is not None
+
+
+def choose_replica(request):
+    """The replica to answer a request from, or None to use the primary"""
+    replicas = get_setting('REPLICAS')
+    if not replicas or request.method not in SAFE_METHODS:
+        return None
+
+    key = token_key(request)
+    if key is not None and is_sticky(key):
+        return None
+
+    return random.choice(replicas)
+
+
+def request_finished(request, response):
+    if request.method in SAFE_METHODS or response.status_code >= 400:
+        return
+
+    key = token_key(request)
+    if key is not None and get_setting('REPLICAS'):
+        mark_sticky(key)
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    """Route the request's reads, and make players sticky after they write"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = replica.set(choose_replica(request))
+            try:
+                response = await get_response(request)
+            finally:
+                replica.reset(token)
+            request_finished(request, response)
+            return response
+
+        return markcoroutinefunction(middleware)
+
+    def middleware(request):
+        token = replica.set(choose_replica(request))
+        try:
+            response = get_response(request)
+        finally:
+            replica.reset(token)
+        request_finished(request, response)
+        return response
+
+    return middleware
+
+
+class ReplicaRouter:
+    """Database router sending the current request's reads to its replica"""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in REPLICATED_APPS:
+            return replica.get()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
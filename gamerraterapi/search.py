@@ -0,0 +1,108 @@
+"""Full-text search over games
+
+On SQLite, games are indexed in an FTS5 table (`gamerraterapi_game_fts`) keyed
+by game id, covering title, description, designer and category labels. The
+index is kept in sync by the receivers in `gamerraterapi.signals`. Other
+databases fall back to a `__icontains` filter over the same columns.
+
+Searches filter and rank inside the games query, so every match can be
+ordered, paginated and streamed like any other list of games.
+"""
+import re
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'gamerraterapi_game_fts'
+
+# Game columns copied into the index
+INDEXED_FIELDS = frozenset(('title', 'description', 'designer'))
+
+# bm25 column weights: title, description, designer, categories
+RANK_WEIGHTS = (10.0, 1.0, 4.0, 2.0)
+
+CREATE_INDEX_SQL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description, designer, categories,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+DROP_INDEX_SQL = f'DROP TABLE IF EXISTS {FTS_TABLE}'
+
+# Builds index rows straight from the game tables, so (re)indexing never
+# loads games into Python
+INDEX_ROWS_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, description, designer, categories)
+    SELECT g.id, g.title, g.description, g.designer,
+           COALESCE((SELECT group_concat(c.label, ' ')
+                     FROM gamerraterapi_gamecategory gc
+                     JOIN gamerraterapi_category c ON c.id = gc.category_id
+                     WHERE gc.game_id = g.id), '')
+    FROM gamerraterapi_game g
+"""
+
+
+def fts_enabled(using=None):
+    """Whether the FTS5 index is used for this database connection"""
+    return (using or connection).vendor == 'sqlite'
+
+
+def rebuild_index(cursor):
+    """Drop every index row and reindex all games"""
+    cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    cursor.execute(INDEX_ROWS_SQL)
+
+
+def index_games(game_ids):
+    """Reindex the given games, dropping rows for games that no longer exist"""
+    game_ids = list(game_ids)
+    if not game_ids or not fts_enabled():
+        return
+
+    placeholders = ', '.join(['%s'] * len(game_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', game_ids)
+        cursor.execute(
+            f'{INDEX_ROWS_SQL} WHERE g.id IN ({placeholders})', game_ids)
+
+
+def match_expression(text):
+    """Turn free text into an FTS5 query that prefix-matches every word
+
+    `catan sett` becomes `"catan"* "sett"*`: every word must match the start
+    of some token. Quoting each word keeps FTS5 syntax in user input inert.
+    """
+    words = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_games(games, text):
+    """Filter games to those matching the search text, ranked in SQL
+
+    The index is joined into the games query (through GameSearchIndex), so
+    SQLite drives the query from the full-text match.
+    Arguments:
+        games -- Games queryset to search within
+        text -- Free text search entered by the user
+    Returns:
+        QuerySet -- The matching games, annotated with `search_rank`: their
+                    bm25 score, lower for better matches
+    """
+    expression = match_expression(text)
+    if not expression:
+        return games.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    return games.filter(search_index__document__match=expression).annotate(
+        search_rank=RawSQL(f'bm25({FTS_TABLE}, {weights})', [], output_field=FloatField()))
+
+
+def contains_filter(text):
+    """The unindexed `__icontains` search used when FTS5 is unavailable"""
+    return (Q(title__icontains=text) |
+            Q(description__icontains=text) |
+            Q(designer__icontains=text) |
+            Q(categories__label__icontains=text))
@@ -0,0 +1,132 @@
+"""Sparse fields and expansion controls for API responses
+
+    /ratings?fields=id,rating             -- only these fields
+    /ratings?fields=id,game.title         -- nested fields are dotted
+    /ratings?expand=                      -- every relation as its id
+    /ratings?expand=game                  -- nest the game, other relations as ids
+    /ratings?expand=game,player.user      -- nest the player and its user too
+
+Without `expand`, relations are nested the way they always have been. Unknown
+field names are ignored. The same shape drives the queryset: relations that
+aren't nested aren't joined or prefetched, and columns behind fields that are
+left out aren't selected.
+"""
+from rest_framework import serializers
+
+
+def parse_paths(value):
+    """Parse 'a,b.c,b.d' into {'a': None, 'b': {'c': None, 'd': None}}"""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        names = [name.strip() for name in path.split('.')]
+        if not all(names):
+            continue
+        for name in names[:-1]:
+            if node.get(name) is None:
+                node[name] = {}
+            node = node[name]
+        node.setdefault(names[-1], None)
+
+    return tree
+
+
+class Shape:
+    """The fields and nesting a client asked for
+
+    Arguments:
+        fields -- Tree of field names to keep, or None for every field
+        expand -- Tree of relations to nest, or None for the default nesting
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand
+
+    @classmethod
+    def from_request(cls, request):
+        """The shape requested by ?fields= and ?expand=, or None if neither is given"""
+        params = getattr(request, 'query_params', {})
+        if 'fields' not in params and 'expand' not in params:
+            return None
+
+        return cls(
+            parse_paths(params['fields']) if 'fields' in params else None,
+            parse_paths(params['expand']) if 'expand' in params else None)
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name):
+        return self.includes(name) and (self.expand is None or name in self.expand)
+
+    def child(self, name):
+        """The shape of a nested relation"""
+        return Shape(
+            None if self.fields is None else self.fields.get(name),
+            None if self.expand is None else self.expand.get(name) or {})
+
+    def apply(self, fields):
+        """Drop, collapse and trim the fields of a serializer in place"""
+        for name in list(fields):
+            if not self.includes(name):
+                del fields[name]
+                continue
+
+            field = fields[name]
+            many = isinstance(field, serializers.ListSerializer)
+            nested = field.child if many else field
+            if not isinstance(nested, serializers.BaseSerializer):
+                continue
+
+            if not self.expands(name):
+                fields[name] = serializers.PrimaryKeyRelatedField(
+                    many=many, read_only=True,
+                    source=None if field.source == name else field.source)
+            elif isinstance(nested, ShapedSerializerMixin):
+                # Applied when the nested serializer builds its own fields
+                nested.shape = self.child(name)
+            else:
+                self.child(name).apply(nested.fields)
+
+
+class ShapedSerializerMixin:
+    """Serializer mixin that honours the request's ?fields= and ?expand="""
+
+    shape = None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        shape = self.shape
+        if shape is None and self.is_root():
+            shape = Shape.from_request(self.context.get('request'))
+        if shape is not None:
+            shape.apply(fields)
+
+        return fields
+
+    def is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+
+def defer_unused(queryset, shape, columns, keep=()):
+    """Defer the model columns behind fields a shape leaves out
+
+    Arguments:
+        queryset -- Rows to be serialized
+        shape -- The requested Shape, or None
+        columns -- Map of each serialized field to the model fields it reads
+        keep -- Model fields that must stay loaded, like the sort keys
+    """
+    if shape is None:
+        return queryset
+
+    deferred = {
+        column
+        for name, model_fields in columns.items() if not shape.includes(name)
+        for column in model_fields
+    }.difference(keep)
+    return queryset.defer(*deferred) if deferred else queryset
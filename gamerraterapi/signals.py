@@ -0,0 +1,117 @@
+"""Signal receivers that keep derived data in sync with the models"""
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from gamerraterapi import authentication, feeds, rankings, search
+from gamerraterapi.models import Category, Game, GameCategory, Player, Rating, Review
+
+
+@receiver(post_save, sender=Game)
+def index_saved_game(sender, instance, update_fields=None, **kwargs):
+    # Saves that only touch unindexed columns (e.g. rating aggregates) skip the reindex
+    if update_fields is not None and not search.INDEXED_FIELDS.intersection(update_fields):
+        return
+    search.index_games([instance.pk])
+
+
+@receiver(post_delete, sender=Game)
+def unindex_deleted_game(sender, instance, **kwargs):
+    search.index_games([instance.pk])
+
+
+@receiver(post_save, sender=GameCategory)
+@receiver(post_delete, sender=GameCategory)
+def index_game_category(sender, instance, **kwargs):
+    search.index_games([instance.game_id])
+
+
+@receiver(m2m_changed, sender=Game.categories.through)
+def index_game_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        search.index_games([instance.pk])
+    elif pk_set:
+        search.index_games(pk_set)
+
+
+@receiver(post_save, sender=Category)
+def index_category_games(sender, instance, created, **kwargs):
+    if not created:
+        search.index_games(
+            GameCategory.objects.filter(category=instance).values_list('game_id', flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_games(sender, instance, **kwargs):
+    # The game links are gone by post_delete, so collect them first
+    instance.indexed_game_ids = list(
+        GameCategory.objects.filter(category=instance).values_list('game_id', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def index_deleted_category_games(sender, instance, **kwargs):
+    search.index_games(getattr(instance, 'indexed_game_ids', []))
+
+
+@receiver(post_save, sender=Rating)
+def rerank_rated_game(sender, instance, **kwargs):
+    rankings.refresh_rankings_on_commit([instance.game_id], [rankings.rating_event(instance)])
+
+
+@receiver(post_save, sender=Review)
+def rerank_reviewed_game(sender, instance, created, **kwargs):
+    events = [rankings.review_event(instance)] if created else []
+    rankings.refresh_rankings_on_commit([instance.game_id], events)
+
+
+@receiver(post_save, sender=Rating)
+def adjust_player_affinity(sender, instance, created, **kwargs):
+    removed = None if created else getattr(instance, 'stored_rating', None)
+    if created or removed is not None:
+        feeds.adjust_affinities([(instance.player_id, instance.game_id, removed, instance.rating)])
+    else:
+        # Saved without knowing the value it replaced
+        feeds.refresh_affinities_on_commit([instance.player_id])
+    instance.stored_rating = instance.rating
+
+
+# Ratings and reviews have no delete receivers, so the cascade deleting a
+# game's or player's takes them in one query rather than row by row; what's
+# derived from them is adjusted here once per game or player instead, and
+# by RatingsView.destroy for a single rating. A deleted review's trending
+# weight leaves with the next recompute_rankings
+@receiver(pre_delete, sender=Game)
+def forget_game_ratings(sender, instance, **kwargs):
+    feeds.adjust_affinities(
+        (player_id, instance.pk, rating, None)
+        for player_id, rating in Rating.objects.filter(game=instance).values_list(
+            'player_id', 'rating'))
+
+
+@receiver(pre_delete, sender=Player)
+def forget_player_ratings(sender, instance, **kwargs):
+    ratings = list(Rating.objects.filter(player=instance).values_list('game_id', 'rating'))
+    Game.apply_rating_changes((game_id, rating, None) for game_id, rating in ratings)
+    rankings.refresh_rankings_on_commit(game_id for game_id, _ in ratings)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    authentication.forget_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_tokens(sender, instance, **kwargs):
+    authentication.forget_tokens(
+        Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+
+
+@receiver(post_save, sender=Player)
+@receiver(post_delete, sender=Player)
+def forget_player_tokens(sender, instance, **kwargs):
+    authentication.forget_tokens(
+        Token.objects.filter(user_id=instance.user_id).values_list('key', flat=True))
@@ -0,0 +1,94 @@
+"""Rating statistics for a single game
+
+Count, mean, median, standard deviation and the histogram all come from the
+aggregates stored on the game (rating_count, rating_sum, rating_histogram),
+so they cost the same for a game with ten ratings or ten million. Median
+and standard deviation are worked out from the histogram, which covers the
+1-10 scale.
+
+The recent-window averages are one SQL aggregate over the game's ratings
+updated within the longest window, read off the (game, updated_at) index,
+so only recent ratings are ever visited.
+"""
+import math
+from datetime import timedelta
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+from gamerraterapi.models import Rating
+from gamerraterapi.models.game import RATING_SCALE
+
+# Days covered by each recent-window average
+WINDOW_DAYS = (7, 30, 90)
+
+
+def histogram_median(histogram):
+    """Median rating of a histogram with one bucket per rating value, or None"""
+    total = sum(histogram)
+    if total == 0:
+        return None
+
+    def value_at(position):
+        seen = 0
+        for value, count in zip(RATING_SCALE, histogram):
+            seen += count
+            if seen > position:
+                return value
+        return RATING_SCALE[-1]
+
+    # Average of the two middle ratings when the count is even
+    return (value_at((total - 1) // 2) + value_at(total // 2)) / 2
+
+
+def histogram_stddev(histogram):
+    """Population standard deviation of a histogram's ratings, or None"""
+    total = sum(histogram)
+    if total == 0:
+        return None
+
+    mean = sum(value * count for value, count in zip(RATING_SCALE, histogram)) / total
+    variance = sum(
+        count * (value - mean) ** 2 for value, count in zip(RATING_SCALE, histogram)) / total
+    return math.sqrt(variance)
+
+
+def recent_averages(game_id, now=None):
+    """Number and mean of a game's ratings updated within each of WINDOW_DAYS
+
+    Returns:
+        list -- {'days', 'count', 'mean'} per window; mean is None when empty
+    """
+    now = now or timezone.now()
+    since = {days: now - timedelta(days=days) for days in WINDOW_DAYS}
+    aggregates = {}
+    for days in WINDOW_DAYS:
+        window = Q(updated_at__gte=since[days])
+        aggregates[f'count_{days}'] = Count('id', filter=window)
+        aggregates[f'mean_{days}'] = Avg('rating', filter=window)
+
+    totals = Rating.objects.filter(
+        game_id=game_id, updated_at__gte=since[max(WINDOW_DAYS)]).aggregate(**aggregates)
+    return [
+        {'days': days, 'count': totals[f'count_{days}'], 'mean': totals[f'mean_{days}']}
+        for days in WINDOW_DAYS
+    ]
+
+
+def game_stats(game, now=None):
+    """The rating statistics served by /games/<pk>/stats
+
+    Arguments:
+        game -- Game with its rating aggregates loaded
+    """
+    histogram = list(game.rating_histogram)
+    return {
+        'game': game.id,
+        'count': game.rating_count,
+        'mean': game.rating_average if game.rating_count else None,
+        'median': histogram_median(histogram),
+        'stddev': histogram_stddev(histogram),
+        'histogram': [
+            {'rating': value, 'count': count}
+            for value, count in zip(RATING_SCALE, histogram)
+        ],
+        'recent': recent_averages(game.id, now),
+    }
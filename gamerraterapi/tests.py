@@ -1,3 +1,1729 @@
-from django.test import TestCase
+import io
+import json
+import random
+import statistics
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import skipUnless
+from unittest.mock import patch
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import QueryDict
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from gamerraterapi import (
+    authentication, benchmarks, cache, feeds, metrics, pagination, pictures, rankings,
+    recommendations, search, throttling, writebehind)
+from gamerraterapi.bulk import upsert_ratings
+from gamerraterapi.filters import filter_games
+from gamerraterapi.views import GameView
+from gamerraterapi.models import (
+    Category, Game, GameCategory, GameRanking, Picture, Player, PlayerAffinity, Rating, Review,
+    SimilarGame)
 
-# Create your tests here.
+
+def make_games(count, categories=()):
+    """Bulk create `count` games, each linked to every given category"""
+    games = Game.objects.bulk_create([
+        Game(title=f'Game {i}', description='A game', designer='Designer',
+             year_released=2000 + i % 20, num_players=2 + i % 6,
+             gameplay_length=30 + i % 90, age=6 + i % 12,
+             rating_count=i % 5, rating_sum=(i % 5) * 7,
+             rating_average=7 if i % 5 else 0)
+        for i in range(count)
+    ])
+    GameCategory.objects.bulk_create([
+        GameCategory(game=game, category=category)
+        for game in games for category in categories
+    ])
+    return games
+
+
+class AuthenticatedTestCase(APITestCase):
+    """Test case with a player whose token is sent on every request"""
+
+    def setUp(self):
+        # Tests write through the ORM, which doesn't bump cached response
+        # versions, so start every test from an empty response cache
+        cache.get_cache().clear()
+        authentication.tokens.clear()
+        throttling.buckets.clear()
+        self.user = User.objects.create_user(
+            username='gamer', password='password', first_name='Gina', last_name='Gamer')
+        self.player = Player.objects.create(user=self.user, bio='Plays games')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+class GameQueryCountTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.categories = [Category.objects.create(label=label)
+                           for label in ('Strategy', 'Party')]
+        # Warm the token cache so only the endpoint's own queries are counted
+        authentication.get_token(self.token.key)
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/games')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_list_query_count_is_independent_of_game_count(self):
+        make_games(10, self.categories)
+        small_count, small_body = self.count_list_queries()
+
+        make_games(9990, self.categories)
+        cache.bump('games')
+        large_count, large_body = self.count_list_queries()
+
+        self.assertEqual(len(small_body), 10)
+        self.assertEqual(len(large_body), 10000)
+        self.assertEqual(small_count, large_count)
+
+    def test_list_serializes_categories_and_average(self):
+        make_games(3, self.categories)
+        _, body = self.count_list_queries()
+
+        self.assertEqual(body[1]['categories'], [
+            {'id': category.id, 'label': category.label} for category in self.categories])
+        self.assertEqual(body[1]['average_rating'], 7.0)
+        self.assertEqual(body[0]['average_rating'], 0)
+
+    def test_retrieve_query_count_is_independent_of_category_count(self):
+        game = make_games(1, self.categories)[0]
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(f'/games/{game.id}')
+
+        more = [Category.objects.create(label=f'Label {i}') for i in range(20)]
+        game.categories.add(*more)
+        cache.bump('games')
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(f'/games/{game.id}')
+
+        self.assertEqual(len(response.json()['categories']), 22)
+        self.assertEqual(len(few), len(many))
+
+
+class GameFilterTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.strategy, self.party = [Category.objects.create(label=label)
+                                     for label in ('Strategy', 'Party')]
+        self.games = make_games(40)
+        GameCategory.objects.bulk_create(
+            [GameCategory(game=game, category=self.strategy) for game in self.games[:10]] +
+            [GameCategory(game=game, category=self.party) for game in self.games[5:15]])
+
+    def ids(self, **params):
+        response = self.client.get('/games', params)
+        self.assertEqual(response.status_code, 200)
+        return [game['id'] for game in response.json()]
+
+    def test_filters_are_applied_together(self):
+        expected = [game.id for game in self.games
+                    if 3 <= game.num_players <= 4 and game.age <= 10
+                    and 2005 <= game.year_released <= 2010 and game.rating_average >= 7]
+        self.assertEqual(self.ids(numPlayersMin=3, numPlayersMax=4, age=10,
+                                  yearReleasedMin=2005, yearReleasedMax=2010,
+                                  minRating=7), expected)
+        self.assertTrue(expected)
+
+    def test_category_filter_matches_any_category_once(self):
+        self.assertEqual(self.ids(category=self.strategy.id),
+                         [game.id for game in self.games[:10]])
+        self.assertEqual(self.ids(category=f'{self.strategy.id},{self.party.id}'),
+                         [game.id for game in self.games[:15]])
+
+    def test_orders_by_rating_average(self):
+        Game.objects.filter(pk=self.games[3].pk).update(rating_average=9.5)
+        ids = self.ids(orderby='-rating', gameplayLengthMax=40)
+        self.assertEqual(ids[0], self.games[3].id)
+
+    def test_rejects_bad_values(self):
+        self.assertEqual(self.client.get('/games', {'age': 'ten'}).status_code, 400)
+        self.assertEqual(self.client.get('/games', {'orderby': 'designer'}).status_code, 400)
+
+    def test_common_filters_use_indexes(self):
+        make_games(2000)
+        filters = [
+            {'category': str(self.strategy.id)},
+            {'numPlayersMin': '3', 'numPlayersMax': '4'},
+            {'yearReleasedMin': '2015'},
+            {'age': '7'},
+            {'gameplayLengthMax': '35'},
+            {'minRating': '7'},
+        ]
+        for params in filters:
+            with self.subTest(params=params):
+                query_params = QueryDict(mutable=True)
+                query_params.update(params)
+                plan = filter_games(Game.objects.for_api(), query_params).explain()
+                # Each filter narrows the games by an index, rather than reading
+                # every row (SCAN) or walking a whole index (SCAN ... USING INDEX)
+                self.assertNotIn('SCAN', plan)
+                self.assertRegex(plan, r'SEARCH \w+ USING (COVERING )?INDEX \w+ \(')
+
+
+class ResponseShapingTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(label='Strategy')
+        self.games = make_games(5, [category])
+        for game in self.games:
+            Rating.objects.create(game=game, player=self.player, rating=7)
+            Review.objects.create(game=game, player=self.player, review='Fun',
+                                  date=timezone.now())
+        authentication.get_token(self.token.key)
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries]
+
+    def test_sparse_fields(self):
+        response, queries = self.get('/games', fields='id,title')
+        self.assertEqual(response.json()[0], {'id': self.games[0].id, 'title': 'Game 0'})
+        full, full_queries = self.get('/games')
+        # No categories prefetch, and the unused columns stay in the database
+        self.assertEqual(len(queries), len(full_queries) - 1)
+        self.assertNotIn('description', queries[-1])
+        self.assertLess(len(response.content), len(full.content) / 3)
+
+    def test_relations_collapse_to_ids_unless_expanded(self):
+        response, queries = self.get('/ratings', expand='')
+        rating = response.json()[0]
+        self.assertEqual((rating['game'], rating['player']), (self.games[0].id, self.player.id))
+        self.assertNotIn('JOIN', queries[-1])
+
+        rating = self.get('/ratings', expand='game', fields='id,game.title,player')[0].json()[0]
+        self.assertEqual(rating, {'id': rating['id'], 'game': {'title': 'Game 0'},
+                                  'player': self.player.id})
+
+        player = self.get('/ratings', expand='player')[0].json()[0]['player']
+        self.assertEqual(player, {'user': self.user.id})
+        player = self.get('/ratings', expand='player.user')[0].json()[0]['player']
+        self.assertEqual(player, {'user': {'first_name': 'Gina', 'last_name': 'Gamer'}})
+
+    def test_review_game_expansion_drives_prefetch(self):
+        _, full_queries = self.get('/reviews')
+        response, queries = self.get('/reviews', expand='player.user')
+        self.assertEqual(response.json()[0]['game'], self.games[0].id)
+        self.assertEqual(len(queries), len(full_queries) - 1)
+
+    def test_review_game_keeps_its_original_fields(self):
+        game = self.get('/reviews')[0].json()[0]['game']
+        self.assertEqual(set(game), {'id', 'title', 'description', 'designer', 'year_released',
+                                     'num_players', 'gameplay_length', 'age', 'categories'})
+        self.assertTrue(all(isinstance(category, int) for category in game['categories']))
+
+
+class ValuesSerializationTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        categories = [Category.objects.create(label=label) for label in ('Strategy', 'Ünïcode')]
+        self.games = make_games(6, categories)
+        Game.objects.filter(pk=self.games[0].pk).update(
+            title='Line\u2028break "quoted"', rating_count=3, rating_sum=22)
+        for game in self.games:
+            Rating.objects.create(game=game, player=self.player, rating=game.id % 10 + 1)
+
+    def get_both(self, url, **params):
+        """The response body from the values path and from the ModelSerializer path"""
+        def body(response):
+            if response.streaming:
+                return b''.join(response.streaming_content)
+            return response.content
+
+        fast = body(self.client.get(url, params))
+        cache.get_cache().clear()
+        with self.settings(GAMERRATER_VALUES_SERIALIZATION=False):
+            slow = body(self.client.get(url, params))
+        cache.get_cache().clear()
+        return fast, slow
+
+    def test_values_path_matches_model_serializers_byte_for_byte(self):
+        for url, params in [('/games', {}), ('/games', {'limit': 2, 'orderby': '-title'}),
+                            ('/games', {'stream': 1}), ('/games', {'q': 'game'}),
+                            ('/ratings', {}), ('/ratings', {'limit': 4, 'orderby': 'rating'}),
+                            ('/ratings', {'stream': 1})]:
+            with self.subTest(url=url, params=params):
+                fast, slow = self.get_both(url, **params)
+                self.assertEqual(fast, slow)
+
+        # The values path only selects the columns it serializes
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/ratings')
+        self.assertNotIn('"auth_user"."password"', queries[-1]['sql'])
+
+    def test_orjson_renderer_matches_json_renderer(self):
+        from rest_framework.renderers import JSONRenderer
+        from gamerraterapi.renderers import ORJSONRenderer
+        data = {'title': 'Line\u2028break', 'date': timezone.now(), 'average': 22 / 3,
+                'nested': [{'ok': True, 'none': None}], 7: 'non-string key'}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class AsyncReadTests(AuthenticatedTestCase):
+    """The native async reads served by gamerrater.asgi_urls"""
+
+    def setUp(self):
+        super().setUp()
+        categories = [Category.objects.create(label=label) for label in ('Strategy', 'Party')]
+        self.games = make_games(4, categories)
+        for game in self.games:
+            Rating.objects.create(game=game, player=self.player, rating=game.id % 10 + 1)
+            Review.objects.create(game=game, player=self.player, review='Fun',
+                                  date=timezone.now())
+        self.review = Review.objects.first()
+        self.headers = {'Authorization': f'Token {self.token.key}'}
+
+    def body(self, response):
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    async def async_body(self, response):
+        if response.streaming:
+            return b''.join([chunk async for chunk in response.streaming_content])
+        return response.content
+
+    async def test_async_reads_match_the_viewsets(self):
+        urls = [
+            ('/games', {}), ('/games', {'limit': 2, 'orderby': '-title'}),
+            ('/games', {'q': 'game'}), ('/games', {'stream': 1}),
+            (f'/games/{self.games[1].id}', {}),
+            ('/ratings', {'limit': 3}), ('/ratings', {'gameId': self.games[0].id}),
+            ('/reviews', {}), ('/reviews', {'limit': 2, 'orderby': '-date'}),
+            (f'/reviews/{self.review.id}', {}),
+            ('/categories', {}),
+        ]
+        for url, params in urls:
+            # Versions restart at the same value after each clear, so list ETags match
+            with self.subTest(url=url, params=params), \
+                    patch('gamerraterapi.cache.time.time_ns', return_value=1):
+                await cache.get_cache().aclear()
+                expected = await sync_to_async(self.client.get)(url, params)
+                await cache.get_cache().aclear()
+                with (self.settings(ROOT_URLCONF='gamerrater.asgi_urls'),
+                      patch.object(GameView, 'list', side_effect=AssertionError)):
+                    response = await self.async_client.get(url, params, headers=self.headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(await self.async_body(response),
+                                 await sync_to_async(self.body)(expected))
+                self.assertEqual(response.get('ETag'), expected.get('ETag'))
+
+    @override_settings(ROOT_URLCONF='gamerrater.asgi_urls')
+    def test_warm_reads_stay_on_the_event_loop(self):
+        get = async_to_sync(self.async_client.get)
+        get('/games', headers=self.headers)
+        with self.assertNumQueries(0):
+            response = get('/games', headers=self.headers)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+        response = get('/games', headers={**self.headers, 'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(ROOT_URLCONF='gamerrater.asgi_urls')
+    async def test_authentication(self):
+        response = await self.async_client.get('/games')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        response = await self.async_client.get(
+            '/games', headers={'Authorization': 'Token nope'})
+        self.assertEqual(response.json(), {'detail': 'Invalid token.'})
+        response = await self.async_client.get(f'/games/{self.games[0].id + 100}',
+                                                headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(ROOT_URLCONF='gamerrater.asgi_urls')
+    async def test_writes_and_shaped_reads_go_to_the_viewsets(self):
+        response = await self.async_client.post(
+            '/ratings', {'gameId': self.games[0].id, 'rating': 3},
+            content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(
+            '/games', {'fields': 'id'}, headers=self.headers)
+        self.assertEqual(response.json()[0], {'id': self.games[0].id})
+
+
+class KeysetPaginationTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.games = make_games(25)
+
+    def walk(self, params):
+        """Follow `next` cursors until the last page, returning every id seen"""
+        seen = []
+        response = self.client.get('/games', params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            seen.extend(game['id'] for game in body['results'])
+            if body['next'] is None:
+                return seen
+            response = self.client.get('/games', {**params, 'cursor': body['next']})
+
+    def test_walks_every_game_once_by_id(self):
+        self.assertEqual(self.walk({'limit': 7}), [game.id for game in self.games])
+
+    def test_walks_descending_sort_key_with_ties(self):
+        ids = self.walk({'limit': 4, 'orderby': '-year_released'})
+        expected = sorted(self.games, key=lambda game: (-game.year_released, -game.id))
+        self.assertEqual(ids, [game.id for game in expected])
+
+    def test_rejects_cursor_from_another_ordering(self):
+        cursor = self.client.get('/games', {'limit': 5}).json()['next']
+        response = self.client.get('/games', {'orderby': 'title', 'cursor': cursor})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_unknown_sort_key(self):
+        response = self.client.get('/games', {'orderby': 'description'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_tampered_cursors(self):
+        cursors = [
+            ('id', 1, 'abc'), ('id', 1, 2.5), ('id', 1, True), ('title', [], 3),
+            ('year_released', 'abc', 3), ('rating', 'high', 3), ('rating', None, 3),
+        ]
+        for ordering, value, pk in cursors:
+            with self.subTest(ordering=ordering, value=value, pk=pk):
+                cursor = pagination.encode_cursor(ordering, value, pk)
+                for urlconf in ('gamerrater.urls', 'gamerrater.asgi_urls'):
+                    with override_settings(ROOT_URLCONF=urlconf):
+                        response = self.client.get(
+                            '/games', {'orderby': ordering, 'limit': 5, 'cursor': cursor})
+                    self.assertEqual(response.status_code, 400)
+
+    def test_stream_writes_one_json_object_per_line(self):
+        response = self.client.get('/games', {'stream': '1'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines],
+                         [game.id for game in self.games])
+
+    def test_unpaginated_list_is_unchanged(self):
+        body = self.client.get('/games').json()
+        self.assertEqual([game['id'] for game in body], [game.id for game in self.games])
+
+
+class GameSearchTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.strategy = Category.objects.create(label='Strategy')
+        self.catan = Game.objects.create(
+            title='Settlers of Catan', description='Trade and build', designer='Teuber',
+            year_released=1995, num_players=4, gameplay_length=90, age=10)
+        self.ticket = Game.objects.create(
+            title='Ticket to Ride', description='Build railroads across Catan-free lands',
+            designer='Moon', year_released=2004, num_players=5, gameplay_length=60, age=8)
+
+    def search(self, text):
+        response = self.client.get('/games', {'q': text})
+        self.assertEqual(response.status_code, 200)
+        return [game['id'] for game in response.json()]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.search('catan'), [self.catan.id, self.ticket.id])
+
+    def test_matches_word_prefixes(self):
+        self.assertEqual(self.search('settl'), [self.catan.id])
+        self.assertEqual(self.search('rail tick'), [self.ticket.id])
+
+    def test_ignores_fts_syntax_in_input(self):
+        self.assertEqual(self.search('moon")*('), [self.ticket.id])
+        self.assertEqual(self.search('  '), [])
+
+    def test_index_follows_edits_and_category_changes(self):
+        self.catan.title = 'Catan Junior'
+        self.catan.save()
+        self.assertEqual(self.search('junior'), [self.catan.id])
+        self.assertEqual(self.search('settlers'), [])
+
+        self.ticket.categories.add(self.strategy)
+        self.assertEqual(self.search('strategy'), [self.ticket.id])
+
+        self.strategy.label = 'Trains'
+        self.strategy.save()
+        self.assertEqual(self.search('trains'), [self.ticket.id])
+
+        self.strategy.delete()
+        cache.bump('games')
+        self.assertEqual(self.search('trains'), [])
+
+        self.ticket.delete()
+        self.assertEqual(self.search('ride'), [])
+
+    def test_pages_through_every_match(self):
+        games = make_games(600)
+        with connection.cursor() as cursor:
+            search.rebuild_index(cursor)
+
+        seen = []
+        params = {'q': 'game', 'limit': 250}
+        while True:
+            body = self.client.get('/games', params).json()
+            seen.extend(game['id'] for game in body['results'])
+            if body['next'] is None:
+                break
+            params['cursor'] = body['next']
+        self.assertEqual(sorted(seen), [game.id for game in games])
+
+
+class RatingAggregateTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.game = Game.objects.create(
+            title='Chess', description='A game', designer='Designer', year_released=1500,
+            num_players=2, gameplay_length=60, age=6)
+
+    def aggregates(self):
+        self.game.refresh_from_db()
+        return (self.game.rating_count, self.game.rating_sum, self.game.rating_histogram,
+                self.game.rating_average)
+
+    def test_create_update_and_delete_maintain_aggregates(self):
+        rating = self.client.post(
+            '/ratings', {'gameId': self.game.id, 'rating': 4}, format='json').json()
+        self.assertEqual(self.aggregates(), (1, 4, [0, 0, 0, 1] + [0] * 6, 4))
+
+        other = Player.objects.create(
+            user=User.objects.create_user(username='other', password='!'), bio='')
+        self.game.set_rating(other, 10)
+        self.assertEqual(self.aggregates(), (2, 14, [0, 0, 0, 1] + [0] * 5 + [1], 7))
+
+        response = self.client.put(f'/ratings/{rating["id"]}', {'rating': 8}, format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.aggregates(), (2, 18, [0] * 7 + [1, 0, 1], 9))
+
+        self.assertEqual(self.client.delete(f'/ratings/{rating["id"]}').status_code, 204)
+        self.assertEqual(self.aggregates(), (1, 10, [0] * 9 + [1], 10))
+
+    def test_ratings_outside_the_scale_are_rejected(self):
+        for value in (0, 11, 'seven', 7.5, None):
+            with self.subTest(value=value):
+                response = self.client.post(
+                    '/ratings', {'gameId': self.game.id, 'rating': value}, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.aggregates(), (0, 0, [0] * 10, 0))
+
+        rating = self.game.set_rating(self.player, 5)[0]
+        for value in (0, 11, 'seven'):
+            with self.subTest(value=value):
+                response = self.client.put(f'/ratings/{rating.id}', {'rating': value},
+                                           format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.aggregates(), (1, 5, [0] * 4 + [1] + [0] * 5, 5))
+
+    def test_rebuild_command_repairs_drifted_aggregates(self):
+        self.game.set_rating(self.player, 6)
+        Game.objects.filter(pk=self.game.pk).update(
+            rating_count=3, rating_sum=1, rating_histogram=[1] * 10, rating_average=0)
+
+        out = io.StringIO()
+        call_command('rebuild_rating_aggregates', self.game.id, stdout=out)
+        self.assertIn('Rebuilt rating aggregates for 1 games', out.getvalue())
+        self.assertEqual(self.aggregates(), (1, 6, [0] * 5 + [1] + [0] * 4, 6))
+
+
+class RatingUpsertTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.game = make_games(1)[0]
+
+    def test_rerating_updates_the_existing_row(self):
+        first = self.client.post('/ratings', {'gameId': self.game.id, 'rating': 4}, format='json')
+        second = self.client.post('/ratings', {'gameId': self.game.id, 'rating': 9}, format='json')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.json()['id'], second.json()['id'])
+        self.assertEqual(Rating.objects.filter(game=self.game).count(), 1)
+
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.rating_count, self.game.rating_sum), (1, 9))
+        self.assertEqual(self.game.rating_histogram, [0] * 8 + [1, 0])
+
+    def test_unknown_game_is_not_found(self):
+        response = self.client.post('/ratings', {'gameId': self.game.id + 1, 'rating': 4},
+                                    format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'message': 'Game does not exist'})
+
+    def test_account_without_player_cannot_rate(self):
+        user = User.objects.create_user(username='staff', password='password')
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        response = self.client.post('/ratings', {'gameId': self.game.id, 'rating': 4},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Rating.objects.exists())
+
+    def test_database_rejects_duplicate_ratings(self):
+        Rating.objects.create(game=self.game, player=self.player, rating=3)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Rating.objects.create(game=self.game, player=self.player, rating=5)
+
+
+class ResponseCacheTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.game = make_games(1)[0]
+
+    def test_repeated_reads_are_served_from_cache(self):
+        first = self.client.get('/games')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get('/games')
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.json(), second.json())
+        # The token is cached too, so nothing reaches the database
+        self.assertEqual(len(queries), 0)
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get('/games')
+        self.assertEqual(self.client.get('/games', {'limit': 1})['X-Cache'], 'MISS')
+
+    def test_rating_write_invalidates_games(self):
+        self.client.get(f'/games/{self.game.id}')
+        before = cache.stats.snapshot()
+        self.client.post('/ratings', {'gameId': self.game.id, 'rating': 6}, format='json')
+
+        response = self.client.get(f'/games/{self.game.id}')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['average_rating'], 6.0)
+        self.assertEqual(cache.stats.snapshot()['misses'], before['misses'] + 1)
+
+    def test_category_write_invalidates_games_and_categories(self):
+        self.client.get('/games')
+        self.client.get('/categories')
+        self.client.post('/categories', {'label': 'Party'}, format='json')
+
+        self.assertEqual(self.client.get('/games')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/categories')['X-Cache'], 'MISS')
+
+
+class ConditionalGetTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.game = make_games(1)[0]
+
+    def test_list_answers_matching_etag_with_304(self):
+        first = self.client.get('/games')
+        etag = first['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get('/games', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+        self.assertEqual(len(queries), 0)
+
+        # Versions lost with the cache restart somewhere new, so the list is resent
+        cache.get_cache().clear()
+        uncached = self.client.get('/games', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(uncached.status_code, 200)
+        self.assertEqual(
+            self.client.get('/games', HTTP_IF_NONE_MATCH=uncached['ETag']).status_code, 304)
+
+    def test_list_etags_come_from_versions_not_tables(self):
+        for urlconf in ('gamerrater.urls', 'gamerrater.asgi_urls'):
+            with self.subTest(urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                # /ratings isn't response cached, so only the ETag can spare the query
+                etag = self.client.get('/ratings', {'limit': 20})['ETag']
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(
+                        '/ratings', {'limit': 20}, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual((response.status_code, len(queries)), (304, 0))
+                self.assertNotEqual(
+                    self.client.get('/ratings', {'limit': 10})['ETag'], etag)
+
+                self.client.post('/ratings', {'gameId': self.game.id, 'rating': 4})
+                self.assertEqual(self.client.get(
+                    '/ratings', {'limit': 20}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+                Rating.objects.all().delete()
+
+    def test_etag_changes_when_a_rating_changes_the_game(self):
+        etag = self.client.get(f'/games/{self.game.id}')['ETag']
+        self.client.post('/ratings', {'gameId': self.game.id, 'rating': 7}, format='json')
+
+        response = self.client.get(f'/games/{self.game.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_changes_when_a_row_is_deleted(self):
+        other = make_games(1)[0]
+        etag = self.client.get('/games')['ETag']
+        self.client.delete(f'/games/{other.id}')
+
+        self.assertEqual(self.client.get('/games', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_if_modified_since(self):
+        party = Category.objects.create(label='Party')
+        last_modified = self.client.get(f'/categories/{party.id}')['Last-Modified']
+
+        self.assertEqual(self.client.get(
+            f'/categories/{party.id}', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.client.get(
+            f'/categories/{party.id}', HTTP_IF_MODIFIED_SINCE='Sat, 01 Jan 2000 00:00:00 GMT'
+        ).status_code, 200)
+
+    def test_lists_see_deletes_through_if_modified_since(self):
+        other = make_games(1)[0]
+        rating = self.game.set_rating(self.player, 6)[0]
+        since = 'Fri, 01 Jan 2100 00:00:00 GMT'
+        for urlconf in ('gamerrater.urls', 'gamerrater.asgi_urls'):
+            with self.subTest(urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                for path in ('/games', '/ratings', '/categories'):
+                    self.assertNotIn('Last-Modified', self.client.get(path))
+
+        self.client.delete(f'/games/{other.id}')
+        self.client.delete(f'/ratings/{rating.id}')
+        for urlconf in ('gamerrater.urls', 'gamerrater.asgi_urls'):
+            with self.subTest(urlconf=urlconf), override_settings(ROOT_URLCONF=urlconf):
+                for path in ('/games', '/ratings'):
+                    response = self.client.get(path, HTTP_IF_MODIFIED_SINCE=since)
+                    self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/ratings').json(), [])
+
+    def test_reviews_and_ratings_send_validators(self):
+        self.assertIn('ETag', self.client.get('/reviews', {'gameId': self.game.id}))
+        self.assertIn('ETag', self.client.get('/ratings', {'gameId': self.game.id}))
+
+
+class CachedTokenAuthenticationTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.game = make_games(1)[0]
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/ratings', {'gameId': self.game.id})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_warm_requests_skip_the_token_query(self):
+        cold = self.count_queries()
+        warm = self.count_queries()
+        self.assertEqual(cold - warm, 1)
+
+        authentication.tokens.clear()
+        self.assertEqual(self.count_queries() - warm, 1)
+
+    def test_views_no_longer_query_the_player(self):
+        self.count_queries()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/ratings', {'gameId': self.game.id, 'rating': 5}, format='json')
+        self.assertFalse(any('"gamerraterapi_player"' in query['sql'] for query in queries))
+
+    def test_player_is_attached_to_the_request(self):
+        response = self.client.post(
+            '/ratings', {'gameId': self.game.id, 'rating': 5}, format='json')
+        self.assertEqual(response.json()['player']['user']['first_name'], 'Gina')
+
+    def test_deleted_token_is_rejected(self):
+        self.assertEqual(self.client.get('/categories').status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get('/categories').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get('/categories').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/categories').status_code, 401)
+
+    def test_lru_evicts_oldest_and_expired_entries(self):
+        lru = authentication.LRUCache(max_entries=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+        lru.ttl = -1
+        lru.set('d', 4)
+        self.assertIsNone(lru.get('d'))
+
+
+class BulkIngestionTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.games = make_games(3)
+        Game.rebuild_rating_aggregates()
+
+    def test_bulk_ratings_from_json_array(self):
+        items = [{'gameId': game.id, 'rating': 8} for game in self.games]
+        items.append({'gameId': self.games[0].id, 'rating': 2})
+        items.append({'gameId': 999999, 'rating': 5})
+        items.append({'gameId': self.games[1].id, 'rating': 11})
+
+        response = self.client.post('/ratings/bulk', items, format='json')
+        body = response.json()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((body['created'], body['updated']), (3, 0))
+        self.assertEqual([error['index'] for error in body['errors']], [4, 5])
+
+        game = Game.objects.get(pk=self.games[0].id)
+        self.assertEqual((game.rating_count, game.rating_sum), (1, 2))
+
+        response = self.client.post('/ratings/bulk', items[:1], format='json')
+        self.assertEqual(response.json()['updated'], 1)
+        self.assertEqual(Rating.objects.count(), 3)
+
+    def test_bulk_ratings_adjust_aggregates_without_rescanning(self):
+        other = Player.objects.create(
+            user=User.objects.create_user(username='other', password='password'), bio='')
+        self.games[0].set_rating(other, 4)
+        self.games[0].set_rating(self.player, 10)
+
+        items = [{'gameId': self.games[0].id, 'rating': 6},
+                 {'gameId': self.games[1].id, 'rating': 3}]
+        with patch.object(Game, 'rebuild_rating_aggregates', side_effect=AssertionError):
+            response = self.client.post('/ratings/bulk', items, format='json')
+        self.assertEqual((response.json()['created'], response.json()['updated']), (1, 1))
+
+        aggregates = {game.pk: (game.rating_count, game.rating_sum, game.rating_histogram)
+                      for game in Game.objects.all()}
+        Game.rebuild_rating_aggregates()
+        self.assertEqual(aggregates, {game.pk: (game.rating_count, game.rating_sum,
+                                                game.rating_histogram)
+                                      for game in Game.objects.all()})
+        self.assertEqual(aggregates[self.games[0].id][:2], (2, 10))
+
+    def test_bulk_ratings_from_ndjson_run_constant_queries_per_batch(self):
+        body = '\n'.join(json.dumps({'gameId': game.id, 'rating': 6}) for game in self.games)
+        self.client.get('/categories')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/ratings/bulk', body, content_type='application/x-ndjson')
+        self.assertEqual(response.json()['created'], 3)
+        self.assertLess(len(queries), 15)
+
+    def test_only_staff_may_submit_for_other_players(self):
+        other = Player.objects.create(
+            user=User.objects.create_user(username='other', password='password'), bio='')
+        item = {'gameId': self.games[0].id, 'rating': 5, 'playerId': other.id}
+        self.assertEqual(
+            self.client.post('/ratings/bulk', [item], format='json').status_code, 400)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(
+            self.client.post('/ratings/bulk', [item], format='json').status_code, 201)
+        self.assertTrue(Rating.objects.filter(player=other).exists())
+
+    def test_bulk_reviews(self):
+        items = [
+            {'gameId': self.games[0].id, 'review': 'Great', 'date': '2022-01-20T12:00:00Z'},
+            {'gameId': self.games[1].id, 'review': 'Meh'},
+        ]
+        response = self.client.post('/reviews/bulk', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(response.json()['errors'][0]['index'], 1)
+
+    def test_rejects_non_array_body(self):
+        response = self.client.post('/ratings/bulk', {'gameId': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportCatalogTests(AuthenticatedTestCase):
+
+    def write(self, name, text):
+        path = Path(self.directory.name) / name
+        path.write_text(text)
+        return str(path)
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_loads_every_entity_and_rebuilds_derived_data(self):
+        files = {
+            'users': self.write('users.csv', 'id,username,first_name,last_name\n100,importer,Ima,Porter\n'),
+            'players': self.write('players.ndjson', '{"id": 100, "user_id": 100, "bio": "Imported"}\n'),
+            'categories': self.write('categories.csv', 'id,label\n100,Dexterity\n'),
+            'games': self.write('games.ndjson', json.dumps({
+                'id': 100, 'title': 'Jenga', 'description': 'Stack blocks', 'designer': 'Scott',
+                'year_released': 1983, 'num_players': 8, 'gameplay_length': 20, 'age': 6}) + '\n'),
+            'game_categories': self.write('game_categories.csv', 'game_id,category_id\n100,100\n'),
+            'ratings': self.write('ratings.csv', 'game_id,player_id,rating\n100,100,9\n'),
+            'reviews': self.write('reviews.ndjson', json.dumps({
+                'game_id': 100, 'player_id': 100, 'review': 'Wobbly', 'date': '2022-01-01T00:00:00Z'})),
+        }
+        call_command('import_catalog', stdout=io.StringIO(), **files)
+
+        game = Game.objects.get(pk=100)
+        self.assertEqual((game.rating_count, game.average_rating), (1, 9.0))
+        self.assertEqual(list(game.categories.values_list('label', flat=True)), ['Dexterity'])
+        self.assertFalse(User.objects.get(pk=100).has_usable_password())
+        self.assertEqual([g['id'] for g in self.client.get('/games', {'q': 'dexter'}).json()], [100])
+        self.assertEqual(Game.objects.create(
+            title='Next', description='', designer='', year_released=1, num_players=1,
+            gameplay_length=1, age=1).pk, 101)
+
+    def test_failed_load_keeps_nothing_and_restores_indexes(self):
+        def indexes():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                               "AND tbl_name = 'gamerraterapi_game'")
+                return sorted(row[0] for row in cursor.fetchall())
+
+        before = indexes()
+        files = {
+            'games': self.write('games.ndjson', json.dumps({
+                'id': 100, 'title': 'Jenga', 'description': 'Stack blocks', 'designer': 'Scott',
+                'year_released': 1983, 'num_players': 8, 'gameplay_length': 20, 'age': 6}) + '\n'),
+            # The same player rating the same game twice breaks the unique constraint
+            'ratings': self.write('ratings.csv', f'game_id,player_id,rating\n'
+                                  f'100,{self.player.id},9\n100,{self.player.id},3\n'),
+        }
+        with self.assertRaises(IntegrityError):
+            call_command('import_catalog', stdout=io.StringIO(), **files)
+
+        self.assertFalse(Game.objects.filter(pk=100).exists())
+        self.assertEqual(indexes(), before)
+
+
+@override_settings(GAMERRATER_DB_ROUTING={'REPLICAS': ['replica'], 'STICKY_SECONDS': 5})
+class ReplicaRoutingTests(AuthenticatedTestCase):
+    """Reads against a replica kept in a second SQLite file, which the tests fill by hand"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Added here rather than in settings, so the test runner doesn't
+        # set it up as a test database of its own
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = {
+            **connections.settings['default'],
+            'NAME': str(Path(cls.directory.name, 'replica.sqlite3')),
+        }
+        call_command('migrate', database='replica', verbosity=0)
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.directory.cleanup()
+
+    def setUp(self):
+        super().setUp()
+        self.game = make_games(1)[0]
+        Game.objects.using('replica').bulk_create([
+            Game(title='Replica Game', description='', designer='', year_released=2000,
+                 num_players=2, gameplay_length=30, age=8)])
+
+    def titles(self):
+        return [game['title'] for game in self.client.get('/games').json()]
+
+    def test_reads_go_to_the_replica(self):
+        # The token itself is only on the primary
+        self.assertEqual(self.titles(), ['Replica Game'])
+
+    def test_writes_go_to_the_primary_and_make_the_player_sticky(self):
+        response = self.client.post('/ratings', {'gameId': self.game.id, 'rating': 8})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Rating.objects.using('default').filter(game=self.game).exists())
+        self.assertFalse(Rating.objects.using('replica').exists())
+
+        other = User.objects.create_user(username='other', password='password')
+        Player.objects.create(user=other, bio='')
+        other_client = self.client_class()
+        other_client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=other).key}')
+        response = other_client.get('/games')
+        self.assertEqual([game['title'] for game in response.json()], ['Replica Game'])
+        # Right after a write, replica reads aren't cached for everyone else
+        self.assertNotIn('X-Cache', response)
+
+        response = self.client.get('/games')
+        self.assertEqual([game['title'] for game in response.json()], ['Game 0'])
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_failed_writes_dont_make_the_player_sticky(self):
+        response = self.client.delete(f'/ratings/{self.game.id + 100}')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.titles(), ['Replica Game'])
+
+    def test_first_feed_is_built_from_the_primary(self):
+        feeds.feeds.clear()
+        # Rated on the primary without a request, so the player isn't sticky
+        self.game.set_rating(self.player, 8)
+
+        response = self.client.get('/players/me/feed')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([game['title'] for game in response.json()], ['Replica Game'])
+        affinity = PlayerAffinity.objects.using('default').get(player=self.player)
+        self.assertEqual((affinity.rating_count, affinity.rating_sum), (1, 8))
+
+
+class SQLiteTuningTests(AuthenticatedTestCase):
+    """Pragmas applied to new SQLite connections"""
+
+    def pragma(self, db, name):
+        with db.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connections_are_tuned(self):
+        self.assertEqual(self.pragma(connection, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(connection, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(connection, 'temp_store'), 2)  # MEMORY
+
+    def test_settings_override_the_defaults(self):
+        with override_settings(GAMERRATER_SQLITE_PRAGMAS={'busy_timeout': 250,
+                                                          'temp_store': None}):
+            db = connections.create_connection('default')
+            try:
+                self.assertEqual(self.pragma(db, 'busy_timeout'), 250)
+                self.assertEqual(self.pragma(db, 'temp_store'), 0)  # DEFAULT
+                self.assertEqual(self.pragma(db, 'synchronous'), 1)
+            finally:
+                db.close()
+
+
+class LeaderboardTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.games = make_games(3)
+
+    def test_top_shrinks_small_samples_towards_the_mean(self):
+        # Two 10s, two hundred 9s and fifty 5s
+        for game, (count, total) in zip(self.games, [(2, 20), (200, 1800), (50, 250)]):
+            game.rating_count, game.rating_sum = count, total
+        Game.objects.bulk_update(self.games, ['rating_count', 'rating_sum'])
+        call_command('recompute_rankings', stdout=io.StringIO())
+
+        body = self.client.get('/games/top').json()
+        self.assertEqual([game['id'] for game in body],
+                         [self.games[1].id, self.games[0].id, self.games[2].id])
+        self.assertGreater(body[0]['score'], body[1]['score'])
+        self.assertEqual(len(self.client.get('/games/top', {'limit': 1}).json()), 1)
+
+    def test_top_query_count_is_independent_of_game_count(self):
+        make_games(500)
+        rankings.recompute_rankings()
+        authentication.get_token(self.token.key)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/games/top', {'limit': 5})
+        self.assertEqual(len(response.json()), 5)
+        self.assertLessEqual(len(queries), 4)
+
+    def test_recent_activity_trends_above_older_activity(self):
+        now = timezone.now()
+        Review.objects.bulk_create([
+            Review(game=self.games[0], player=self.player, review='Old', date=now - timedelta(days=14)),
+            Review(game=self.games[0], player=self.player, review='Old', date=now - timedelta(days=14)),
+            Review(game=self.games[1], player=self.player, review='New', date=now),
+        ])
+        rankings.recompute_rankings()
+
+        body = self.client.get('/games/trending').json()
+        # Two reviews two half-lives ago count for half as much as one today;
+        # the game without activity isn't trending at all
+        self.assertEqual([game['id'] for game in body], [self.games[1].id, self.games[0].id])
+
+    def test_rating_refreshes_the_game_ranking(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/ratings', {'gameId': self.games[2].id, 'rating': 9}, format='json')
+
+        ranking = GameRanking.objects.get(game=self.games[2])
+        self.assertIsNotNone(ranking.trending_score)
+        self.assertEqual(self.client.get('/games/trending').json()[0]['id'], self.games[2].id)
+
+    def test_refresh_adds_new_activity_without_rescanning(self):
+        game = self.games[0]
+        now = timezone.now()
+        Review.objects.bulk_create([
+            Review(game=game, player=self.player, review='Fun', date=now - timedelta(days=i % 20))
+            for i in range(200)])
+        rankings.recompute_rankings()
+
+        # Writes add to the stored score, never rescanning the game's activity
+        with patch('gamerraterapi.rankings.trending_scores', side_effect=AssertionError), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/reviews', {
+                'review': 'New', 'date': now.isoformat(), 'gameId': game.id}, format='json')
+            self.client.post('/ratings', {'gameId': game.id, 'rating': 8}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        stored = GameRanking.objects.get(game=game).trending_score
+        self.assertAlmostEqual(stored, rankings.trending_scores([game.id])[game.id])
+
+
+    def test_cascades_refresh_once_rather_than_per_row(self):
+        Game.rebuild_rating_aggregates()
+        users = User.objects.bulk_create(
+            [User(username=f'fan{i}', password='!') for i in range(300)])
+        players = Player.objects.bulk_create([Player(user=user, bio='') for user in users])
+        game, kept, _ = self.games
+        Rating.objects.bulk_create([Rating(game=game, player=player, rating=7) for player in players])
+        Review.objects.bulk_create([
+            Review(game=game, player=player, review='Fun', date=timezone.now())
+            for player in players])
+        rankings.recompute_rankings()
+
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertEqual(self.client.delete(f'/games/{game.id}').status_code, 204)
+        self.assertLess(len(queries), 40)
+        self.assertEqual(len(callbacks), 0)
+        self.assertFalse(Rating.objects.filter(game_id=game.id).exists())
+
+        kept.set_rating(players[0], 4)
+        kept.set_rating(players[1], 6)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            players[0].delete()
+        self.assertEqual(len(callbacks), 1)
+        kept.refresh_from_db()
+        self.assertEqual((kept.rating_count, kept.rating_sum), (1, 6))
+        self.assertAlmostEqual(
+            GameRanking.objects.get(game=kept).bayesian_score,
+            rankings.bayesian_score(1, 6, rankings.get_prior()))
+
+
+class GameStatsTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.game = make_games(1)[0]
+        self.values = [3, 7, 8, 8, 10, 2]
+        for index, value in enumerate(self.values):
+            user = User.objects.create_user(username=f'rater{index}', password='password')
+            self.game.set_rating(Player.objects.create(user=user, bio=''), value)
+
+    def test_stats_come_from_the_aggregates(self):
+        # The two oldest ratings fall outside the 7 day window
+        Rating.objects.filter(rating__in=[2, 3]).update(
+            updated_at=timezone.now() - timedelta(days=20))
+
+        body = self.client.get(f'/games/{self.game.id}/stats').json()
+        self.assertEqual(body['count'], 6)
+        self.assertAlmostEqual(body['mean'], statistics.fmean(self.values))
+        self.assertEqual(body['median'], statistics.median(self.values))
+        self.assertAlmostEqual(body['stddev'], statistics.pstdev(self.values))
+        self.assertEqual(body['histogram'][7], {'rating': 8, 'count': 2})
+        self.assertEqual(body['recent'][0], {'days': 7, 'count': 4, 'mean': 8.25})
+        self.assertEqual(body['recent'][1], {'days': 30, 'count': 6,
+                                             'mean': statistics.fmean(self.values)})
+
+    def test_query_count_is_independent_of_rating_count(self):
+        authentication.get_token(self.token.key)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/games/{self.game.id}/stats')
+        self.assertEqual(len(queries), 2)
+
+        window = str(Rating.objects.filter(
+            game_id=self.game.id, updated_at__gte=timezone.now()).explain())
+        self.assertIn('rating_game_updated_idx', window)
+
+    def test_unknown_and_unrated_games(self):
+        self.assertEqual(self.client.get('/games/0/stats').status_code, 404)
+
+        body = self.client.get(f'/games/{make_games(1)[0].id}/stats').json()
+        self.assertEqual((body['count'], body['mean'], body['median'], body['stddev']),
+                         (0, None, None, None))
+        self.assertEqual(body['recent'][2], {'days': 90, 'count': 0, 'mean': None})
+
+
+class SimilarGamesTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.games = make_games(4)
+        users = User.objects.bulk_create([User(username=f'p{i}', password='!') for i in range(6)])
+        self.players = Player.objects.bulk_create([Player(user=user, bio='') for user in users])
+        # Everyone who loves game 0 loves game 1 and dislikes game 2; game 3
+        # shares one fan with game 0
+        table = [(0, 9), (1, 9), (2, 2)]
+        Rating.objects.bulk_create(
+            [Rating(game=self.games[game], player=player, rating=value)
+             for player in self.players[:5] for game, value in table]
+            + [Rating(game=self.games[3], player=self.players[0], rating=10),
+               Rating(game=self.games[3], player=self.players[5], rating=3)])
+
+    def similar_ids(self, game):
+        return [item['id'] for item in self.client.get(f'/games/{game.id}/similar').json()]
+
+    def test_games_liked_by_the_same_players_are_similar(self):
+        for engine in ('python', 'numpy') if recommendations.numpy else ('python',):
+            with self.subTest(engine=engine), override_settings(
+                    GAMERRATER_RECOMMENDATIONS={'ENGINE': engine}):
+                call_command('build_similar_games', stdout=io.StringIO())
+                self.assertEqual(self.similar_ids(self.games[0]),
+                                 [self.games[1].id, self.games[3].id])
+                self.assertNotIn(self.games[2].id, self.similar_ids(self.games[1]))
+
+        response = self.client.get(f'/games/{self.games[0].id}/similar', {'limit': 1})
+        self.assertEqual(len(response.json()), 1)
+        self.assertGreater(response.json()[0]['score'], 0)
+        self.assertEqual(self.client.get('/games/0/similar').status_code, 404)
+
+    @skipUnless(recommendations.numpy, 'needs numpy and scipy')
+    def test_engines_agree(self):
+        rng = random.Random(1)
+        pairs = rng.sample([(game, player) for game in range(40) for player in range(200)], 2000)
+        ratings = ([game for game, _ in pairs], [player for _, player in pairs],
+                   [rng.randint(1, 10) for _ in pairs])
+        targets = list(range(45))
+        expected = recommendations.python_neighbours(ratings, targets, 5, 5)
+        actual = recommendations.numpy_neighbours(ratings, targets, 5, 5, batch_size=7)
+        self.assertEqual(actual.keys(), expected.keys())
+        for game_id in targets:
+            self.assertEqual([pair[0] for pair in actual[game_id]],
+                             [pair[0] for pair in expected[game_id]])
+            for (_, score), (_, other) in zip(actual[game_id], expected[game_id]):
+                self.assertAlmostEqual(score, other)
+
+    def test_incremental_builds_only_recompute_rated_games(self):
+        self.assertEqual(recommendations.build_similar_games(incremental=True), 4)
+        SimilarGame.objects.update(computed_at=timezone.now() - timedelta(hours=1))
+        Rating.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+        self.games[0].set_rating(self.players[5], 9)
+
+        self.assertEqual(recommendations.build_similar_games(incremental=True), 1)
+        rebuilt = SimilarGame.objects.filter(
+            computed_at__gte=timezone.now() - timedelta(minutes=1))
+        self.assertEqual({row.game_id for row in rebuilt}, {self.games[0].id})
+
+
+class PlayerFeedTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        feeds.feeds.clear()
+        strategy, party = (Category.objects.create(label=label) for label in ('Strategy', 'Party'))
+        self.strategy = make_games(3, [strategy])
+        self.party = make_games(3, [party])
+        rankings.recompute_rankings()
+
+    def feed_ids(self, **params):
+        return [game['id'] for game in self.client.get('/players/me/feed', params).json()]
+
+    def test_new_players_get_the_popular_games(self):
+        top = [game['id'] for game in self.client.get('/games/top', {'limit': 6}).json()]
+        self.assertEqual(self.feed_ids(), top)
+
+    def test_rated_categories_rank_unrated_games(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.strategy[0].set_rating(self.player, 10)
+            self.party[0].set_rating(self.player, 2)
+
+        ids = self.feed_ids()
+        self.assertEqual(set(ids[:2]), {game.id for game in self.strategy[1:]})
+        self.assertEqual(set(ids[2:]), {game.id for game in self.party[1:]})
+        self.assertEqual(len(self.feed_ids(limit=1)), 1)
+
+        # Rating a game takes it out of the next feed
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/ratings', {'gameId': ids[0], 'rating': 9})
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn(ids[0], self.feed_ids())
+
+    def test_affinity_is_adjusted_by_each_rating_change(self):
+        other = self.party[0]
+        self.strategy[0].set_rating(self.player, 6)
+        self.feed_ids()
+
+        def assert_matches_a_rebuild():
+            affinity = PlayerAffinity.objects.get(player=self.player)
+            feeds.rebuild_affinities()
+            rebuilt = PlayerAffinity.objects.get(player=self.player)
+            self.assertEqual(
+                (affinity.categories, affinity.rating_sum, affinity.rating_count),
+                (rebuilt.categories, rebuilt.rating_sum, rebuilt.rating_count))
+
+        with patch('gamerraterapi.feeds.player_totals', side_effect=AssertionError):
+            self.assertEqual(self.client.post(
+                '/ratings', {'gameId': other.id, 'rating': 9}).status_code, 201)
+            rating = Rating.objects.get(game=other, player=self.player)
+            self.assertEqual(self.client.put(
+                f'/ratings/{rating.id}', {'rating': 3}).status_code, 204)
+            self.assertEqual(self.client.post('/ratings/bulk', [
+                {'gameId': self.strategy[1].id, 'rating': 8},
+                {'gameId': self.strategy[0].id, 'rating': 2}], format='json').status_code, 201)
+        assert_matches_a_rebuild()
+
+        with patch('gamerraterapi.feeds.player_totals', side_effect=AssertionError):
+            self.assertEqual(self.client.delete(f'/ratings/{rating.id}').status_code, 204)
+            self.assertEqual(self.client.delete(f'/games/{self.strategy[1].id}').status_code, 204)
+        assert_matches_a_rebuild()
+        self.assertEqual(PlayerAffinity.objects.get(player=self.player).categories,
+                         {str(self.strategy[0].categories.get().id): [2, 1]})
+
+    def test_feeds_are_cached_until_the_player_rates_again(self):
+        authentication.get_token(self.token.key)
+        self.feed_ids()
+        with CaptureQueriesContext(connection) as queries:
+            self.feed_ids()
+        # Affinity version, then the feed's games and their categories
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(len(feeds.feeds), 1)
+
+    @override_settings(GAMERRATER_FEEDS={'CANDIDATES': 2, 'FEED_SIZE': 2, 'TOP_CATEGORIES': 1,
+                                         'POPULARITY_WEIGHT': 0})
+    def test_only_popular_and_favourite_category_games_are_scored(self):
+        dexterity = make_games(3, [Category.objects.create(label='Dexterity')])
+        rankings.recompute_rankings()
+        GameRanking.objects.update(bayesian_score=5)
+        GameRanking.objects.filter(game__in=self.strategy).update(bayesian_score=1)
+        GameRanking.objects.filter(game__in=dexterity).update(bayesian_score=9)
+        self.strategy[0].set_rating(self.player, 10)
+        self.party[0].set_rating(self.player, 2)
+        affinity = feeds.refresh_affinities([self.player.pk])[self.player.pk]
+
+        with CaptureQueriesContext(connection) as queries:
+            ranked = feeds.rank_feed(self.player, affinity)
+        # The strategy games are last on the leaderboard, but in the favourite category
+        self.assertEqual({game_id for game_id, _ in ranked}, {game.id for game in self.strategy[1:]})
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(queries[0]['sql'].count('LIMIT 2'), 3)
+
+
+def make_image(size=(640, 400), image_format='PNG', name='picture.png'):
+    """An uploadable image file"""
+    data = io.BytesIO()
+    Image.new('RGB', size, (200, 40, 40)).save(data, image_format)
+    return SimpleUploadedFile(name, data.getvalue(), content_type=f'image/{image_format.lower()}')
+
+
+class PictureTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        # Thumbnail in the committing thread, so tests can wait on it
+        settings = override_settings(MEDIA_ROOT=media.name, GAMERRATER_PICTURES={'WORKERS': 0})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.media = Path(media.name)
+        self.game = make_games(1)[0]
+
+    def upload(self, image=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                '/pictures', {'gameId': self.game.id, 'image': image or make_image()},
+                format='multipart')
+
+    def test_upload_makes_thumbnails(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 201)
+        picture = Picture.objects.get(pk=response.json()['id'])
+        self.assertEqual((picture.width, picture.height), (640, 400))
+        self.assertEqual(picture.status, Picture.READY)
+
+        for size, pixels in pictures.get_setting('SIZES').items():
+            for image_format in pictures.get_setting('FORMATS'):
+                name = pictures.thumbnail_name(picture.sha256, size, image_format)
+                with Image.open(self.media / name) as thumbnail:
+                    self.assertEqual(thumbnail.format, image_format.upper())
+                    self.assertEqual(max(thumbnail.size), min(pixels, 640))
+
+        data = self.client.get(f'/pictures/{picture.id}').json()
+        self.assertTrue(data['thumbnails']['small'].endswith(f'/thumbnails/{picture.sha256}/small'))
+
+    def test_same_image_is_stored_once(self):
+        first, second = self.upload().json(), self.upload().json()
+        self.assertNotEqual(first['id'], second['id'])
+        self.assertEqual(first['sha256'], second['sha256'])
+        self.assertEqual(second['status'], Picture.READY)
+        self.assertEqual(len(list((self.media / 'pictures/originals').rglob('*.png'))), 1)
+
+    def test_thumbnails_are_cached_for_a_year(self):
+        digest = self.upload().json()['sha256']
+        self.client.credentials()
+
+        response = self.client.get(f'/thumbnails/{digest}/medium', HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(
+            self.client.get(f'/thumbnails/{digest}/medium', HTTP_ACCEPT='image/*')['Content-Type'],
+            'image/jpeg')
+
+        response = self.client.get(
+            f'/thumbnails/{digest}/medium.jpeg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            f'/thumbnails/{digest}/medium.jpeg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(f'/thumbnails/{digest}/huge').status_code, 404)
+
+    def test_invalid_uploads_are_rejected(self):
+        not_an_image = SimpleUploadedFile('picture.png', b'not an image', content_type='image/png')
+        response = self.upload(not_an_image)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('message', response.json())
+
+        with override_settings(GAMERRATER_PICTURES={'MAX_UPLOAD_BYTES': 10}):
+            self.assertEqual(self.upload().status_code, 400)
+        self.assertFalse(Picture.objects.exists())
+
+
+class MetricsTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+        make_games(3)
+
+    def sample(self, text, name, **labels):
+        """The value of one sample in a Prometheus exposition"""
+        selector = ','.join(f'{key}="{value}"' for key, value in labels.items())
+        for line in text.splitlines():
+            if line.startswith(f'{name}{{{selector}}} '):
+                return float(line.rsplit(' ', 1)[1])
+        self.fail(f'No sample {name}{{{selector}}}')
+
+    def test_requests_are_recorded_per_route_and_method(self):
+        response = self.client.get('/games')
+        self.client.get('/games')
+        self.client.get('/games/1')
+        self.client.get('/no-such-page')
+
+        text = self.client.get('/metrics').content.decode()
+        route = {'route': 'game-list', 'method': 'GET'}
+        self.assertEqual(self.sample(text, 'gamerrater_requests_total', **route), 2)
+        self.assertEqual(self.sample(text, 'gamerrater_requests_total', route='game-detail',
+                                     method='GET'), 1)
+        self.assertEqual(self.sample(text, 'gamerrater_requests_total', route='unmatched',
+                                     method='GET'), 1)
+        self.assertEqual(self.sample(text, 'gamerrater_request_duration_seconds_count', **route), 2)
+        self.assertEqual(self.sample(
+            text, 'gamerrater_request_duration_seconds_bucket', **route, le='+Inf'), 2)
+        self.assertEqual(self.sample(text, 'gamerrater_request_db_queries_count', **route), 2)
+        self.assertGreater(self.sample(text, 'gamerrater_request_db_queries_sum', **route), 0)
+        self.assertGreater(self.sample(text, 'gamerrater_request_db_seconds_total', **route), 0)
+        self.assertGreaterEqual(
+            self.sample(text, 'gamerrater_response_bytes_total', **route), 2 * len(response.content))
+        self.assertIn('# TYPE gamerrater_request_duration_seconds histogram', text)
+
+    def test_response_cache_lookups_are_exported(self):
+        before = cache.stats.snapshot()
+        self.client.get('/games')
+        self.client.get('/games')
+
+        text = self.client.get('/metrics').content.decode()
+        self.assertEqual(self.sample(text, 'gamerrater_response_cache_lookups_total',
+                                     result='hit'), before['hits'] + 1)
+        self.assertEqual(self.sample(text, 'gamerrater_response_cache_lookups_total',
+                                     result='miss'), before['misses'] + 1)
+        self.assertIn('# TYPE gamerrater_response_cache_lookups_total counter', text)
+
+    @override_settings(GAMERRATER_METRICS={'SLOW_REQUEST_SECONDS': 0, 'SLOW_QUERIES': 2})
+    def test_slow_requests_are_logged_with_their_slowest_queries(self):
+        with self.assertLogs('gamerraterapi.metrics', 'WARNING') as logs:
+            self.client.get('/games')
+        self.assertIn('Slow request: GET /games (game-list) 200', logs.output[0])
+        self.assertEqual(logs.output[0].count('ms SELECT'), 2)
+
+    @override_settings(GAMERRATER_METRICS={'TOKEN': 'scraper'})
+    def test_metrics_token(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scraper')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+
+class QueryBudgetTests(APITestCase):
+    """The benchmark suite's endpoints, each within its query budget"""
+
+    def test_endpoints_stay_within_their_query_budgets(self):
+        cache.get_cache().clear()
+        authentication.tokens.clear()
+        throttling.buckets.clear()
+        player = benchmarks.seed_dataset(games=60, players=5, ratings=200, reviews=50, pictures=10)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=player.user).key}')
+
+        results = benchmarks.run_suite(self.client, player, repeat=2)
+        self.assertEqual(set(results), {endpoint.name for endpoint in benchmarks.ENDPOINTS})
+        self.assertEqual(benchmarks.over_budget(results), {})
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual(benchmarks.unbenchmarked(), [])
+
+    def test_compare_with_baseline(self):
+        baseline = {'games:list': {'p50_ms': 2.0, 'queries': 5},
+                    'games:top': {'p50_ms': 2.0, 'queries': 2}}
+        results = {'games:list': {'p50_ms': 3.0, 'queries': 5},
+                   'games:top': {'p50_ms': 2.1, 'queries': 3},
+                   'games:trending': {'p50_ms': 1.0, 'queries': 2}}
+        ratios, regressions = benchmarks.compare(results, baseline, tolerance=0.25)
+        self.assertEqual(ratios, {'games:list': 1.5, 'games:top': 1.05})
+        self.assertEqual(regressions, {'games:list': 'p50 2.0ms -> 3.0ms',
+                                       'games:top': 'queries 2 -> 3'})
+
+
+class ThrottlingTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.game = make_games(1)[0]
+
+    def rate(self, score=7):
+        return self.client.post('/ratings', {'gameId': self.game.id, 'rating': score})
+
+    @override_settings(GAMERRATER_THROTTLE={'RATES': {'read': '5/min', 'write': '2/min'},
+                                            'SCOPES': {}})
+    def test_writes_are_limited_separately_from_reads(self):
+        response = self.rate()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['X-RateLimit-Limit'], '2')
+        self.assertEqual(response['X-RateLimit-Remaining'], '1')
+        self.assertEqual(response['X-RateLimit-Reset'], '30')
+        self.assertEqual(self.rate().status_code, 200)
+
+        response = self.rate()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(response['X-RateLimit-Remaining'], '0')
+        self.assertEqual(Rating.objects.filter(game=self.game).count(), 1)
+
+        # Reads, and other endpoints' writes, have their own buckets
+        response = self.client.get('/ratings')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-RateLimit-Remaining'], '4')
+        response = self.client.post('/reviews', {
+            'review': 'Fun', 'date': '2024-01-01T00:00:00Z', 'gameId': self.game.id})
+        self.assertEqual(response.status_code, 201)
+
+    @override_settings(GAMERRATER_THROTTLE={'RATES': {'read': '1/s', 'write': None}})
+    def test_buckets_refill(self):
+        with patch('gamerraterapi.throttling.time.time', return_value=1000.0) as now:
+            self.assertEqual(self.client.get('/categories').status_code, 200)
+            self.assertEqual(self.client.get('/categories').status_code, 429)
+            now.return_value = 1001.0
+            self.assertEqual(self.client.get('/categories').status_code, 200)
+
+    @override_settings(ROOT_URLCONF='gamerrater.asgi_urls',
+                       GAMERRATER_THROTTLE={'RATES': {'read': '1/min'}})
+    def test_async_reads_take_from_the_same_buckets(self):
+        get = async_to_sync(self.async_client.get)
+        headers = {'Authorization': f'Token {self.token.key}'}
+        response = get('/games', headers=headers)
+        self.assertEqual((response.status_code, response['X-RateLimit-Remaining']), (200, '0'))
+        response = get('/games', headers=headers)
+        self.assertEqual((response.status_code, response['Retry-After']), (429, '60'))
+        # The ViewSet shares the games bucket
+        self.assertEqual(self.client.get('/games?fields=id').status_code, 429)
+
+    @override_settings(GAMERRATER_THROTTLE={'RATES': {'read': '1/min', 'write': '1/min'},
+                                            'SHARED_CACHE': 'default'})
+    def test_shared_cache_backend(self):
+        with patch('gamerraterapi.throttling.time.time', return_value=1000.0) as now:
+            self.assertEqual(self.client.get('/categories').status_code, 200)
+            # Another process has its own in-memory buckets, but shares the cache
+            throttling.buckets.clear()
+            response = self.client.get('/categories')
+            self.assertEqual((response.status_code, response['Retry-After']), (429, '20'))
+            # The next window
+            now.return_value = 1020.0
+            self.assertEqual(self.client.get('/categories').status_code, 200)
+
+    @override_settings(GAMERRATER_THROTTLE={'SHARED_CACHE': 'default'})
+    def test_shared_cache_spends_each_token_once(self):
+        caches['default'].clear()
+        start = threading.Barrier(20)
+
+        def consume():
+            start.wait()
+            return throttling.consume('concurrent', 5, 5 / 60).allowed
+
+        with ThreadPoolExecutor(20) as pool:
+            allowed = list(pool.map(lambda _: consume(), range(20)))
+        self.assertEqual(allowed.count(True), 5)
+
+    @override_settings(GAMERRATER_THROTTLE={'RATES': {'read': '1/min'}})
+    def test_anonymous_requests_cant_pick_their_bucket(self):
+        def check(forwarded_for):
+            request = RequestFactory().get(
+                '/categories', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=forwarded_for)
+            return throttling.check(request, None, 'categories').allowed
+
+        self.assertTrue(check('1.1.1.1'))
+        self.assertFalse(check('2.2.2.2'))
+
+        # Behind a known proxy, the address it forwarded is the client's
+        with override_settings(REST_FRAMEWORK={'NUM_PROXIES': 1}):
+            self.assertTrue(check('3.3.3.3, 4.4.4.4'))
+            self.assertTrue(check('3.3.3.3, 5.5.5.5'))
+            self.assertFalse(check('6.6.6.6, 5.5.5.5'))
+
+    def test_throttle_check_makes_no_queries(self):
+        queries, checked = [], []
+        original = throttling.check
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        def check(*args):
+            before = len(queries)
+            limit = original(*args)
+            checked.append(len(queries) - before)
+            return limit
+
+        # With the token not yet cached, so the request itself makes queries
+        with connection.execute_wrapper(count), patch('gamerraterapi.throttling.check', check):
+            self.assertEqual(self.client.get('/categories').status_code, 200)
+        self.assertEqual(checked, [0])
+        self.assertTrue(queries)
+
+
+class WriteBehindTests(AuthenticatedTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Drain only when a test says so
+        self.log_settings = {
+            'ENABLED': True, 'DIRECTORY': directory.name, 'WORKER': False, 'FSYNC': False}
+        overrides = override_settings(GAMERRATER_RATING_LOG=self.log_settings)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.games = make_games(2)
+        caches['default'].clear()
+
+    def append(self, game, rating):
+        return writebehind.append(game.id, self.player.id, rating)
+
+    def test_rating_is_accepted_and_read_back_by_its_player(self):
+        game = self.games[0]
+        response = self.client.post('/ratings', {'gameId': game.id, 'rating': 9})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data, {'game': game.id, 'rating': 9, 'status': 'pending'})
+        self.assertFalse(Rating.objects.exists())
+
+        response = self.client.get(f'/ratings?gameId={game.id}')
+        self.assertEqual([rating['rating'] for rating in response.data], [9])
+        game.refresh_from_db()
+        self.assertEqual((game.rating_count, game.rating_sum), (1, 9))
+
+        self.assertEqual(
+            self.client.post('/ratings', {'gameId': game.id, 'rating': 11}).status_code, 400)
+        self.assertEqual(
+            self.client.post('/ratings', {'gameId': 0, 'rating': 5}).status_code, 404)
+
+    def test_direct_writes_are_not_overwritten_by_earlier_logged_ratings(self):
+        game, other = self.games
+        Game.rebuild_rating_aggregates()
+        rating, _ = game.set_rating(self.player, 5)
+        self.assertEqual(
+            self.client.post('/ratings', {'gameId': game.id, 'rating': 9}).status_code, 202)
+        self.assertEqual(
+            self.client.put(f'/ratings/{rating.id}', {'rating': 3}).status_code, 204)
+        self.assertEqual(writebehind.drain_all(), 0)
+        rating.refresh_from_db()
+        game.refresh_from_db()
+        self.assertEqual((rating.rating, game.rating_count, game.rating_sum), (3, 1, 3))
+
+        rating, _ = other.set_rating(self.player, 5)
+        self.assertEqual(
+            self.client.post('/ratings', {'gameId': other.id, 'rating': 9}).status_code, 202)
+        self.assertEqual(self.client.delete(f'/ratings/{rating.id}').status_code, 204)
+        self.assertEqual(writebehind.drain_all(), 0)
+        other.refresh_from_db()
+        self.assertFalse(Rating.objects.filter(game=other).exists())
+        self.assertEqual((other.rating_count, other.rating_sum), (0, 0))
+
+    def test_torn_tail_is_skipped_then_cut_off(self):
+        self.append(self.games[0], 4)
+        segment = writebehind.segment_path(1)
+        # A crash halfway through writing the next record
+        with open(segment, 'ab') as log:
+            log.write(writebehind.encode({'game': self.games[1].id})[:10])
+
+        records, end = writebehind.read_records(writebehind.START, 100)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(end[1], segment.stat().st_size - 10)
+
+        self.append(self.games[1], 6)
+        self.assertEqual(writebehind.drain(), 2)
+        self.assertEqual(dict(Rating.objects.values_list('game_id', 'rating')),
+                         {self.games[0].id: 4, self.games[1].id: 6})
+
+    def test_crash_mid_drain_applies_the_batch_exactly_once(self):
+        self.append(self.games[0], 3)
+        self.append(self.games[0], 8)
+        position = self.append(self.games[1], 5)
+
+        def crash(latest):
+            upsert_ratings(latest)
+            raise RuntimeError('Killed')
+
+        with patch('gamerraterapi.writebehind.upsert_ratings', crash), \
+                self.assertRaises(RuntimeError):
+            writebehind.drain()
+        self.assertFalse(Rating.objects.exists())
+        self.assertEqual(writebehind.checkpoint(), writebehind.START)
+
+        self.assertEqual(writebehind.drain(), 3)
+        self.assertEqual(writebehind.drain(), 0)
+        self.assertEqual(writebehind.checkpoint(), position)
+        game = Game.objects.get(pk=self.games[0].id)
+        self.assertEqual((game.rating_count, game.rating_sum), (1, 8))
+        self.assertEqual(Rating.objects.count(), 2)
+
+    def test_corrupt_record_is_skipped(self):
+        self.append(self.games[0], 2)
+        self.append(self.games[1], 7)
+        segment = writebehind.segment_path(1)
+        lines = segment.read_bytes().splitlines(keepends=True)
+        segment.write_bytes(lines[0].replace(b'"rating":2', b'"rating":9') + lines[1])
+
+        self.assertEqual(writebehind.drain(), 1)
+        self.assertEqual(list(Rating.objects.values_list('game_id', 'rating')),
+                         [(self.games[1].id, 7)])
+        self.assertEqual(writebehind.checkpoint(), (1, segment.stat().st_size))
+
+    def test_segments_roll_over_and_are_removed_once_applied(self):
+        with override_settings(GAMERRATER_RATING_LOG={
+                **self.log_settings, 'SEGMENT_BYTES': 1}):
+            for rating in (1, 2, 3):
+                self.append(self.games[0], rating)
+            self.assertEqual(writebehind.segments(), [1, 2, 3])
+
+            # Records of deleted games are dropped
+            writebehind.append(0, self.player.id, 5)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(writebehind.drain(), 4)
+
+        self.assertEqual(writebehind.segments(), [4])
+        self.assertEqual(list(Rating.objects.values_list('rating', flat=True)), [3])
+        self.assertEqual(writebehind.checkpoint()[0], 4)
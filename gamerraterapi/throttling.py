@@ -0,0 +1,236 @@
+"""Token bucket rate limiting, per player and endpoint, with separate read and write budgets
+
+Every player gets one bucket per endpoint (a ViewSet's `throttle_scope`,
+e.g. `ratings`) for reads and another for writes. A bucket holds up to N
+tokens for a rate of "N/period", refills at N per period, and each request
+takes one token, so a client can burst N requests and then keeps to the
+rate. Requests with no tokens left are answered 429 with Retry-After.
+Anonymous requests are bucketed by client address: REMOTE_ADDR, or with
+REST_FRAMEWORK['NUM_PROXIES'] set, the address that many proxies in front
+of the app forwarded, since X-Forwarded-For is otherwise the client's to
+choose.
+
+RATES sets the read and write budgets of every endpoint, SCOPES overrides
+them per endpoint; a rate of None doesn't limit. By default ratings and
+reviews get tighter write budgets than the rest, since every write to them
+queues on the database's single writer.
+
+Buckets live in a bounded in-process LRU, where a lock makes every take
+exact. With SHARED_CACHE set they live in a Django cache shared between
+processes instead, which has no compare-and-set to update a bucket with,
+so there each bucket is a fixed-window counter: N requests per period,
+counted with the cache's atomic add and incr (use memcached or Redis; the
+database and file caches implement incr as a get and a set). A client can
+spend up to 2N across a window boundary, but concurrent requests never
+spend the same token. Checking a bucket makes no database queries: the
+player comes from the user token authentication already loaded.
+
+Every throttled response carries X-RateLimit-Limit, X-RateLimit-Remaining
+and X-RateLimit-Reset (seconds until the bucket is full again), added by
+`rate_limit_middleware`.
+"""
+import math
+import threading
+import time
+from collections import namedtuple
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+from gamerraterapi.authentication import LRUCache
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Budget of each endpoint, as "requests/period" (s, min, hour or day)
+    'RATES': {'read': '600/min', 'write': '120/min'},
+    # throttle_scope -> {'read' or 'write': rate}, overriding RATES
+    'SCOPES': {
+        'ratings': {'write': '60/min'},
+        'reviews': {'write': '20/min'},
+    },
+    # Buckets kept in process
+    'MAX_ENTRIES': 100000,
+    # Alias of a Django cache shared between processes, or None for local only
+    'SHARED_CACHE': None,
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# The outcome of taking a token. `limit` is the bucket's capacity;
+# `retry_after` and `reset` are seconds until one token, and all of them,
+# are back
+Limit = namedtuple('Limit', 'allowed limit remaining retry_after reset')
+
+
+def get_setting(name):
+    return getattr(settings, 'GAMERRATER_THROTTLE', {}).get(name, DEFAULTS[name])
+
+
+def parse_rate(rate):
+    """(capacity, tokens per second) of a "requests/period" rate"""
+    count, period = rate.split('/')
+    return int(count), int(count) / PERIODS[period[0]]
+
+
+def get_rate(scope, kind):
+    """The (capacity, tokens per second) of a scope's reads or writes, or None"""
+    scoped = get_setting('SCOPES').get(scope, {})
+    rate = scoped[kind] if kind in scoped else get_setting('RATES').get(kind)
+    return parse_rate(rate) if rate else None
+
+
+def take(state, capacity, refill, now):
+    """Take a token from a bucket
+
+    Arguments:
+        state -- (tokens, time they were counted), or None for a full bucket
+    Returns:
+        tuple -- (Limit, the new state)
+    """
+    tokens, counted = state or (capacity, now)
+    tokens = min(capacity, tokens + (now - counted) * refill)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+
+    limit = Limit(
+        allowed=allowed, limit=capacity, remaining=int(tokens),
+        retry_after=0 if allowed else (1 - tokens) / refill,
+        reset=(capacity - tokens) / refill)
+    return limit, (tokens, now)
+
+
+buckets = LRUCache(get_setting('MAX_ENTRIES'), math.inf)
+
+# Makes each take on `buckets` atomic
+buckets_lock = threading.Lock()
+
+
+def count_in_window(shared, key, capacity, refill, now):
+    """Count a request against the shared fixed-window counter under `key`
+
+    Returns:
+        Limit -- For a window of one period, holding `capacity` requests
+    """
+    period = capacity / refill
+    window = math.floor(now / period)
+    window_key = f'gamerrater:bucket:{key}:{window}'
+    timeout = math.ceil(period) + 1
+    # add only creates the counter if it's missing, so no count is lost to
+    # a concurrent request creating it too
+    shared.add(window_key, 0, timeout)
+    try:
+        count = shared.incr(window_key)
+    except ValueError:
+        # Evicted between the add and the incr
+        count = 1 if shared.add(window_key, 1, timeout) else shared.incr(window_key)
+
+    allowed = count <= capacity
+    reset = (window + 1) * period - now
+    return Limit(allowed=allowed, limit=capacity, remaining=max(0, capacity - count),
+                 retry_after=0 if allowed else reset, reset=reset)
+
+
+def consume(key, capacity, refill):
+    """Take a token from the bucket under `key`"""
+    now = time.time()
+    alias = get_setting('SHARED_CACHE')
+    if alias is not None:
+        return count_in_window(caches[alias], key, capacity, refill, now)
+
+    with buckets_lock:
+        limit, state = take(buckets.get(key), capacity, refill, now)
+        buckets.set(key, state)
+    return limit
+
+
+def client_address(request):
+    """The address an anonymous request is bucketed by"""
+    if api_settings.NUM_PROXIES is None:
+        # Without a known number of proxies, X-Forwarded-For can't be trusted
+        return request.META.get('REMOTE_ADDR')
+    return BaseThrottle().get_ident(request)
+
+
+def check(request, user, scope):
+    """Take a token for a request from its player's bucket for this scope
+
+    Arguments:
+        request -- The Django request
+        user -- The authenticated user, or None
+    Returns:
+        Limit -- Or None when the request isn't limited
+    """
+    if not get_setting('ENABLED'):
+        return None
+
+    kind = 'read' if request.method in SAFE_METHODS else 'write'
+    rate = get_rate(scope, kind)
+    if rate is None:
+        return None
+
+    if user is not None and user.is_authenticated:
+        ident = f'user:{user.pk}'
+    else:
+        ident = f'addr:{client_address(request)}'
+
+    limit = consume(f'{scope}:{kind}:{ident}', *rate)
+    # For rate_limit_middleware
+    request.rate_limit = limit
+    return limit
+
+
+def view_scope(request, view):
+    resolver_match = getattr(request, 'resolver_match', None)
+    return getattr(view, 'throttle_scope', None) or (
+        resolver_match.view_name if resolver_match else view.__class__.__name__)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """DRF throttle taking a token from the player's bucket for the endpoint"""
+
+    limit = None
+
+    def allow_request(self, request, view):
+        # The Django request, which rate_limit_middleware sees
+        self.limit = check(request._request, request.user, view_scope(request, view))
+        return self.limit is None or self.limit.allowed
+
+    def wait(self):
+        # DRF truncates Retry-After to whole seconds; round up instead
+        return math.ceil(self.limit.retry_after) if self.limit else None
+
+
+def set_headers(request, response):
+    limit = getattr(request, 'rate_limit', None)
+    if limit is None:
+        return
+
+    response['X-RateLimit-Limit'] = str(limit.limit)
+    response['X-RateLimit-Remaining'] = str(limit.remaining)
+    response['X-RateLimit-Reset'] = str(math.ceil(limit.reset))
+    if not limit.allowed and not response.has_header('Retry-After'):
+        response['Retry-After'] = str(math.ceil(limit.retry_after))
+
+
+@sync_and_async_middleware
+def rate_limit_middleware(get_response):
+    """Add the X-RateLimit-* headers of the bucket a request took from"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            response = await get_response(request)
+            set_headers(request, response)
+            return response
+
+        return markcoroutinefunction(middleware)
+
+    def middleware(request):
+        response = get_response(request)
+        set_headers(request, response)
+        return response
+
+    return middleware
@@ -3,6 +3,9 @@ from .game import GameView
 from .category import CategoryView
 from .gamereview import GameReviewView
 from .ratings import RatingsView
+from .player import PlayerView
+from .picture import PictureView, picture_thumbnail
+from .metrics import metrics_view
 
 
 
@@ -4,21 +4,30 @@ from django.http import HttpResponseServerError
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers, status
-from gamerraterapi.models import Player, Category
+from gamerraterapi.cache import cache_response, invalidates, versioned
+from gamerraterapi.conditional import conditional
+from gamerraterapi.models import Category
+from gamerraterapi.shaping import Shape, ShapedSerializerMixin, defer_unused
+
+
+def category_dependencies(request, pk):
+    """Rows a category response is built from, for its ETag"""
+    return [Category.objects.filter(pk=pk)]
 
 
 class CategoryView(ViewSet):
     """Level up categories"""
 
+    # Rate limit buckets are per scope (see gamerraterapi/throttling.py)
+    throttle_scope = 'categories'
+
+    @invalidates('categories', 'games')
     def create(self, request):
         """Handle POST operations
         Returns:
             Response -- JSON serialized category instance
         """
 
-        # Uses the token passed in the `Authorization` header
-        player = Player.objects.get(user=request.auth.user)
-
         # Try to save the new category to the database, then
         # serialize the category instance as JSON, and send the
         # JSON as a response to the client request
@@ -27,7 +36,7 @@ class CategoryView(ViewSet):
             # and set its properties from what was sent in the
             # body of the request from the client.
             category = Category.objects.create(
-                category=request.data["label"]
+                label=request.data["label"]
             )
             serializer = CategorySerializer(category, context={'request': request})
             return Response(serializer.data)
@@ -38,6 +47,8 @@ class CategoryView(ViewSet):
         except ValidationError as ex:
             return Response({"reason": ex.message}, status=status.HTTP_400_BAD_REQUEST)
 
+    @cache_response('categories')
+    @conditional(category_dependencies)
     def retrieve(self, request, pk=None):
         """Handle GET requests for single category
         Returns:
@@ -55,6 +66,7 @@ class CategoryView(ViewSet):
         except Exception as ex:
             return HttpResponseServerError(ex)
 
+    @invalidates('categories', 'games')
     def update(self, request, pk=None):
         """Handle PUT requests for a category
         Returns:
@@ -65,7 +77,7 @@ class CategoryView(ViewSet):
         # creating a new instance of Category, get the category record
         # from the database whose primary key is `pk`
         category = Category.objects.get(pk=pk)
-        category.category = request.data["label"]
+        category.label = request.data["label"]
 
         category.save()
 
@@ -73,6 +85,7 @@ class CategoryView(ViewSet):
         # server is not sending back any data in the response
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
+    @invalidates('categories', 'games')
     def destroy(self, request, pk=None):
         """Handle DELETE requests for a single category
         Returns:
@@ -90,20 +103,23 @@ class CategoryView(ViewSet):
         except Exception as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @cache_response('categories')
+    @versioned('categories')
     def list(self, request):
         """Handle GET requests to categories resource
         Returns:
             Response -- JSON serialized list of categories
         """
         # Get all category records from the database
-        categories = Category.objects.all()
+        categories = defer_unused(
+            Category.objects.all(), Shape.from_request(request), {'label': ['label']})
 
         serializer = CategorySerializer(
             categories, many=True, context={'request': request})
         return Response(serializer.data)
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     """JSON serializer for categories
     Arguments:
         serializer type
@@ -1,25 +1,89 @@
 """View module for handling requests about games"""
 from django.core.exceptions import ValidationError
+from django.db.models import F
 from django.http import HttpResponseServerError
+from rest_framework.decorators import action
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers, status
-from gamerraterapi.models import Game, Player, Category
+from gamerraterapi.models import Game, Category, GameCategory
+from gamerraterapi import search
+from gamerraterapi.filters import FilterError, filter_games
+from gamerraterapi.cache import cache_response, invalidates, versioned
+from gamerraterapi.conditional import conditional
+from gamerraterapi.pagination import PaginationError, get_limit, list_response
+from gamerraterapi.serialization import ValuesSerializer
+from gamerraterapi.shaping import Shape, ShapedSerializerMixin, defer_unused
+from gamerraterapi.stats import game_stats
 from gamerraterapi.views.category import CategorySerializer
-# from django.db.models import Q
+
+def game_dependencies(request, pk):
+    """Rows a game response is built from, for its ETag"""
+    return [Game.objects.filter(pk=pk), Category.objects.filter(categories=pk)]
+
+
+def game_list_queryset(games, params, sort_keys):
+    """Apply the list filters and ?q= search to a games queryset
+
+    Returns:
+        tuple -- (games, sort keys, default orderby)
+    Raises:
+        FilterError -- For a filter param that can't be parsed
+    """
+    games = filter_games(games, params)
+    default_ordering = 'id'
+
+    # http://localhost:8000/games?q=catan
+    search_text = params.get('q', None)
+    if search_text is not None:
+        if search.fts_enabled():
+            # Rank comes from the FTS index inside the query, so ordering
+            # and cursors work the same as any other sort key
+            games = search.search_games(games, search_text)
+            sort_keys = {**sort_keys, 'rank': 'search_rank'}
+            default_ordering = 'rank'
+        else:
+            games = games.filter(search.contains_filter(search_text)).distinct()
+
+    return games, sort_keys, default_ordering
+
 
 class GameView(ViewSet):
     """Level up games"""
 
+    # Rate limit buckets are per scope (see gamerraterapi/throttling.py)
+    throttle_scope = 'games'
+
+    # Values clients may pass as ?orderby=, mapped to the field sorted on
+    sort_keys = {'id': 'id', 'title': 'title', 'year_released': 'year_released',
+                 'num_players': 'num_players', 'gameplay_length': 'gameplay_length',
+                 'age': 'age', 'rating': 'rating_average', 'rating_count': 'rating_count'}
+
+    # Model fields each serialized field reads, for ?fields=
+    columns = {'title': ['title'], 'description': ['description'], 'designer': ['designer'],
+               'year_released': ['year_released'], 'num_players': ['num_players'],
+               'gameplay_length': ['gameplay_length'], 'age': ['age'],
+               'average_rating': ['rating_count', 'rating_sum']}
+
+    def get_queryset(self):
+        """Games with their categories and rating aggregates loaded up front,
+        so serializing any number of them costs a fixed number of queries.
+        Only what the requested ?fields= and ?expand= need is loaded.
+        """
+        games = Game.objects.for_api()
+        shape = Shape.from_request(self.request)
+        if shape is not None and not shape.includes('categories'):
+            games = games.prefetch_related(None)
+
+        return defer_unused(games, shape, self.columns, keep=self.sort_keys.values())
+
+    @invalidates('games', 'ratings', 'reviews')
     def create(self, request):
         """Handle POST operations
         Returns:
             Response -- JSON serialized game instance
         """
 
-        # Uses the token passed in the `Authorization` header
-        player = Player.objects.get(user=request.auth.user)
-
         # Try to save the new game to the database, then
         # serialize the game instance as JSON, and send the
         # JSON as a response to the client request
@@ -47,6 +111,8 @@ class GameView(ViewSet):
         except ValidationError as ex:
             return Response({"reason": ex.message}, status=status.HTTP_400_BAD_REQUEST)
 
+    @cache_response('games', 'categories')
+    @conditional(game_dependencies)
     def retrieve(self, request, pk=None):
         """Handle GET requests for single game
         Returns:
@@ -58,19 +124,18 @@ class GameView(ViewSet):
             #   http://localhost:8000/games/2
             #
             # The `2` at the end of the route becomes `pk`
-            game = Game.objects.get(pk=pk)
+            game = self.get_queryset().get(pk=pk)
             serializer = GameSerializer(game, context={'request': request})
             return Response(serializer.data)
         except Exception as ex:
             return HttpResponseServerError(ex)
 
+    @invalidates('games', 'ratings', 'reviews')
     def update(self, request, pk=None):
         """Handle PUT requests for a game
         Returns:
             Response -- Empty body with 204 status code
         """
-        player = Player.objects.get(user=request.auth.user)
-
         # Do mostly the same thing as POST, but instead of
         # creating a new instance of Game, get the game record
         # from the database whose primary key is `pk`
@@ -84,12 +149,16 @@ class GameView(ViewSet):
         game.age = request.data["age"]
         game.categories.set(request.data["categories"])
 
-        game.save()
+        # Only write the edited columns so a concurrent rating can't
+        # have its aggregates overwritten by the values loaded here
+        game.save(update_fields=['title', 'description', 'designer', 'year_released',
+                                 'num_players', 'gameplay_length', 'age', 'updated_at'])
 
         # 204 status code means everything worked but the
         # server is not sending back any data in the response
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
+    @invalidates('games', 'ratings', 'reviews')
     def destroy(self, request, pk=None):
         """Handle DELETE requests for a single game
         Returns:
@@ -107,43 +176,167 @@ class GameView(ViewSet):
         except Exception as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @cache_response('games', 'categories')
+    @versioned('games', 'categories')
     def list(self, request):
         """Handle GET requests to games resource
         Returns:
             Response -- JSON serialized list of games
         """
-        
-        player = Player.objects.get(user=request.auth.user)
-        # Get all game records from the database
-        games = Game.objects.all()
-
-        # search_text = self.request.query_params.get('q', None)
-        # order_by_prop = self.request.query_params.get('orderby', None)
-
-        # if search_text is not None:
-        #     games = Game.objects.filter(
-        #         Q(title__contains=search_text) |
-        #         Q(description__contains=search_text) |
-        #         Q(designer__contains=search_text)
-        #     )
-
-        # if order_by_prop is not None:
-        #     games = Game.objects.order_by(order_by_prop)
-        serializer = GameSerializer(
-            games, many=True, context={'request': request})
-        
-        return Response(serializer.data)
-
-
-class GameSerializer(serializers.ModelSerializer):
+        # Get all game records from the database, narrowed by any filters
+        #   http://localhost:8000/games?category=2&numPlayersMin=3&orderby=-rating
+        try:
+            games, sort_keys, default_ordering = game_list_queryset(
+                self.get_queryset(), request.query_params, self.sort_keys)
+        except FilterError as ex:
+            return Response({'message': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return list_response(request, games, GameSerializer, sort_keys, default_ordering,
+                             values_serializer=GameValuesSerializer())
+
+    @action(detail=False)
+    @cache_response('games', 'categories', 'ratings', 'reviews')
+    def top(self, request):
+        """Handle GET requests for the top rated games
+        Returns:
+            Response -- JSON serialized games with their Bayesian score
+        """
+        return self.leaderboard(request, 'bayesian_score')
+
+    @action(detail=False)
+    @cache_response('games', 'categories', 'ratings', 'reviews')
+    def trending(self, request):
+        """Handle GET requests for the games with the most recent activity
+        Returns:
+            Response -- JSON serialized games with their trending score
+        """
+        return self.leaderboard(request, 'trending_score')
+
+    @action(detail=True)
+    @cache_response('games', 'ratings')
+    def stats(self, request, pk=None):
+        """Handle GET requests for a game's rating statistics
+        Returns:
+            Response -- JSON serialized count, mean, median, stddev,
+                histogram and recent-window averages
+        """
+        try:
+            game = Game.objects.only(
+                'id', 'rating_count', 'rating_sum', 'rating_average',
+                'rating_histogram').get(pk=pk)
+        except Game.DoesNotExist as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response(game_stats(game))
+
+    @action(detail=True)
+    @cache_response('games', 'categories', 'similar')
+    def similar(self, request, pk=None):
+        """Handle GET requests for the games most similar to a game, by the
+        ratings of players who rated both (see gamerraterapi/recommendations.py)
+        Returns:
+            Response -- JSON serialized games with their similarity score
+        """
+        try:
+            limit = get_limit(request, default=10, maximum=100)
+        except PaginationError as ex:
+            return Response({'message': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not Game.objects.filter(pk=pk).exists():
+            return Response({'message': 'Game matching query does not exist.'},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        games = self.get_queryset().filter(neighbour_of__game=pk).annotate(
+            score=F('neighbour_of__score')).order_by('-neighbour_of__score', 'id')
+        data = []
+        for game in games[:limit]:
+            item = GameSerializer(game, context={'request': request}).data
+            item['score'] = game.score
+            data.append(item)
+
+        return Response(data)
+
+    def leaderboard(self, request, score_field):
+        """The first ?limit= (default 10) games by a precomputed ranking score,
+        read off the ranking index rather than sorting every game
+        """
+        try:
+            limit = get_limit(request, default=10, maximum=100)
+        except PaginationError as ex:
+            return Response({'message': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+        games = self.get_queryset().filter(**{f'ranking__{score_field}__isnull': False}).annotate(
+            score=F(f'ranking__{score_field}')).order_by(f'-ranking__{score_field}', 'ranking__game')
+        data = []
+        for game in games[:limit]:
+            item = GameSerializer(game, context={'request': request}).data
+            item['score'] = game.score
+            data.append(item)
+
+        return Response(data)
+
+
+class GameSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     """JSON serializer for games
     Arguments:
         serializer type
     """
-    # categories = CategorySerializer(many=True)
-    
+    categories = CategorySerializer(many=True)
+
     class Meta:
         model = Game
         fields = ('id', 'title', 'description', 'designer',
                   'year_released', 'num_players', 'gameplay_length', 'age', 'categories', 'average_rating')
-        depth = 1
\ No newline at end of file
+        depth = 1
+
+
+class GameValuesSerializer(ValuesSerializer):
+    """GameSerializer's output built from `.values()` rows"""
+
+    columns = ('id', 'title', 'description', 'designer', 'year_released',
+               'num_players', 'gameplay_length', 'age', 'rating_count', 'rating_sum')
+
+    # Games whose categories are looked up per query, kept under SQLite's
+    # default limit of 32766 query params
+    CATEGORY_BATCH_SIZE = 20000
+
+    def category_links(self, ids):
+        """(game id, category id, label) for these games, in batches"""
+        for start in range(0, len(ids), self.CATEGORY_BATCH_SIZE):
+            yield GameCategory.objects.filter(
+                game_id__in=ids[start:start + self.CATEGORY_BATCH_SIZE]
+            ).order_by('category_id').values_list('game_id', 'category_id', 'category__label')
+
+    def build(self, rows, links):
+        categories = {row['id']: [] for row in rows}
+        for game_id, category_id, label in links:
+            categories[game_id].append({'id': category_id, 'label': label})
+
+        return [self.to_representation(row, categories[row['id']]) for row in rows]
+
+    def serialize(self, rows):
+        ids = [row['id'] for row in rows]
+        return self.build(rows, [link for batch in self.category_links(ids) for link in batch])
+
+    async def aserialize(self, rows):
+        ids = [row['id'] for row in rows]
+        links = []
+        for batch in self.category_links(ids):
+            links.extend([link async for link in batch])
+        return self.build(rows, links)
+
+    def to_representation(self, row, categories=()):
+        return {
+            'id': row['id'],
+            'title': row['title'],
+            'description': row['description'],
+            'designer': row['designer'],
+            'year_released': row['year_released'],
+            'num_players': row['num_players'],
+            'gameplay_length': row['gameplay_length'],
+            'age': row['age'],
+            'categories': list(categories),
+            # Same as Game.average_rating
+            'average_rating': (row['rating_sum'] / row['rating_count']
+                               if row['rating_count'] > 0 else 0),
+        }
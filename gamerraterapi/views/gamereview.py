@@ -1,24 +1,64 @@
 """View module for handling requests about games"""
 from django.core.exceptions import ValidationError
 from django.http import HttpResponseServerError
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers, status
-from gamerraterapi.models import Player, Review
+from gamerraterapi.models import Game, Player, Review
+from gamerraterapi.bulk import bulk_response, import_reviews
+from gamerraterapi.cache import cache_response, invalidates, versioned
+from gamerraterapi.conditional import conditional
+from gamerraterapi.pagination import list_response
+from gamerraterapi.parsers import NDJSONParser
+from gamerraterapi.shaping import Shape, ShapedSerializerMixin, defer_unused
 from django.contrib.auth import get_user_model
 
 
+def review_dependencies(request, pk):
+    """Rows a review response is built from, for its ETag"""
+    return [Review.objects.filter(pk=pk), Game.objects.filter(review=pk)]
+
+
 class GameReviewView(ViewSet):
     """Level up games"""
 
+    # Rate limit buckets are per scope (see gamerraterapi/throttling.py)
+    throttle_scope = 'reviews'
+
+    # Values clients may pass as ?orderby=, mapped to the field sorted on
+    sort_keys = {'id': 'id', 'date': 'date'}
+
+    # Model fields each serialized field reads, for ?fields=
+    columns = {'review': ['review'], 'date': ['date'], 'game': ['game'], 'player': ['player']}
+
+    def get_queryset(self):
+        """Reviews with the game (and its categories) and player loaded up
+        front, when the requested ?fields= and ?expand= nest them
+        """
+        shape = Shape.from_request(self.request)
+        nesting = shape or Shape()
+        reviews = Review.objects.all()
+        if nesting.expands('game'):
+            reviews = reviews.select_related('game')
+            if nesting.child('game').includes('categories'):
+                reviews = reviews.prefetch_related('game__categories')
+        if nesting.expands('player'):
+            reviews = reviews.select_related(
+                'player__user' if nesting.child('player').expands('user') else 'player')
+
+        return defer_unused(reviews, shape, self.columns, keep=self.sort_keys.values())
+
+    @invalidates('reviews')
     def create(self, request):
         """Handle POST operations
         Returns:
             Response -- JSON serialized game instance
         """
 
-        # Uses the token passed in the `Authorization` header
-        player = Player.objects.get(user=request.auth.user)
+        # The player is resolved along with the token in the `Authorization` header
+        player = request.player
 
         # Try to save the new game to the database, then
         # serialize the game instance as JSON, and send the
@@ -43,25 +83,35 @@ class GameReviewView(ViewSet):
         except ValidationError as ex:
             return Response({"reason": ex.message}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    @invalidates('reviews')
+    def bulk(self, request):
+        """Handle POST requests with many reviews, as a JSON array or NDJSON
+        Returns:
+            Response -- Count of created reviews and per-item errors
+        """
+        return bulk_response(request, import_reviews)
+
+    @cache_response('reviews', 'games')
+    @conditional(review_dependencies)
     def retrieve(self, request, pk=None):
         """Handle GET requests for single game
         Returns:
             Response -- JSON serialized game instance
         """
         try:
-            review = Review.objects.get(pk=pk)
+            review = self.get_queryset().get(pk=pk)
             serializer = ReviewSerializer(review, context={'request': request})
             return Response(serializer.data)
         except Exception as ex:
             return HttpResponseServerError(ex)
 
+    @invalidates('reviews')
     def update(self, request, pk=None):
         """Handle PUT requests for a game
         Returns:
             Response -- Empty body with 204 status code
         """
-        player = Player.objects.get(user=request.auth.user)
-
         # Do mostly the same thing as POST, but instead of
         # creating a new instance of Game, get the game record
         # from the database whose primary key is `pk`
@@ -75,6 +125,7 @@ class GameReviewView(ViewSet):
         # server is not sending back any data in the response
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
+    @invalidates('reviews')
     def destroy(self, request, pk=None):
         """Handle DELETE requests for a single game
         Returns:
@@ -92,29 +143,29 @@ class GameReviewView(ViewSet):
         except Exception as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @cache_response('reviews', 'games')
+    @versioned('reviews', 'games')
     def list(self, request):
         """Handle GET requests to games resource
         Returns:
             Response -- JSON serialized list of games
         """
-        reviews = Review.objects.all()
+        reviews = self.get_queryset()
 
         # http://localhost:8000/reviews?gameId=1
         game = self.request.query_params.get('gameId', None)
         if game is not None:
             reviews = reviews.filter(game_id__id=game)
-        serializer = ReviewSerializer(
-            reviews, many=True, context={'request': request})
-        return Response(serializer.data)
+        return list_response(request, reviews, ReviewSerializer, self.sort_keys)
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ['first_name', 'last_name']
 
 
-class PlayerSerializer(serializers.ModelSerializer):
+class PlayerSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(many=False)
 
     class Meta:
@@ -122,12 +173,25 @@ class PlayerSerializer(serializers.ModelSerializer):
         fields = ['user']
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class GameSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
+    """JSON serializer for a review's game, without the rating aggregates
+    Arguments:
+        serializer type
+    """
+
+    class Meta:
+        model = Game
+        fields = ('id', 'title', 'description', 'designer',
+                  'year_released', 'num_players', 'gameplay_length', 'age', 'categories')
+
+
+class ReviewSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     """JSON serializer for games
     Arguments:
         serializer type
     """
     player = PlayerSerializer(many=False)
+    game = GameSerializer(many=False)
 
     class Meta:
         model = Review
@@ -0,0 +1,22 @@
+"""View module for the Prometheus metrics endpoint"""
+import hmac
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from gamerraterapi import metrics
+
+
+@require_safe
+def metrics_view(request):
+    """Handle GET requests for this process's request metrics, protected by
+    GAMERRATER_METRICS['TOKEN'] as a bearer token when it's set
+    Returns:
+        HttpResponse -- Metrics in the Prometheus text exposition format
+    """
+    token = metrics.get_setting('TOKEN')
+    if token is not None:
+        sent = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(sent.encode(), f'Bearer {token}'.encode()):
+            return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+
+    return HttpResponse(
+        metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,133 @@
+"""View module for handling requests about pictures"""
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponseNotFound
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.viewsets import ViewSet
+from rest_framework.response import Response
+from rest_framework import serializers, status
+from gamerraterapi import pictures
+from gamerraterapi.models import Game, Picture
+
+# A thumbnail's URL names its content, so it never changes
+THUMBNAIL_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class PictureView(ViewSet):
+    """Level up pictures"""
+
+    # Rate limit buckets are per scope (see gamerraterapi/throttling.py)
+    throttle_scope = 'pictures'
+
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+
+    def create(self, request):
+        """Handle POST operations with a multipart `image` and `gameId`; the
+        thumbnails are generated in the background
+        Returns:
+            Response -- JSON serialized picture instance
+        """
+        upload = request.FILES.get('image')
+        if upload is None:
+            return Response({'message': 'image is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            game = Game.objects.only('id').get(pk=request.data.get('gameId'))
+        except (Game.DoesNotExist, ValueError, TypeError):
+            return Response({'message': 'gameId must be an existing game'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            picture = pictures.create_picture(request.player, game, upload)
+        except pictures.PictureError as ex:
+            return Response({'message': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = PictureSerializer(picture, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        """Handle GET requests for single picture
+        Returns:
+            Response -- JSON serialized picture instance
+        """
+        try:
+            picture = Picture.objects.get(pk=pk)
+        except Picture.DoesNotExist as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = PictureSerializer(picture, context={'request': request})
+        return Response(serializer.data)
+
+    def list(self, request):
+        """Handle GET requests to pictures resource, optionally ?gameId=
+        Returns:
+            Response -- JSON serialized list of pictures
+        """
+        queryset = Picture.objects.order_by('id')
+        game = request.query_params.get('gameId', None)
+        if game is not None:
+            queryset = queryset.filter(game_id=game)
+
+        serializer = PictureSerializer(queryset, many=True, context={'request': request})
+        return Response(serializer.data)
+
+
+def preferred_format(request):
+    """WebP for clients that accept it, JPEG for the rest"""
+    accept = request.headers.get('Accept', '')
+    return 'webp' if 'image/webp' in accept and 'webp' in pictures.get_setting('FORMATS') \
+        else 'jpeg'
+
+
+@require_safe
+def picture_thumbnail(request, digest, size, image_format=None):
+    """Handle GET requests for a thumbnail, as /thumbnails/<sha256>/<size>
+    in the format the client prefers or /thumbnails/<sha256>/<size>.<format>
+    Returns:
+        FileResponse -- The thumbnail, cacheable for a year
+    """
+    negotiated = image_format is None
+    if negotiated:
+        image_format = preferred_format(request)
+    if size not in pictures.get_setting('SIZES') or \
+            image_format not in pictures.get_setting('FORMATS'):
+        return HttpResponseNotFound()
+
+    name = pictures.thumbnail_name(digest, size, image_format)
+    etag = quote_etag(f'{digest}-{size}-{image_format}')
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        if not default_storage.exists(name):
+            return HttpResponseNotFound()
+        response = FileResponse(
+            default_storage.open(name), content_type=pictures.CONTENT_TYPES[image_format])
+
+    response['ETag'] = etag
+    response['Cache-Control'] = THUMBNAIL_CACHE_CONTROL
+    if negotiated:
+        patch_vary_headers(response, ['Accept'])
+    return response
+
+
+class PictureSerializer(serializers.ModelSerializer):
+    """JSON serializer for pictures, with their thumbnail URLs once they're ready"""
+
+    thumbnails = serializers.SerializerMethodField()
+
+    def get_thumbnails(self, picture):
+        if picture.status != Picture.READY:
+            return None
+
+        request = self.context.get('request')
+        urls = {}
+        for size in pictures.get_setting('SIZES'):
+            path = reverse('picture-thumbnail', kwargs={'digest': picture.sha256, 'size': size})
+            urls[size] = request.build_absolute_uri(path) if request else path
+        return urls
+
+    class Meta:
+        model = Picture
+        fields = ('id', 'game', 'player', 'sha256', 'width', 'height', 'status', 'thumbnails')
@@ -0,0 +1,45 @@
+"""View module for handling requests about players"""
+from rest_framework.decorators import action
+from rest_framework.viewsets import ViewSet
+from rest_framework.response import Response
+from rest_framework import status
+from gamerraterapi import feeds
+from gamerraterapi.models import Game
+from gamerraterapi.pagination import PaginationError, get_limit
+from gamerraterapi.views.game import GameSerializer
+
+
+class PlayerView(ViewSet):
+    """Level up players"""
+
+    # Rate limit buckets are per scope (see gamerraterapi/throttling.py)
+    throttle_scope = 'players'
+
+    @action(detail=False, url_path='me/feed')
+    def feed(self, request):
+        """Handle GET requests for the games picked for the requesting player
+        from the categories they rate highly and what's popular
+        Returns:
+            Response -- JSON serialized unrated games with their feed score
+        """
+        try:
+            limit = get_limit(request, default=20, maximum=feeds.get_setting('FEED_SIZE'))
+        except PaginationError as ex:
+            return Response({'message': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The player is resolved along with the token in the `Authorization` header
+        player = request.player
+        if player is None:
+            return Response({'message': 'Only players have a feed'},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        ranked = feeds.get_feed(player)[:limit]
+        games = Game.objects.for_api().in_bulk([game_id for game_id, _ in ranked])
+        data = []
+        for game_id, score in ranked:
+            if game_id in games:
+                item = GameSerializer(games[game_id], context={'request': request}).data
+                item['score'] = score
+                data.append(item)
+
+        return Response(data)
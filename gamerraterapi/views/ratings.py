@@ -1,24 +1,82 @@
 """View module for handling requests about games"""
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.http import HttpResponseServerError
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers, status
 from gamerraterapi.models import Player, Rating, Game
+from gamerraterapi import feeds, rankings, writebehind
+from gamerraterapi.bulk import BulkRatingSerializer, bulk_response, import_ratings
+from gamerraterapi.cache import invalidates, versioned
+from gamerraterapi.conditional import conditional
+from gamerraterapi.pagination import list_response
+from gamerraterapi.parsers import NDJSONParser
+from gamerraterapi.routers import token_key
+from gamerraterapi.serialization import ValuesSerializer
+from gamerraterapi.shaping import Shape, ShapedSerializerMixin, defer_unused
 from django.contrib.auth import get_user_model
 
 
+def rating_dependencies(request, pk):
+    """Rows a rating response is built from, for its ETag"""
+    return [Rating.objects.filter(pk=pk), Game.objects.filter(rating=pk)]
+
+
 class RatingsView(ViewSet):
     """Level up games"""
 
+    # Rate limit buckets are per scope (see gamerraterapi/throttling.py)
+    throttle_scope = 'ratings'
+
+    # Values clients may pass as ?orderby=, mapped to the field sorted on
+    sort_keys = {'id': 'id', 'rating': 'rating'}
+
+    # Model fields each serialized field reads, for ?fields=
+    columns = {'rating': ['rating'], 'game': ['game'], 'player': ['player']}
+
+    def get_queryset(self):
+        """Ratings with the game and player joined in, when the requested
+        ?fields= and ?expand= nest them
+        """
+        shape = Shape.from_request(self.request)
+        nesting = shape or Shape()
+        related = []
+        if nesting.expands('game'):
+            related.append('game')
+        if nesting.expands('player'):
+            related.append(
+                'player__user' if nesting.child('player').expands('user') else 'player')
+
+        # select_related() with no arguments would follow every relation
+        ratings = Rating.objects.select_related(*related) if related else Rating.objects.all()
+        return defer_unused(ratings, shape, self.columns, keep=self.sort_keys.values())
+
+    @invalidates('ratings', 'games')
     def create(self, request):
         """Handle POST operations
         Returns:
             Response -- JSON serialized game instance
         """
 
-        # Uses the token passed in the `Authorization` header
-        player = Player.objects.get(user=request.auth.user)
+        # The player is resolved along with the token in the `Authorization` header
+        player = request.player
+        if player is None:
+            return Response({'message': 'This account has no player to rate as'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # The same rules as bulk ratings: a game id and a rating from 1 to 10
+        data = BulkRatingSerializer(data={
+            'gameId': request.data.get('gameId'), 'rating': request.data.get('rating')})
+        if not data.is_valid():
+            return Response(data.errors, status=status.HTTP_400_BAD_REQUEST)
+        game_id = data.validated_data['gameId']
+        value = data.validated_data['rating']
+
+        if writebehind.enabled():
+            return self.log_rating(request, player, game_id, value)
 
         # Try to save the new game to the database, then
         # serialize the game instance as JSON, and send the
@@ -27,14 +85,14 @@ class RatingsView(ViewSet):
             # Create a new Python instance of the Game class
             # and set its properties from what was sent in the
             # body of the request from the client.
-            rating = Rating.objects.create(
-                rating=request.data["rating"],
-                game=Game.objects.get(pk=request.data["gameId"]),
-                player=player
-            )
+            # Rating a game again replaces the player's earlier rating
+            game = Game.objects.get(pk=game_id)
+            rating, created = game.set_rating(player, value)
             serializer = RatingSerializer(rating, context={'request': request})
 
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(
+                serializer.data,
+                status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
         # If anything went wrong, catch the exception and
         # send a response with a 400 status code to tell the
@@ -42,45 +100,95 @@ class RatingsView(ViewSet):
         except ValidationError as ex:
             return Response({"reason": ex.message}, status=status.HTTP_400_BAD_REQUEST)
 
+        except Game.DoesNotExist:
+            return Response({'message': 'Game does not exist'}, status=status.HTTP_404_NOT_FOUND)
+
+    def log_rating(self, request, player, game_id, value):
+        """Handle POST operations with GAMERRATER_RATING_LOG enabled, appending
+        the rating to the write-behind log (see gamerraterapi/writebehind.py)
+        Returns:
+            Response -- 202 with the logged rating, applied to the database shortly
+        """
+        if not Game.objects.filter(pk=game_id).exists():
+            return Response({'message': 'Game does not exist'}, status=status.HTTP_404_NOT_FOUND)
+
+        position = writebehind.append(game_id, player.id, value)
+        # Their next read waits for this rating to be applied
+        key = token_key(request)
+        if key is not None:
+            writebehind.mark_pending(key, position)
+
+        return Response({'game': game_id, 'rating': value, 'status': 'pending'},
+                        status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    @invalidates('ratings', 'games')
+    def bulk(self, request):
+        """Handle POST requests with many ratings, as a JSON array or NDJSON
+        Returns:
+            Response -- Counts of created and updated ratings and per-item errors
+        """
+        writebehind.apply_logged()
+        return bulk_response(request, import_ratings)
+
+    @conditional(rating_dependencies)
     def retrieve(self, request, pk=None):
         """Handle GET requests for single game
         Returns:
             Response -- JSON serialized game instance
         """
         try:
-            rating = Rating.objects.get(pk=pk)
+            rating = self.get_queryset().get(pk=pk)
             serializer = RatingSerializer(rating, context={'request': request})
             return Response(serializer.data)
         except Exception as ex:
             return HttpResponseServerError(ex)
 
+    @invalidates('ratings', 'games')
     def update(self, request, pk=None):
         """Handle PUT requests for a game
         Returns:
             Response -- Empty body with 204 status code
         """
-        player = Player.objects.get(user=request.auth.user)
+        data = BulkRatingSerializer(data={'rating': request.data.get('rating')}, partial=True)
+        if not data.is_valid():
+            return Response(data.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # So a rating logged before this one isn't drained over it
+        writebehind.apply_logged()
 
         # Do mostly the same thing as POST, but instead of
         # creating a new instance of Game, get the game record
         # from the database whose primary key is `pk`
-        rating = Rating.objects.get(pk=pk)
-        rating.rating = request.data["rating"]
+        with transaction.atomic():
+            rating = Rating.objects.select_for_update().get(pk=pk)
+            previous = rating.rating
+            rating.rating = data.validated_data['rating']
 
-        rating.save()
+            rating.save()
+            Game.adjust_rating_aggregates(
+                rating.game_id, added=rating.rating, removed=previous)
 
         # 204 status code means everything worked but the
         # server is not sending back any data in the response
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
+    @invalidates('ratings', 'games')
     def destroy(self, request, pk=None):
         """Handle DELETE requests for a single game
         Returns:
             Response -- 200, 404, or 500 status code
         """
+        # So a rating logged before this delete isn't drained after it
+        writebehind.apply_logged()
+
         try:
-            rating = Rating.objects.get(pk=pk)
-            rating.delete()
+            with transaction.atomic():
+                rating = Rating.objects.select_for_update().get(pk=pk)
+                rating.delete()
+                Game.adjust_rating_aggregates(rating.game_id, removed=rating.rating)
+                feeds.adjust_affinities([(rating.player_id, rating.game_id, rating.rating, None)])
+                rankings.refresh_rankings_on_commit([rating.game_id])
 
             return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -90,35 +198,35 @@ class RatingsView(ViewSet):
         except Exception as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @versioned('ratings', 'games')
     def list(self, request):
         """Handle GET requests to games resource
         Returns:
             Response -- JSON serialized list of games
         """
-        ratings = Rating.objects.all()
+        ratings = self.get_queryset()
 
         game = self.request.query_params.get('gameId', None)
         if game is not None:
             ratings = ratings.filter(game_id__id=game)
-        serializer = RatingSerializer(
-            ratings, many=True, context={'request': request})
-        return Response(serializer.data)
+        return list_response(request, ratings, RatingSerializer, self.sort_keys,
+                             values_serializer=RatingValuesSerializer())
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ['first_name', 'last_name']
 
 
-class PlayerSerializer(serializers.ModelSerializer):
+class PlayerSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(many=False)
 
     class Meta:
         model = Player
         fields = ['user']
 
-class GameSerializer(serializers.ModelSerializer):
+class GameSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     """JSON serializer for games
     Arguments:
         serializer type
@@ -130,7 +238,7 @@ class GameSerializer(serializers.ModelSerializer):
                   'year_released', 'num_players', 'gameplay_length', 'age')
         depth = 1
 
-class RatingSerializer(serializers.ModelSerializer):
+class RatingSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     """JSON serializer for games
     Arguments:
         serializer type
@@ -142,4 +250,35 @@ class RatingSerializer(serializers.ModelSerializer):
         model = Rating
         fields = ('id', 'rating', 'game',
                   'player')
-        depth = 1
\ No newline at end of file
+        depth = 1
+
+
+class RatingValuesSerializer(ValuesSerializer):
+    """RatingSerializer's output built from `.values()` rows"""
+
+    columns = ('id', 'rating', 'game_id', 'game__title', 'game__description',
+               'game__designer', 'game__year_released', 'game__num_players',
+               'game__gameplay_length', 'game__age',
+               'player__user__first_name', 'player__user__last_name')
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'rating': row['rating'],
+            'game': {
+                'id': row['game_id'],
+                'title': row['game__title'],
+                'description': row['game__description'],
+                'designer': row['game__designer'],
+                'year_released': row['game__year_released'],
+                'num_players': row['game__num_players'],
+                'gameplay_length': row['game__gameplay_length'],
+                'age': row['game__age'],
+            },
+            'player': {
+                'user': {
+                    'first_name': row['player__user__first_name'],
+                    'last_name': row['player__user__last_name'],
+                },
+            },
+        }
@@ -0,0 +1,375 @@
+"""Write-behind rating submissions through a durable append-only log
+
+With GAMERRATER_RATING_LOG['ENABLED'], POST /ratings appends the rating to
+a log on local disk and answers 202 without touching the database's write
+lock. A worker drains the log in batches: each batch is one transaction
+that upserts the ratings (the last rating of a game by a player wins),
+rebuilds the games' aggregates, and moves the checkpoint, so a batch is
+applied exactly once however the process dies.
+
+The log is a directory of segments, 000000000001.log onwards, each line a
+record:
+
+    <crc32 of the JSON, 8 hex digits> <JSON>\\n
+
+Appends from every thread and process on the machine are serialized by a
+lock file and fsynced (unless FSYNC is off) before the 202 is sent. A
+crash in the middle of an append leaves a line without its newline at the
+end of the last segment; readers stop there and the next append cuts it
+off. A line that fails its checksum is skipped. Segments are rolled over at
+SEGMENT_BYTES and deleted once fully applied.
+
+Read-your-writes: the 202 marks the player's token with the log position
+of their rating (in the cache, like gamerraterapi.routers' stickiness), and
+`pending_writes_middleware` drains the log up to that position before
+answering their next read. Other players see the rating once the worker
+has applied it, within DRAIN_INTERVAL seconds when it keeps up.
+
+Rating writes that still go straight to the database (PUT, DELETE and bulk
+imports) call `apply_logged` first, so a rating logged before them can't
+be drained on top of them later.
+
+The worker is a thread in each web process (WORKER), or the
+drain_rating_log command. Running both is safe: batches are serialized by
+the checkpoint row's lock.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, transaction
+from django.utils.decorators import sync_and_async_middleware
+from gamerraterapi import cache
+from gamerraterapi.bulk import upsert_ratings
+from gamerraterapi.models import Game, Player, RatingLogCheckpoint
+from gamerraterapi.routers import SAFE_METHODS, token_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'DIRECTORY': None,
+    # Size at which a new segment is started
+    'SEGMENT_BYTES': 16 * 1024 * 1024,
+    # Records applied per transaction
+    'BATCH_SIZE': 1000,
+    # Seconds the worker waits between drains
+    'DRAIN_INTERVAL': 0.2,
+    # fsync every append before answering; off trades durability for latency
+    'FSYNC': True,
+    # Drain from a thread in each web process
+    'WORKER': True,
+    # Seconds a player's pending write is remembered for read-your-writes
+    'PENDING_TTL': 300,
+    # Alias of the cache pending writes are tracked in
+    'CACHE': 'default',
+}
+
+# The log position before the first record
+START = (1, 0)
+
+
+def get_setting(name):
+    return getattr(settings, 'GAMERRATER_RATING_LOG', {}).get(name, DEFAULTS[name])
+
+
+def enabled():
+    return get_setting('ENABLED')
+
+
+def directory():
+    path = Path(get_setting('DIRECTORY') or Path(settings.BASE_DIR, 'rating-log'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def segment_path(number):
+    return directory() / f'{number:012d}.log'
+
+
+def segments():
+    """Numbers of the log's segments, oldest first"""
+    return sorted(int(path.stem) for path in directory().glob('*.log') if path.stem.isdigit())
+
+
+def encode(record):
+    payload = json.dumps(record, separators=(',', ':')).encode()
+    return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+
+def decode(line):
+    """The record on a complete line, or None if it's corrupt"""
+    checksum, _, payload = line[:-1].partition(b' ')
+    try:
+        if len(checksum) != 8 or int(checksum, 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+_lock = threading.Lock()
+
+
+@contextmanager
+def locked():
+    """Hold the log's lock, between threads and between processes"""
+    with _lock, open(directory() / 'lock', 'a', encoding='utf-8') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def sync_directory():
+    """fsync the log directory, so a new segment's name survives a crash"""
+    descriptor = os.open(directory(), os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def repair(log):
+    """Cut a torn record off the end of an open segment
+
+    Returns:
+        int -- The segment's size afterwards
+    """
+    size = log.seek(0, os.SEEK_END)
+    if size == 0:
+        return 0
+    log.seek(size - 1)
+    if log.read(1) == b'\n':
+        return size
+
+    # Records are small; the last complete one ends within the last 64KB
+    start = max(0, size - 65536)
+    log.seek(start)
+    tail = log.read()
+    size = start + tail.rfind(b'\n') + 1
+    log.truncate(size)
+    logger.warning('Cut a torn record off the rating log at %s', log.name)
+    return size
+
+
+def append(game_id, player_id, rating):
+    """Durably append a rating to the log
+
+    Returns:
+        tuple -- The log position just past the record, (segment, offset)
+    """
+    line = encode({'game': game_id, 'player': player_id, 'rating': rating, 'at': time.time()})
+    with locked():
+        existing = segments()
+        number = existing[-1] if existing else START[0]
+        log = open(segment_path(number), 'a+b')  # pylint: disable=consider-using-with
+        try:
+            size = repair(log)
+            if size >= get_setting('SEGMENT_BYTES'):
+                log.close()
+                number += 1
+                log = open(segment_path(number), 'a+b')  # pylint: disable=consider-using-with
+                size = 0
+            log.write(line)
+            log.flush()
+            if get_setting('FSYNC'):
+                os.fsync(log.fileno())
+                if size == 0:
+                    sync_directory()
+        finally:
+            log.close()
+
+    if get_setting('WORKER'):
+        start_worker()
+    return number, size + len(line)
+
+
+def read_records(position, limit):
+    """Up to `limit` complete records after a log position
+
+    Returns:
+        tuple -- (list of records, the position just past the last line read)
+    """
+    records = []
+    end = position
+    for number in segments():
+        if number < position[0]:
+            continue
+        offset = position[1] if number == position[0] else 0
+        with open(segment_path(number), 'rb') as log:
+            log.seek(offset)
+            for line in log:
+                if not line.endswith(b'\n'):
+                    # Being written, or torn by a crash: nothing after it is complete
+                    return records, end
+                offset += len(line)
+                end = (number, offset)
+                record = decode(line)
+                if record is None:
+                    logger.warning('Skipped a corrupt rating log record ending at %s', end)
+                    continue
+                records.append(record)
+                if len(records) >= limit:
+                    return records, end
+
+    return records, end
+
+
+def checkpoint():
+    """The position the log has been applied up to"""
+    row = RatingLogCheckpoint.objects.filter(pk=1).values_list('segment', 'offset').first()
+    return row or START
+
+
+def drain(limit=None):
+    """Apply the next batch of records in one transaction
+
+    Returns:
+        int -- The number of records applied (0 when the log is drained)
+    """
+    with transaction.atomic():
+        row, _ = RatingLogCheckpoint.objects.select_for_update().get_or_create(pk=1)
+        records, end = read_records((row.segment, row.offset), limit or get_setting('BATCH_SIZE'))
+        if end == (row.segment, row.offset):
+            return 0
+
+        latest = {(record['game'], record['player']): record['rating'] for record in records}
+        games = set(Game.objects.filter(
+            pk__in={game_id for game_id, _ in latest}).values_list('id', flat=True))
+        players = set(Player.objects.filter(
+            pk__in={player_id for _, player_id in latest}).values_list('id', flat=True))
+        # Games and players deleted since their ratings were logged
+        kept = {
+            key: rating for key, rating in latest.items()
+            if key[0] in games and key[1] in players
+        }
+        if len(kept) < len(latest):
+            logger.warning('Dropped %d logged ratings of deleted games or players',
+                           len(latest) - len(kept))
+        if kept:
+            upsert_ratings(kept)
+
+        row.segment, row.offset = end
+        row.save(update_fields=['segment', 'offset', 'updated_at'])
+        transaction.on_commit(lambda: cache.bump('ratings', 'games'))
+        transaction.on_commit(lambda: remove_segments_before(end[0]))
+
+    return len(records)
+
+
+def drain_all():
+    """Apply every complete record in the log
+
+    Returns:
+        int -- The number of records applied
+    """
+    applied = 0
+    while True:
+        count = drain()
+        if not count:
+            return applied
+        applied += count
+
+
+def apply_logged():
+    """Apply every logged rating before a write that bypasses the log"""
+    if enabled():
+        drain_all()
+
+
+def remove_segments_before(number):
+    """Delete the segments the checkpoint has moved past"""
+    for older in segments():
+        if older < number:
+            segment_path(older).unlink(missing_ok=True)
+
+
+def pending_key(key):
+    digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+    return f'gamerrater:pending-ratings:{digest}'
+
+
+def mark_pending(key, position):
+    """Remember the position a token's latest rating was logged at"""
+    caches[get_setting('CACHE')].set(pending_key(key), position, get_setting('PENDING_TTL'))
+
+
+def barrier(position):
+    """Drain the log until `position` has been applied
+
+    Returns:
+        bool -- Whether it has been (False if the log ran out first)
+    """
+    while checkpoint() < tuple(position):
+        if not drain():
+            return False
+    return True
+
+
+def wait_for_pending(request):
+    """Apply the requesting player's logged ratings before their read"""
+    if not enabled() or request.method not in SAFE_METHODS:
+        return
+
+    key = token_key(request)
+    if key is None:
+        return
+
+    store = caches[get_setting('CACHE')]
+    position = store.get(pending_key(key))
+    if position is not None and barrier(position):
+        store.delete(pending_key(key))
+
+
+@sync_and_async_middleware
+def pending_writes_middleware(get_response):
+    """Let players read their own logged ratings (see wait_for_pending)"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            await sync_to_async(wait_for_pending)(request)
+            return await get_response(request)
+
+        return markcoroutinefunction(middleware)
+
+    def middleware(request):
+        wait_for_pending(request)
+        return get_response(request)
+
+    return middleware
+
+
+def run_worker(stop=None):
+    """Drain the log every DRAIN_INTERVAL seconds until `stop` is set"""
+    while stop is None or not stop.is_set():
+        try:
+            drain_all()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Draining the rating log failed')
+        finally:
+            # The worker outlives requests; don't let its connection go stale
+            close_old_connections()
+        time.sleep(get_setting('DRAIN_INTERVAL'))
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_worker():
+    """Start this process's draining thread, if it isn't running"""
+    global _worker  # pylint: disable=global-statement
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=run_worker, name='rating-log', daemon=True)
+            _worker.start()